@@ -0,0 +1,233 @@
+# batch_score.py
+# Offline, parallel scoring of large CSV or NPY files, with the same feature engineering as the API.
+#
+#   python batch_score.py houses.csv predictions.csv
+#   python batch_score.py houses.npy predictions.npy --workers 8 --chunk-rows 500000
+#
+# The input is memory-mapped and split into chunks of about `chunk_rows` rows: byte ranges ending on a line
+# break for a CSV file, row ranges for an NPY file. A process pool scores the chunks, one per worker at a time,
+# so every core is busy. Each worker loads the model ONCE, when it starts (inference._init_worker, as in the
+# API's process executor), maps the input itself and reads only its own chunk, so no rows are pickled between
+# processes. Features are built by features.py in the column order of 'feature_names.pkl'. Results are
+# written in input order as soon as the chunks before them are done. At most 2 chunks per worker are in
+# flight, so memory stays bounded whatever the size of the input.
+#
+#   CSV input : rows of MedInc,HouseAge,AveRooms,Population, or in the order of an optional header line
+#               (the same rules as the API's streaming endpoint).
+#   NPY input : an (n_rows, 4) float array with columns in the order of INPUT_NAMES, or a structured array
+#               with fields named after them.
+#   Output    : a CSV file with a 'predicted_median_house_value' header (values formatted in the workers),
+#               or, for a '.npy' output path, a float64 array of n_rows predictions.
+import argparse
+import contextlib
+import io
+import mmap
+import os
+import struct
+import sys
+import time
+import warnings
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import inference
+from features import FEATURE_NAMES_PATH, INPUT_NAMES, engineer_features, load_feature_names
+from model_store import ModelStore
+from streaming import CSVParser, StreamFormatError, format_header, format_predictions
+
+
+CHUNK_ROWS = 250_000                # Rows per chunk: large enough to amortise the per-chunk overhead.
+NPY_HEADER_BYTES = 128              # Fixed size of the header of a '.npy' output, rewritten once n_rows is known.
+
+_feature_names = None               # The model's column order in a worker process, set by _init_batch_worker.
+
+
+def _init_batch_worker(model_path, compiled, feature_names):
+    """Loads the model (once) in a freshly started worker process; one thread each, as there is a worker per core."""
+    global _feature_names
+    inference._init_worker(model_path, 1, compiled)
+    _feature_names = feature_names
+
+
+def input_format(path):
+    """'npy' for a .npy file, 'csv' otherwise."""
+    return 'npy' if path.lower().endswith('.npy') else 'csv'
+
+
+def plan_chunks(path, chunk_rows=CHUNK_ROWS):
+    """
+    Splits the input file into chunks without reading it all.
+
+    Returns (layout, chunks): `layout` describes the columns (for a CSV file, the position of each input
+    column and the number of fields; for an NPY file, the field names or None), and `chunks` is a list of
+    (start, stop) byte ranges (CSV) or row ranges (NPY).
+    """
+    if input_format(path) == 'npy':
+        array = np.load(path, mmap_mode='r')
+        if array.dtype.names is not None:
+            missing = [name for name in INPUT_NAMES if name not in array.dtype.names]
+            if missing or array.ndim != 1:
+                raise StreamFormatError(f"'{path}': expected a 1-D structured array with the fields "
+                                        f"{list(INPUT_NAMES)}")
+            layout = list(INPUT_NAMES)
+        elif array.ndim != 2 or array.shape[1] != len(INPUT_NAMES):
+            raise StreamFormatError(f"'{path}': expected an array of shape (n_rows, {len(INPUT_NAMES)}), "
+                                    f"got {array.shape}")
+        else:
+            layout = None
+        return layout, [(start, min(start + chunk_rows, len(array))) for start in range(0, len(array), chunk_rows)]
+
+    size = os.path.getsize(path)
+    if size == 0:
+        return (list(range(len(INPUT_NAMES))), len(INPUT_NAMES)), []
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        end = mm.find(b'\n')
+        first_line = mm[:end if end >= 0 else size].strip()
+        header = CSVParser()                # Detects a header line and checks the number of fields.
+        has_header = len(header([first_line])[INPUT_NAMES[0]]) == 0
+        start = (end + 1 if end >= 0 else size) if has_header else 0
+        # Chunk size in bytes, from the average length of the first lines.
+        sample = mm[start:start + 1_000_000]
+        line_bytes = len(sample) / max(sample.count(b'\n'), 1)
+        chunk_bytes = max(int(chunk_rows * line_bytes), 1)
+        chunks = []
+        while start < size:
+            stop = mm.find(b'\n', min(start + chunk_bytes, size - 1))
+            stop = size if stop < 0 else stop + 1
+            chunks.append((start, stop))
+            start = stop
+    return (header.order, header.n_fields), chunks
+
+
+def _read_csv_chunk(path, start, stop, layout):
+    """The input columns of the CSV rows in bytes [start, stop) of the file."""
+    order, n_fields = layout
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        data = mm[start:stop]
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')         # "input contained no data", for a chunk of blank lines.
+            values = np.loadtxt(io.BytesIO(data), delimiter=',', ndmin=2)
+    except ValueError as e:
+        raise StreamFormatError(f"bytes {start}-{stop}: {e}") from None
+    if values.size == 0:
+        return {name: np.empty(0) for name in INPUT_NAMES}
+    if values.shape[1] != n_fields:
+        raise StreamFormatError(f"bytes {start}-{stop}: expected {n_fields} fields, got {values.shape[1]}")
+    return {name: values[:, j] for name, j in zip(INPUT_NAMES, order)}
+
+
+def _read_npy_chunk(path, start, stop, layout):
+    """The input columns of rows [start, stop) of the NPY file."""
+    block = np.load(path, mmap_mode='r')[start:stop]
+    if layout is not None:
+        return {name: block[name] for name in layout}
+    return {name: block[:, j] for j, name in enumerate(INPUT_NAMES)}
+
+
+def _score_chunk(path, start, stop, layout, npy_output):
+    """
+    Scores one chunk in a worker process. Returns (n_rows, predictions, predict seconds); the predictions are
+    an array for a '.npy' output and the formatted CSV lines (bytes) otherwise.
+    """
+    read = _read_npy_chunk if input_format(path) == 'npy' else _read_csv_chunk
+    X = engineer_features(read(path, start, stop, layout), _feature_names)
+    predictions, seconds = inference._worker_predict(X)
+    if npy_output:
+        return len(predictions), predictions.astype('<f8'), seconds
+    return len(predictions), format_predictions(predictions, 'csv').encode(), seconds
+
+
+def _npy_header(n_rows):
+    """The header of a 1-D float64 '.npy' file of n_rows values, padded to NPY_HEADER_BYTES (format 1.0)."""
+    header = repr({'descr': '<f8', 'fortran_order': False, 'shape': (n_rows,)})
+    header = header.ljust(NPY_HEADER_BYTES - 10 - 1) + '\n'      # 10 bytes of magic string, version and length.
+    return b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header.encode('latin1')
+
+
+def score_file(path, output, model_path='random_forest_model.pkl', feature_names=None, workers=None,
+               chunk_rows=CHUNK_ROWS, compiled=None):
+    """
+    Scores every row of the CSV or NPY file `path` and writes the predictions, in order, to `output`.
+
+    `compiled`, if given, is the folder of a compiled FlatForest that the workers memory-map instead of each
+    unpickling `model_path`. Returns a dict of statistics (rows, seconds, rows per second, ...).
+    """
+    feature_names = load_feature_names() if feature_names is None else feature_names
+    workers = workers or os.cpu_count() or 1
+    start_time = time.perf_counter()
+    layout, chunks = plan_chunks(path, chunk_rows)
+    npy_output = output.lower().endswith('.npy')
+    n_rows = 0
+    predict_seconds = 0.0
+    try:
+        with open(output, 'wb') as out, \
+                ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker,
+                                    initargs=(model_path, compiled, feature_names)) as executor:
+            out.write(_npy_header(0) if npy_output else format_header('csv').encode())
+
+            def write(future):
+                nonlocal n_rows, predict_seconds
+                rows, predictions, seconds = future.result()
+                out.write(predictions.tobytes() if npy_output else predictions)
+                n_rows += rows
+                predict_seconds += seconds
+
+            pending = deque()
+            try:
+                for start, stop in chunks:
+                    pending.append(executor.submit(_score_chunk, path, start, stop, layout, npy_output))
+                    if len(pending) >= 2 * workers:     # Bounded read-ahead: write the oldest chunk first.
+                        write(pending.popleft())
+                while pending:
+                    write(pending.popleft())
+            except BaseException:
+                executor.shutdown(wait=True, cancel_futures=True)
+                raise
+            if npy_output:
+                out.seek(0)
+                out.write(_npy_header(n_rows))
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):    # Not created if open() itself failed.
+            os.remove(output)               # No partial output that could pass for a complete one.
+        raise
+    seconds = time.perf_counter() - start_time
+    return {
+        "rows": n_rows,
+        "chunks": len(chunks),
+        "workers": workers,
+        "seconds": seconds,
+        "rows_per_second": n_rows / seconds if seconds else 0.0,
+        "predict_seconds": predict_seconds,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Score a large CSV or NPY file of houses in parallel, with the "
+                                                 "API's feature engineering; predictions are written in order.")
+    parser.add_argument('input', help="CSV file (optional header) or .npy array of MedInc, HouseAge, AveRooms, "
+                                      "Population.")
+    parser.add_argument('output', help="Predictions: a CSV file, or a .npy array if the name ends in .npy.")
+    parser.add_argument('--model', default=os.environ.get('MODEL_PATH', 'random_forest_model.pkl'),
+                        help="Pickled model (default: $MODEL_PATH or random_forest_model.pkl).")
+    parser.add_argument('--feature-names', default=FEATURE_NAMES_PATH, help="Pickled column order of the model.")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: one per CPU).")
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS, help="Approximate rows per chunk.")
+    parser.add_argument('--flat', action='store_true',
+                        help="Score with the compiled flat forest, memory-mapped and shared by the workers, "
+                             "instead of one unpickled scikit-learn model per worker.")
+    args = parser.parse_args()
+
+    compiled = None
+    if args.flat:
+        compiled = ModelStore(args.model).load()[2]     # Compiles the model on first use.
+    try:
+        stats = score_file(args.input, args.output, args.model, load_feature_names(args.feature_names),
+                           args.workers, args.chunk_rows, compiled)
+    except (OSError, ValueError) as e:
+        sys.exit(f"Error: {e}")
+    print(f"Scored {stats['rows']} rows in {stats['chunks']} chunks with {stats['workers']} workers in "
+          f"{stats['seconds']:.1f} s ({stats['rows_per_second']:,.0f} rows/s; "
+          f"{stats['predict_seconds']:.1f} s in model.predict across workers).")
@@ -0,0 +1,142 @@
+# batching.py
+# Micro-batching for the prediction endpoint.
+#
+# A scikit-learn Random Forest costs roughly the same to call on 1 row as on 50: most of the time of
+# model.predict goes into input validation and dispatching the 100 trees, not into the rows themselves.
+# MicroBatcher therefore holds each incoming request for a short window (or until enough requests have
+# arrived), scores all of them with ONE call of the scoring function, and hands every caller its own
+# result back. It runs entirely on the asyncio event loop, so no locks are needed. The scoring function may be
+# a coroutine function (e.g. one that awaits an executor), in which case each batch is scored in its own task.
+import asyncio
+import inspect
+import time
+
+import numpy as np
+
+
+# Upper edges (seconds) of the queue-wait histogram buckets: 0.1 ms to 1 s.
+WAIT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent requests into batches scored by a single call.
+
+    `score` receives a list of items (one per request) and must return (or, if it is a coroutine
+    function, resolve to) a sequence of results of the same length, in the same order.
+    """
+
+    def __init__(self, score, max_batch_size=64, max_wait_ms=2.0):
+        self.score = score
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._pending = []          # (item, future, enqueue time) of requests not yet scored.
+        self._timer = None          # Handle of the scheduled flush of a partial batch.
+        self._tasks = set()         # Batches being scored by a coroutine (referenced until they finish).
+        # --- Metrics ---
+        self.requests = 0
+        self.batches = 0
+        self.batch_sizes = np.zeros(max_batch_size + 1, dtype=np.int64)  # batch_sizes[n]: batches of n requests.
+        self.wait_counts = np.zeros(len(WAIT_BUCKETS) + 1, dtype=np.int64)
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    @property
+    def queue_depth(self):
+        """Requests waiting for their batch to be scored."""
+        return len(self._pending)
+
+    async def submit(self, item):
+        """Queues one item and waits for its result."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future, time.perf_counter()))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()                                   # Full batch: score it right away.
+        elif self._timer is None:
+            # First request of a new batch: it waits at most max_wait for others to join.
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        """Takes the pending requests off the queue and scores them as one batch."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending[:self.max_batch_size], self._pending[self.max_batch_size:]
+        if self._pending:           # More than one batch arrived in the same tick: keep draining.
+            self._timer = asyncio.get_running_loop().call_soon(self._flush)
+        if not batch:
+            return
+        self._record(batch)
+        try:
+            results = self.score([item for item, _, _ in batch])
+        except Exception as exc:
+            self._resolve(batch, exc=exc)
+            return
+        if inspect.isawaitable(results):
+            task = asyncio.ensure_future(self._await_results(batch, results))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        else:
+            self._resolve(batch, results)
+
+    async def _await_results(self, batch, results):
+        """Waits for the results of a batch scored by a coroutine."""
+        try:
+            results = await results
+        except Exception as exc:
+            self._resolve(batch, exc=exc)
+            return
+        self._resolve(batch, results)
+
+    @staticmethod
+    def _resolve(batch, results=None, exc=None):
+        """Hands every request of the batch its result (or the exception raised while scoring)."""
+        for i, (_, future, _) in enumerate(batch):
+            if future.done():                               # The client may have gone away meanwhile.
+                continue
+            if exc is not None:
+                future.set_exception(exc)
+            else:
+                future.set_result(results[i])
+
+    def _record(self, batch):
+        """Updates the batch-size and queue-wait metrics for a batch about to be scored."""
+        now = time.perf_counter()
+        waits = np.array([now - queued for _, _, queued in batch])
+        self.requests += len(batch)
+        self.batches += 1
+        self.batch_sizes[len(batch)] += 1
+        self.wait_counts += np.bincount(np.searchsorted(WAIT_BUCKETS, waits), minlength=len(self.wait_counts))
+        self.wait_total += waits.sum()
+        self.wait_max = max(self.wait_max, waits.max())
+
+    def stats(self):
+        """
+        Batch-size and queue-wait metrics as plain JSON-serialisable values. The wait quantiles are bucket
+        upper bounds, not exact values.
+        """
+        sizes = np.arange(len(self.batch_sizes))
+        cumulative = np.cumsum(self.wait_counts) / max(self.requests, 1)
+        upper = list(WAIT_BUCKETS) + [float('inf')]
+
+        def wait_quantile(q):
+            # Upper edge of the bucket holding the quantile, but never above the longest wait actually seen.
+            return float(min(upper[min(int(np.searchsorted(cumulative, q)), len(upper) - 1)], self.wait_max))
+
+        return {
+            "requests": int(self.requests),
+            "batches": int(self.batches),
+            "mean_batch_size": float(self.requests / self.batches) if self.batches else 0.0,
+            "max_batch_size_seen": int(sizes[self.batch_sizes > 0].max()) if self.batches else 0,
+            "batch_size_counts": {int(n): int(c) for n, c in zip(sizes, self.batch_sizes) if c},
+            "queue_wait_mean_ms": 1000.0 * self.wait_total / self.requests if self.requests else 0.0,
+            "queue_wait_max_ms": 1000.0 * self.wait_max,
+            # Upper bounds, in ms, of the waits of 50% / 99% of the requests: the upper edge of their histogram
+            # bucket (see WAIT_BUCKETS), capped at queue_wait_max_ms.
+            "queue_wait_p50_ms": 1000.0 * wait_quantile(0.5),
+            "queue_wait_p99_ms": 1000.0 * wait_quantile(0.99),
+            "pending": len(self._pending),
+            "settings": {"max_batch_size": self.max_batch_size, "max_wait_ms": 1000.0 * self.max_wait},
+        }
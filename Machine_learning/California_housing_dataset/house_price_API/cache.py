@@ -0,0 +1,78 @@
+# cache.py
+# In-process cache of predictions, in front of the model.
+#
+# Dashboards refresh the same block groups over and over, and each repeat would otherwise pay for feature
+# engineering, a trip through the batcher and the executor, and a full forest traversal. PredictionCache keeps
+# the most recent predictions in an OrderedDict used as an LRU list: a hit moves the entry to the end, and
+# when the cache is full the entry at the front (least recently used) is evicted. Entries also expire `ttl`
+# seconds after they were stored. Keys include the model version, so a new model never serves old answers.
+# Like the batcher, the cache is only used from the asyncio event loop, so no locks are needed.
+import time
+from collections import OrderedDict
+
+
+class PredictionCache:
+    """
+    Bounded LRU cache of predictions with a time-to-live.
+
+    `decimals`, if not None, is the number of decimals the inputs are rounded to (quantised) before being
+    used as a key, so that nearly identical queries share one entry.
+    """
+
+    def __init__(self, max_size=10000, ttl=300.0, decimals=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.decimals = decimals
+        self._entries = OrderedDict()   # key -> (prediction, expiry time), least recently used first.
+        # --- Metrics ---
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+
+    def quantise(self, values):
+        """The input values as they are used in the key (rounded to `decimals`, if set)."""
+        if self.decimals is None:
+            return tuple(values)
+        return tuple(round(v, self.decimals) for v in values)
+
+    def get(self, key):
+        """Returns the cached prediction for `key`, or None on a miss (absent or expired)."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            del self._entries[key]
+            self.expirations += 1
+        self.misses += 1
+        return None
+
+    def put(self, key, prediction):
+        """Stores a prediction, evicting the least recently used entry if the cache is full."""
+        self._entries[key] = (prediction, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """Drops every entry (the counters are kept)."""
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """Hit/miss counters and settings as plain JSON-serialisable values."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "expirations": self.expirations,
+            "evictions": self.evictions,
+            "size": len(self._entries),
+            "settings": {"max_size": self.max_size, "ttl_s": self.ttl, "decimals": self.decimals},
+        }
@@ -0,0 +1,65 @@
+# features.py
+# The feature engineering of PartThree_RandomForest.ipynb, shared by every prediction path of the API.
+#
+# The model was trained on 7 columns: the 4 original features plus 3 engineered ones. Their order is the
+# one saved next to the model in 'feature_names.pkl', so the input matrix is built by looking each name up
+# in FEATURE_BUILDERS below rather than by a hand-written list that has to be kept in sync. Every builder
+# works on whole NumPy columns, so one row and a hundred thousand rows cost the same number of operations.
+import joblib # To load the saved feature names
+import numpy as np
+
+
+FEATURE_NAMES_PATH = 'feature_names.pkl'
+
+# The ORIGINAL 4 features a client sends.
+INPUT_NAMES = ('MedInc', 'HouseAge', 'AveRooms', 'Population')
+
+# Order used during model training, used if 'feature_names.pkl' cannot be read.
+DEFAULT_FEATURE_NAMES = ['MedInc', 'HouseAge', 'AveRooms', 'Population',
+                         'MedInc_Sq', 'Log_Population', 'MedInc_x_AveRooms']
+
+# How each model column is computed from the input columns (a dict of equal-length float arrays).
+FEATURE_BUILDERS = {
+    'MedInc': lambda c: c['MedInc'],
+    'HouseAge': lambda c: c['HouseAge'],
+    'AveRooms': lambda c: c['AveRooms'],
+    'Population': lambda c: c['Population'],
+    'MedInc_Sq': lambda c: c['MedInc']**2,                      # Polynomial term
+    'Log_Population': lambda c: np.log1p(c['Population']),      # np.log1p for consistency with training
+    'MedInc_x_AveRooms': lambda c: c['MedInc'] * c['AveRooms'], # Interaction term
+}
+
+
+def load_feature_names(path=FEATURE_NAMES_PATH):
+    """
+    Reads the model's column order from 'feature_names.pkl' (falling back to the training order).
+    Raises ValueError if the file names a feature this module does not know how to build.
+    """
+    try:
+        names = list(joblib.load(path))
+    except Exception as e:
+        print(f"Could not read feature names from '{path}' ({e}); using the training order {DEFAULT_FEATURE_NAMES}.")
+        return list(DEFAULT_FEATURE_NAMES)
+    unknown = [name for name in names if name not in FEATURE_BUILDERS]
+    if unknown:
+        raise ValueError(f"No feature engineering defined for {unknown} (listed in '{path}').")
+    return names
+
+
+FEATURE_NAMES = load_feature_names()
+
+
+def engineer_features(columns, feature_names=None):
+    """
+    Builds the model's input matrix, one row per house, from the 4 original feature columns.
+
+    `columns` maps each name in INPUT_NAMES to a sequence (or array) of values, all of the same length.
+    Returns a float64 array of shape (n_rows, n_features), columns in the order of `feature_names`
+    (FEATURE_NAMES, read from 'feature_names.pkl', by default).
+    """
+    feature_names = FEATURE_NAMES if feature_names is None else feature_names
+    columns = {name: np.asarray(columns[name], dtype=float) for name in INPUT_NAMES}
+    X = np.empty((len(columns['MedInc']), len(feature_names)))
+    for j, name in enumerate(feature_names):
+        X[:, j] = FEATURE_BUILDERS[name](columns)
+    return X
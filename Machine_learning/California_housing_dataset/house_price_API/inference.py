@@ -0,0 +1,215 @@
+# inference.py
+# Runs model.predict off the event loop.
+#
+# Traversing a 100-tree forest is CPU-bound and synchronous: called directly from an `async def` endpoint it
+# blocks the event loop, and every other in-flight request (even `/`) waits until it finishes. InferencePool
+# hands each prediction to an executor instead and awaits the result, so the loop keeps accepting, validating
+# and answering requests meanwhile.
+#
+#   'thread'  : a ThreadPoolExecutor sharing the model already loaded by the API. scikit-learn (and NumPy, for
+#               the flat forest) releases the GIL while traversing the trees, so the threads overlap on several CPUs.
+#   'process' : a ProcessPoolExecutor whose workers each load the model ONCE, when they start, and keep it
+#               for their whole life. Only the input matrix and the predictions cross process boundaries.
+#               A compiled model is memory-mapped, so all the workers share one copy of it.
+#
+# The number of predictions handed to the executor and not yet finished is capped at `max_pending`. Beyond
+# that predict() raises PoolFull straight away (the API answers 503) rather than letting the queue, and with
+# it the latency of every queued request, grow without bound.
+import asyncio
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import joblib
+
+from forest_engine import FlatForest, HybridForest
+from model_store import load_unchanged
+
+
+KINDS = ('thread', 'process')
+
+_worker_model = None                # The model of a worker process, loaded once by _init_worker.
+
+
+def _init_worker(model_path, n_jobs, compiled, flat_max_rows=None):
+    """
+    Loads the model in a freshly started worker process: the compiled FlatForest in folder `compiled`
+    (memory-mapped; in a HybridForest if `flat_max_rows` is not None), or else the pickled model at `model_path`.
+    """
+    global _worker_model
+    if compiled is not None:
+        _worker_model = FlatForest.load(compiled, mmap=True)
+        if flat_max_rows is not None:
+            version = os.path.basename(os.path.normpath(compiled))     # ModelStore names the folder after it.
+            _worker_model = HybridForest(_worker_model, functools.partial(load_unchanged, model_path, version, n_jobs),
+                                         flat_max_rows)
+        return
+    _worker_model = joblib.load(model_path)
+    if n_jobs is not None and hasattr(_worker_model, 'n_jobs'):
+        _worker_model.n_jobs = n_jobs   # The workers already use the CPUs in parallel: no threads within each.
+
+
+def _timed_predict(model, X):
+    """Scores an input matrix; returns the predictions and the time model.predict took, in seconds."""
+    start = time.perf_counter()
+    predictions = model.predict(X)
+    return predictions, time.perf_counter() - start
+
+
+def _worker_predict(X):
+    """Scores an input matrix with the model of the current worker process (see _timed_predict)."""
+    return _timed_predict(_worker_model, X)
+
+
+def _worker_ready():
+    """Returns whether the current worker process holds a model (used to start the workers up front)."""
+    return _worker_model is not None
+
+
+class PoolFull(Exception):
+    """Raised when the inference queue already holds `max_pending` predictions."""
+
+
+class InferencePool:
+    """
+    Executor for model predictions, with a bounded number of pending jobs.
+
+    kind='thread' needs the loaded `model`; kind='process' needs `model_path`, loaded once per worker,
+    or the folder of the `compiled` model, memory-mapped by every worker (which, with `flat_max_rows`, scores
+    larger batches with the scikit-learn model; see forest_engine.HybridForest). `version` identifies the
+    model; predict_versioned() returns it with the predictions, so callers know which model made them.
+    """
+
+    def __init__(self, kind='thread', workers=None, max_pending=32, model=None, model_path=None, compiled=None,
+                 flat_max_rows=None, version=None):
+        if kind not in KINDS:
+            raise ValueError(f"Unknown executor '{kind}' (expected one of {KINDS}).")
+        self.kind = kind
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self.model_path = model_path
+        self.compiled = compiled
+        self.flat_max_rows = flat_max_rows
+        # (model, version, executor), replaced in ONE assignment by swap(): a job always runs on the model, or
+        # the workers, of the version it is reported with.
+        self._current = (model, version, None)
+        self._lock = threading.Lock()   # Serialises start() and swap(), which may run in different threads.
+        self.pending = 0            # Jobs submitted and not finished (queued or running).
+        # --- Metrics ---
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.max_pending_seen = 0
+
+    @property
+    def model(self):
+        return self._current[0]
+
+    @property
+    def version(self):
+        return self._current[1]
+
+    @property
+    def _executor(self):
+        return self._current[2]
+
+    def start(self):
+        """
+        Creates the executor; for processes, also starts every worker so it loads the model now (this blocks
+        until they are ready, so call it from a thread once the event loop is running).
+        """
+        with self._lock:
+            if self._executor is None:
+                model, version, _ = self._current
+                self._current = (model, version, self._new_executor())
+
+    def _new_executor(self):
+        if self.kind == 'thread':
+            return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='inference')
+        executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                       initargs=(self.model_path, 1 if self.workers > 1 else None, self.compiled,
+                                                 self.flat_max_rows))
+        # Warm-up: one job per worker, so the model is loaded before the first request, not during it.
+        for future in [executor.submit(_worker_ready) for _ in range(self.workers)]:
+            future.result()
+        return executor
+
+    def swap(self, model, model_path=None, compiled=None, version=None):
+        """
+        Serves a new model. Threads simply use it for the next job. For processes, a new set of workers
+        loading the new model is started (this blocks until they are ready, so call it from a thread); it
+        then replaces the old set, whose jobs in flight still finish with the old model. If the pool had not
+        been started yet (no model was loaded at startup), it is started now, with the new model.
+        """
+        with self._lock:
+            self.model_path, self.compiled = model_path, compiled
+            old = self._executor
+            if old is None or self.kind == 'process':
+                self._current = (model, version, self._new_executor())
+            else:
+                self._current = (model, version, old)
+        if old is not None and self.kind == 'process':
+            old.shutdown(wait=False)
+
+    def shutdown(self):
+        """Waits for the running jobs and stops the executor."""
+        with self._lock:
+            model, version, executor = self._current
+            self._current = (model, version, None)
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    @property
+    def full(self):
+        return self.pending >= self.max_pending
+
+    async def predict(self, X, timer=None):
+        """
+        Scores the input matrix X in the executor and returns the predictions.
+        Raises PoolFull if `max_pending` predictions are already queued or running.
+        `timer`, if given, is called with the time model.predict itself took, in seconds (excluding the queue).
+        """
+        predictions, _ = await self.predict_versioned(X, timer)
+        return predictions
+
+    async def predict_versioned(self, X, timer=None):
+        """As predict(), but returns (predictions, version of the model that made them)."""
+        if self.full:
+            self.rejected += 1
+            raise PoolFull(f"Inference queue is full ({self.max_pending} pending predictions).")
+        if self._executor is None:
+            await asyncio.to_thread(self.start)     # Starting worker processes must not block the event loop.
+        model, version, executor = self._current
+        # pending is only touched from the event loop, so no lock is needed.
+        self.pending += 1
+        self.max_pending_seen = max(self.max_pending_seen, self.pending)
+        try:
+            if self.kind == 'thread':
+                job = executor.submit(_timed_predict, model, X)
+            else:
+                job = executor.submit(_worker_predict, X)
+            predictions, seconds = await asyncio.wrap_future(job)
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.pending -= 1
+        self.completed += 1
+        if timer is not None:
+            timer(seconds)
+        return predictions, version
+
+    def stats(self):
+        """Queue and throughput counters as plain JSON-serialisable values."""
+        return {
+            "executor": self.kind,
+            "workers": self.workers,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "max_pending_seen": self.max_pending_seen,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,334 @@
+# load_test.py
+# Load-testing and latency benchmark harness for the prediction API.
+#
+#   python load_test.py                                         # In-process, default scenarios and concurrencies
+#   python load_test.py --target uvicorn --concurrency 1,16,64  # Against a local uvicorn started for the run
+#   python load_test.py --output baseline.json                  # Save the results as a baseline...
+#   python load_test.py --baseline baseline.json                # ...and fail (exit 1) if a later run regressed
+#
+# Targets:
+#   'asgi'    : drives main.app in this process through httpx's ASGITransport (lifespan included). No sockets
+#               or HTTP parsing, so it isolates the cost of the application itself. The CPU time is this
+#               process's, so it includes the client's share.
+#   'uvicorn' : starts `uvicorn main:app` on a free local port (with `--workers`) and sends real HTTP
+#               requests. The CPU time is that of the server processes only, read from /proc (Linux).
+#   --url     : an already running server; no CPU time is measured.
+#
+# Scenarios (payload mixes):
+#   'single'   : /predict_house_value/ with a different house every time (cache misses, micro-batching).
+#   'repeated' : /predict_house_value/ with one of REPEATED_HOUSES houses (after warm-up, cache hits).
+#   'bulk'     : /predict_house_value/bulk/ with `--bulk-rows` houses per request.
+#   'mixed'    : MIXED_WEIGHTS of the above, drawn at random.
+#
+# Each (scenario, concurrency) pair is one measurement: `concurrency` clients send requests back to back
+# (closed loop) until `--requests` (or `--bulk-requests` for bulk) have been answered, after a warm-up. It
+# reports p50/p95/p99 latency, requests per second, CPU milliseconds per request and non-200 answers (e.g.
+# 503 from backpressure). Request bodies are serialised before the clock starts, so the client adds as
+# little as possible to the measurement.
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter
+
+import httpx
+import numpy as np
+
+
+SCENARIOS = ('single', 'repeated', 'bulk', 'mixed')
+MIXED_WEIGHTS = {'single': 0.8, 'repeated': 0.15, 'bulk': 0.05}
+REPEATED_HOUSES = 16                # Distinct houses of the 'repeated' scenario.
+LATENCY_METRICS = ('p50_ms', 'p95_ms', 'p99_ms')
+SERVER_START_TIMEOUT_S = 120.0      # Loading (or compiling) the model can take a while.
+
+JSON_HEADERS = {'content-type': 'application/json'}
+
+
+def random_houses(rng, n):
+    """n plausible houses, as columns (MedInc, HouseAge, AveRooms, Population) of Python floats."""
+    return {
+        'MedInc': rng.uniform(0.5, 15.0, n).round(4).tolist(),
+        'HouseAge': rng.integers(1, 53, n).astype(float).tolist(),
+        'AveRooms': rng.uniform(1.0, 10.0, n).round(3).tolist(),
+        'Population': rng.integers(3, 30000, n).astype(float).tolist(),
+    }
+
+
+def _single_bodies(columns):
+    return [json.dumps(dict(zip(columns, values))).encode() for values in zip(*columns.values())]
+
+
+def build_requests(scenario, n, bulk_rows, seed):
+    """
+    The `n` requests of a scenario, as (path, body bytes, rows) tuples. Every call with a new `seed` gives new
+    houses for the 'single' and 'bulk' scenarios, so a run does not hit cache entries left by the previous one.
+    """
+    rng = np.random.default_rng(seed)
+    if scenario == 'single':
+        return [('/predict_house_value/', body, 1) for body in _single_bodies(random_houses(rng, n))]
+    if scenario == 'repeated':
+        houses = _single_bodies(random_houses(np.random.default_rng(0), REPEATED_HOUSES))
+        return [('/predict_house_value/', houses[i], 1) for i in rng.integers(0, REPEATED_HOUSES, n)]
+    if scenario == 'bulk':
+        return [('/predict_house_value/bulk/', json.dumps(random_houses(rng, bulk_rows)).encode(), bulk_rows)
+                for _ in range(n)]
+    if scenario == 'mixed':
+        kinds = rng.choice(list(MIXED_WEIGHTS), size=n, p=list(MIXED_WEIGHTS.values()))
+        pools = {kind: iter(build_requests(kind, int((kinds == kind).sum()), bulk_rows, seed))
+                 for kind in MIXED_WEIGHTS}
+        return [next(pools[kind]) for kind in kinds]
+    raise ValueError(f"Unknown scenario '{scenario}' (expected one of {SCENARIOS}).")
+
+
+def percentile_summary(latencies):
+    """Latency percentiles, mean and maximum in milliseconds."""
+    if not latencies:
+        return {name: None for name in LATENCY_METRICS + ('mean_ms', 'max_ms')}
+    ms = 1000 * np.asarray(latencies)
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {'p50_ms': p50, 'p95_ms': p95, 'p99_ms': p99, 'mean_ms': ms.mean(), 'max_ms': ms.max()}
+
+
+async def run_level(client, requests, concurrency, cpu_seconds):
+    """
+    Sends `requests` with `concurrency` clients in a closed loop. `cpu_seconds()` returns the CPU time used so
+    far by the system under test (or None). Returns the measurement as a dict.
+    """
+    latencies = []
+    statuses = Counter()
+    pending = iter(requests)        # Shared by the clients: each takes the next request when it is free.
+
+    async def client_loop():
+        for path, body, _ in pending:
+            start = time.perf_counter()
+            try:
+                response = await client.post(path, content=body, headers=JSON_HEADERS)
+                await response.aread()
+                statuses[str(response.status_code)] += 1
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+                continue
+            if response.status_code == 200:
+                latencies.append(time.perf_counter() - start)
+
+    cpu_start = cpu_seconds()
+    start = time.perf_counter()
+    await asyncio.gather(*[client_loop() for _ in range(concurrency)])
+    seconds = time.perf_counter() - start
+    cpu_end = cpu_seconds()
+    answered = sum(statuses.values())
+    return {
+        'requests': answered,
+        'ok': len(latencies),
+        'non_200': answered - len(latencies),
+        'statuses': dict(statuses),
+        'seconds': seconds,
+        'rps': len(latencies) / seconds if seconds else 0.0,
+        'rows_per_request': sum(rows for _, _, rows in requests) / len(requests),
+        **percentile_summary(latencies),
+        'cpu_ms_per_request': (None if cpu_start is None or cpu_end is None or not answered
+                               else 1000 * (cpu_end - cpu_start) / answered),
+    }
+
+
+async def run_all(client, target, scenarios, concurrencies, args, cpu_seconds):
+    """Runs every (scenario, concurrency) pair against one client and returns the list of results."""
+    results = []
+    seed = args.seed
+    for scenario in scenarios:
+        for concurrency in concurrencies:
+            n = args.bulk_requests if scenario == 'bulk' else args.requests
+            seed += 1
+            warmup = build_requests(scenario, args.warmup, args.bulk_rows, seed + 10_000)
+            await run_level(client, warmup, concurrency, lambda: None)
+            result = await run_level(client, build_requests(scenario, n, args.bulk_rows, seed), concurrency,
+                                     cpu_seconds)
+            result = {'target': target, 'scenario': scenario, 'concurrency': concurrency, **result}
+            print(format_result(result), flush=True)
+            results.append(result)
+    return results
+
+
+# --- Targets ---
+async def run_in_process(scenarios, concurrencies, args):
+    """Benchmarks main.app in this process through httpx's ASGITransport, running its lifespan."""
+    import main     # Loads the model: only when this target is used.
+
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://load-test', timeout=args.timeout) as client:
+            return await run_all(client, 'asgi', scenarios, concurrencies, args, time.process_time)
+
+
+def _proc_cpu_seconds(pid):
+    """
+    User + system CPU time of a process and all its descendants (uvicorn workers, inference worker processes),
+    from /proc; None if unavailable.
+    """
+    processes = {}                  # pid -> (parent pid, CPU clock ticks)
+    try:
+        names = os.listdir('/proc')
+    except OSError:
+        return None
+    for name in names:
+        if not name.isdigit():
+            continue
+        try:
+            with open(f'/proc/{name}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()     # After the command name, which may hold spaces.
+        except OSError:
+            continue                                            # Exited meanwhile.
+        processes[int(name)] = (int(fields[1]), int(fields[11]) + int(fields[12]))   # ppid; utime + stime.
+    if pid not in processes:
+        return None
+    tree = {pid}
+    while True:
+        children = {child for child, (parent, _) in processes.items() if parent in tree} - tree
+        if not children:
+            break
+        tree |= children
+    return sum(processes[member][1] for member in tree) / os.sysconf('SC_CLK_TCK')
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(workers):
+    """Starts `uvicorn main:app` on a free port; returns (process, base url) once /ready answers 200."""
+    port = _free_port()
+    command = [sys.executable, '-m', 'uvicorn', 'main:app', '--host', '127.0.0.1', '--port', str(port),
+               '--log-level', 'warning', '--app-dir', os.path.dirname(os.path.abspath(__file__))]
+    if workers > 1:
+        command += ['--workers', str(workers)]
+    server = subprocess.Popen(command)
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + SERVER_START_TIMEOUT_S
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with code {server.returncode} before it was ready.")
+        try:
+            if httpx.get(f'{url}/ready', timeout=1.0).status_code == 200:
+                return server, url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError(f"uvicorn was not ready within {SERVER_START_TIMEOUT_S} s.")
+
+
+async def run_over_http(url, scenarios, concurrencies, args, cpu_seconds):
+    limits = httpx.Limits(max_connections=max(concurrencies), max_keepalive_connections=max(concurrencies))
+    async with httpx.AsyncClient(base_url=url, timeout=args.timeout, limits=limits) as client:
+        return await run_all(client, 'uvicorn' if args.url is None else 'url', scenarios, concurrencies, args,
+                             cpu_seconds)
+
+
+# --- Reporting and baselines ---
+def _ms(value):
+    return '-' if value is None else f"{value:.2f}"
+
+
+def format_result(result):
+    return (f"{result['target']:8} {result['scenario']:9} c={result['concurrency']:<4d} "
+            f"{result['requests']:6d} req {result['rps']:9.1f} req/s   p50 {_ms(result['p50_ms']):>8} "
+            f"p95 {_ms(result['p95_ms']):>8} p99 {_ms(result['p99_ms']):>8} ms   "
+            f"cpu/req {_ms(result['cpu_ms_per_request']):>7} ms   non-200 {result['non_200']}")
+
+
+def _key(result):
+    return f"{result['target']}/{result['scenario']}/c{result['concurrency']}"
+
+
+def compare(results, baseline, threshold, min_delta_ms=1.0):
+    """
+    Compares results with a baseline run; returns a list of regressions, one message each. A regression is a
+    latency percentile or the CPU per request more than `threshold` (a fraction) AND more than `min_delta_ms`
+    above the baseline, or the requests per second more than `threshold` below it. The absolute margin keeps
+    the jitter of sub-millisecond timings from failing a run. Measurements missing from the baseline are skipped.
+    """
+    previous = {_key(result): result for result in baseline['results']}
+    regressions = []
+    for result in results:
+        before = previous.get(_key(result))
+        if before is None:
+            continue
+        for metric in LATENCY_METRICS + ('cpu_ms_per_request',):
+            now, then = result[metric], before[metric]
+            if now is not None and then and now > then * (1 + threshold) and now - then > min_delta_ms:
+                regressions.append(f"{_key(result)}: {metric} {then:.2f} -> {now:.2f} (+{100 * (now / then - 1):.0f}%)")
+        if before['rps'] and result['rps'] < before['rps'] * (1 - threshold):
+            regressions.append(f"{_key(result)}: rps {before['rps']:.1f} -> {result['rps']:.1f} "
+                               f"(-{100 * (1 - result['rps'] / before['rps']):.0f}%)")
+    return regressions
+
+
+def _int_list(text):
+    return [int(value) for value in text.split(',')]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measure the API's throughput, tail latency and CPU per request, "
+                                                 "and compare them with a saved baseline.")
+    parser.add_argument('--target', choices=('asgi', 'uvicorn'), default='asgi',
+                        help="In-process ASGI client (default) or a local uvicorn started for the run.")
+    parser.add_argument('--url', help="Benchmark an already running server at this URL instead.")
+    parser.add_argument('--workers', type=int, default=1, help="uvicorn worker processes (--target uvicorn).")
+    parser.add_argument('--scenarios', default='single,repeated,bulk',
+                        help=f"Comma-separated payload mixes among {', '.join(SCENARIOS)}.")
+    parser.add_argument('--concurrency', type=_int_list, default=[1, 8, 32], help="Comma-separated client counts.")
+    parser.add_argument('--requests', type=int, default=500, help="Requests per measurement.")
+    parser.add_argument('--bulk-requests', type=int, default=50, help="Requests per 'bulk' measurement.")
+    parser.add_argument('--bulk-rows', type=int, default=1000, help="Houses per bulk request.")
+    parser.add_argument('--warmup', type=int, default=20, help="Unmeasured requests before each measurement.")
+    parser.add_argument('--timeout', type=float, default=60.0, help="Per-request timeout, in seconds.")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="Save the results as JSON (usable as a --baseline later).")
+    parser.add_argument('--baseline', help="JSON results of an earlier run to compare with.")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="Tolerated relative regression against the baseline (default 0.2, i.e. 20%%).")
+    parser.add_argument('--min-delta-ms', type=float, default=1.0,
+                        help="Latency or CPU increases smaller than this (ms) are never regressions.")
+    args = parser.parse_args()
+
+    scenarios = args.scenarios.split(',')
+    unknown = [scenario for scenario in scenarios if scenario not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios {unknown} (expected among {list(SCENARIOS)})")
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    if args.url is not None:
+        results = asyncio.run(run_over_http(args.url, scenarios, args.concurrency, args, lambda: None))
+    elif args.target == 'uvicorn':
+        server, url = start_server(args.workers)
+        try:
+            results = asyncio.run(run_over_http(url, scenarios, args.concurrency, args,
+                                                lambda: _proc_cpu_seconds(server.pid)))
+        finally:
+            server.terminate()
+            server.wait()
+    else:
+        results = asyncio.run(run_in_process(scenarios, args.concurrency, args))
+
+    if args.output:
+        settings = {name: value for name, value in vars(args).items() if name not in ('output', 'baseline')}
+        with open(args.output, 'w') as f:
+            json.dump({'created': time.time(), 'cpu_count': os.cpu_count(), 'settings': settings,
+                       'results': results}, f, indent=2)
+        print(f"Results saved to '{args.output}'.")
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold, args.min_delta_ms)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {100 * args.threshold:.0f}% against '{args.baseline}':")
+            print('\n'.join(f"  {message}" for message in regressions))
+            sys.exit(1)
+        print(f"No regression beyond {100 * args.threshold:.0f}% against '{args.baseline}'.")
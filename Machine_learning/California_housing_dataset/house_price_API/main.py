@@ -1,25 +1,83 @@
 # main.py
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel, Field
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, Response
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from pydantic import BaseModel, Field, ValidationError, model_validator
+from typing import List
 import numpy as np
-import joblib # To load your saved model
-import os # For checking if the model file exists
+import asyncio
+import json
+import os # For the MODEL_PATH and ADMIN_TOKEN environment variables and the number of CPUs
+import secrets # Constant-time comparison of the admin token
+import time
+
+from batching import MicroBatcher # Coalesces concurrent requests into one model.predict call
+from features import engineer_features # Column-wise feature engineering, in the order of 'feature_names.pkl'
+from inference import InferencePool, PoolFull # Runs model.predict in a thread or process executor
+from cache import PredictionCache # LRU + TTL cache of predictions, keyed on the inputs and the model version
+from streaming import (DuplexStreamingResponse, StreamFormatError, FORMATS, stream_format, # NDJSON/CSV streaming
+                       iter_column_blocks, format_header, format_predictions, format_error)
+from starlette.requests import ClientDisconnect
+from metrics import Registry, HttpMetrics, MetricsMiddleware, CONTENT_TYPE # Prometheus /metrics
+from model_store import ModelStore, COMPILED_FOLDER # Memory-mapped, compiled model shared by all workers; hot reload
+from contextlib import asynccontextmanager
 
 # --- 1. Load the Trained Random Forest Model ---
 # Ensure the 'random_forest_model.pkl' is in the same directory as this script,
-# or provide the full path to it.
-MODEL_PATH = 'random_forest_model.pkl'
+# or provide the full path to it (or set the MODEL_PATH environment variable).
+MODEL_PATH = os.environ.get('MODEL_PATH', 'random_forest_model.pkl')
+
+# Compiled engine: the forest is copied into flat NumPy node arrays (forest_engine.py), which score a single
+# row ~20x faster than scikit-learn's predict and take about a third of its memory. The conversion is checked
+# against scikit-learn (identical predictions), and done only ONCE per model file: the arrays are saved under
+# COMPILED_FOLDER and memory-mapped, so all uvicorn workers share one copy and start in milliseconds
+# (model_store.py). Set FLAT_FOREST = False to unpickle and predict with scikit-learn itself in every worker.
+FLAT_FOREST = True
+# The flat arrays only pay off for small batches: batches of more than FLAT_MAX_ROWS rows (bulk requests, stream
+# blocks) are scored by scikit-learn, which is several times faster there. Its model is unpickled on the first
+# such batch only, so a service that only answers single predictions never holds it. None: flat arrays only.
+FLAT_MAX_ROWS = 256
+
+# Holds the model being served and its version (the model file's size and modification time). The version is
+# part of the cache keys, so cached predictions of another model are never served.
+store = ModelStore(MODEL_PATH, flat=FLAT_FOREST, compiled_folder=COMPILED_FOLDER, flat_max_rows=FLAT_MAX_ROWS)
 
 try:
-    # Attempt to load the model. joblib is recommended for scikit-learn models.
-    model = joblib.load(MODEL_PATH)
-    print(f"Random Forest model loaded successfully from {MODEL_PATH}")
+    # Attempt to load the model. If it fails, the API still starts: /ready and the prediction endpoints
+    # answer 503 until a model is loaded with POST /admin/reload.
+    store.reload()
+    print(f"Random Forest model loaded successfully from {MODEL_PATH} in {store.load_seconds:.2f} s "
+          f"({type(store.model).__name__}, version {store.version}).")
 except FileNotFoundError:
     print(f"Error: Model file '{MODEL_PATH}' not found. Please ensure it's in the correct directory.")
-    model = None # Set model to None if loading fails, to prevent further errors
 except Exception as e:
     print(f"An error occurred while loading the model: {e}")
-    model = None
+
+
+# --- 1b. Inference Executor ---
+# model.predict is CPU-bound and synchronous, so it never runs on the event loop: it is handed to an executor
+# and awaited, and the API keeps serving other requests meanwhile.
+#   'thread'  : threads sharing the model loaded above (scikit-learn and NumPy release the GIL while predicting).
+#   'process' : worker processes, each loading the model once at startup (memory-mapped if FLAT_FOREST).
+# When INFERENCE_MAX_PENDING predictions are already queued or running, new requests get a 503 right away
+# (backpressure) instead of waiting in an ever-growing queue.
+INFERENCE_EXECUTOR = 'thread'
+INFERENCE_WORKERS = os.cpu_count() or 1
+INFERENCE_MAX_PENDING = 4 * INFERENCE_WORKERS
+
+pool = InferencePool(INFERENCE_EXECUTOR, workers=INFERENCE_WORKERS, max_pending=INFERENCE_MAX_PENDING,
+                     model=store.model, model_path=MODEL_PATH, compiled=store.compiled, flat_max_rows=FLAT_MAX_ROWS,
+                     version=store.version)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Start the executor (and, for processes, load the model in every worker) before serving requests.
+    if store.ready:
+        pool.start()
+    yield
+    pool.shutdown()
 
 
 # --- 2. Initialize FastAPI App ---
@@ -27,7 +85,8 @@ except Exception as e:
 app = FastAPI(
     title="California Housing Price Predictor API",
     description="Predicts median house values based on features using a pre-trained Random Forest Regressor.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # --- 3. Define Input Data Model (Pydantic) ---
@@ -55,52 +114,379 @@ class HouseFeatures(BaseModel):
     }
 
 
-# --- 4. Define Prediction Endpoint ---
+# Bulk input: the same 4 features, one array per feature (columnar), one entry per house.
+# Used for re-scoring many block groups in a single HTTP round trip.
+BULK_MAX_ROWS = 100_000
+
+
+class HouseFeaturesBulk(BaseModel):
+    MedInc: List[float] = Field(..., description="Median incomes (in $10,000s), one per block group.")
+    HouseAge: List[float] = Field(..., description="Median house ages, one per block group.")
+    AveRooms: List[float] = Field(..., description="Average numbers of rooms per household, one per block group.")
+    Population: List[float] = Field(..., description="Block group populations.")
+
+    @model_validator(mode="after")
+    def check_lengths(self):
+        # All columns must describe the same houses, in the same order.
+        lengths = {name: len(getattr(self, name)) for name in type(self).model_fields}
+        if len(set(lengths.values())) != 1:
+            raise ValueError(f"All feature arrays must have the same length, got {lengths}.")
+        if lengths["MedInc"] > BULK_MAX_ROWS:
+            raise ValueError(f"At most {BULK_MAX_ROWS} rows per request, got {lengths['MedInc']}.")
+        return self
+
+    model_config = {
+        "json_schema_extra": {
+            "examples": [
+                {
+                    "MedInc": [3.8723, 8.3252],
+                    "HouseAge": [32.0, 41.0],
+                    "AveRooms": [5.0, 6.98],
+                    "Population": [1200.0, 322.0]
+                }
+            ]
+        }
+    }
+
+
+# --- 4. Feature Engineering and Batched Scoring ---
+# The engineered features (polynomial, log, interaction terms) are built in features.py, column by column,
+# in the order saved in 'feature_names.pkl'.
+# Micro-batching: concurrent requests are held for up to BATCH_MAX_WAIT_MS (or until BATCH_MAX_SIZE of them
+# have arrived) and scored together in ONE model.predict call, which costs about the same as scoring a single
+# row. Set BATCH_MAX_SIZE = 1 to score every request on its own, as before.
+BATCH_MAX_SIZE = 64
+BATCH_MAX_WAIT_MS = 2.0
+
+# Prediction cache: repeated queries (e.g. dashboards refreshing the same block groups) are answered from
+# memory without touching the model. At most CACHE_MAX_SIZE predictions are kept (least recently used are
+# evicted first), each for CACHE_TTL_S seconds. With CACHE_DECIMALS set, inputs are rounded to that many
+# decimals both for the cache key and for the prediction itself. Set CACHE_MAX_SIZE = 0 to disable caching.
+CACHE_MAX_SIZE = 10000
+CACHE_TTL_S = 300.0
+CACHE_DECIMALS = None
+
+# Streaming: /predict_house_value/stream/ reads NDJSON or CSV rows and scores them in blocks of STREAM_BLOCK_ROWS,
+# sending each block's predictions before reading the next, so memory stays constant however many rows are sent.
+# When the inference queue is full, the stream waits (up to STREAM_MAX_WAIT_S per block) instead of failing.
+# The client must read the response while uploading: if it takes none of it for STREAM_SEND_TIMEOUT_S (typically
+# a client that only reads after sending everything), the stream is aborted rather than left hanging.
+STREAM_BLOCK_ROWS = 4096
+STREAM_MAX_WAIT_S = 30.0
+STREAM_SEND_TIMEOUT_S = 30.0
+
+
+async def score_houses(houses):
+    """
+    Predicts the median house value of a list of HouseFeatures in a single model.predict call,
+    run in the inference executor. Returns one (prediction, model version) pair per house: the version is
+    that of the model which actually scored the batch, even if a reload swapped models meanwhile.
+    """
+    with STAGES["predict_house_value", "features"].time():
+        X = engineer_features({name: [getattr(h, name) for h in houses] for name in HouseFeatures.model_fields})
+    predictions, version = await pool.predict_versioned(X, timer=STAGES["predict_house_value", "predict"].observe)
+    return [(prediction, version) for prediction in predictions]
+
+
+def not_ready():
+    """The 503 returned while no model is loaded (e.g. the model file is missing); see /ready."""
+    return HTTPException(status_code=503, detail="Prediction model is not loaded.", headers={"Retry-After": "5"})
+
+
+def busy():
+    """The 503 returned when the inference queue is full; clients should retry shortly."""
+    return HTTPException(status_code=503, detail="Server is busy: too many pending predictions. Retry shortly.",
+                         headers={"Retry-After": "1"})
+
+
+batcher = MicroBatcher(score_houses, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS)
+cache = PredictionCache(max_size=CACHE_MAX_SIZE, ttl=CACHE_TTL_S, decimals=CACHE_DECIMALS)
+
+
+# --- 4b. Metrics (Prometheus) ---
+# Exposed on /metrics in the Prometheus text format:
+#   * every HTTP request: count by endpoint and status, latency histogram, and requests in flight;
+#   * the latency of each stage of the prediction endpoints: parsing + pydantic validation of the body,
+#     feature engineering, model.predict (per batch for the single-house endpoint), and serialisation of the
+#     response;
+#   * queue depths (requests waiting for their micro-batch, predictions pending in the executor) and the cache
+#     and executor counters, read only when /metrics is scraped.
+# Recording a latency is a bisect and two additions, well under a microsecond per stage.
+registry = Registry()
+http_metrics = HttpMetrics(registry, "house_api")
+app.add_middleware(MetricsMiddleware, http_metrics=http_metrics)
+
+stage_seconds = registry.histogram("house_api_stage_seconds", "Latency of each stage of the prediction endpoints.",
+                                   labelnames=("endpoint", "stage"))
+STAGES = {(endpoint, stage): stage_seconds.labels(endpoint, stage)
+          for endpoint in ("predict_house_value", "predict_house_value_bulk", "predict_house_value_stream")
+          for stage in ("validation", "features", "predict", "serialisation")}
+
+registry.gauge("house_api_batch_queue_depth", "Requests waiting for their micro-batch.", lambda: batcher.queue_depth)
+registry.gauge("house_api_inference_pending", "Predictions queued or running in the inference executor.",
+               lambda: pool.pending)
+registry.gauge("house_api_inference_max_pending", "Pending predictions beyond which requests get a 503.",
+               lambda: pool.max_pending)
+registry.gauge("house_api_inference_rejected_total", "Predictions rejected because the inference queue was full.",
+               lambda: pool.rejected, type="counter")
+registry.gauge("house_api_cache_hits_total", "Prediction cache hits.", lambda: cache.hits, type="counter")
+registry.gauge("house_api_cache_misses_total", "Prediction cache misses.", lambda: cache.misses, type="counter")
+registry.gauge("house_api_cache_size", "Predictions held in the cache.", lambda: len(cache))
+registry.gauge("house_api_model_loaded", "1 if a model is loaded and served, else 0.", lambda: int(store.ready))
+
+
+def parse_body(body, schema, timer):
+    """
+    Validates a JSON request body against a pydantic model in one pass (pydantic parses the JSON itself),
+    timing it. Invalid bodies give FastAPI's usual 422 response.
+    """
+    start = time.perf_counter()
+    try:
+        return schema.model_validate_json(body)
+    except ValidationError as e:
+        raise RequestValidationError([{**error, "loc": ("body", *error["loc"])}
+                                      for error in e.errors(include_url=False)], body=body)
+    finally:
+        timer.observe(time.perf_counter() - start)
+
+
+def json_response(content, timer):
+    """Serialises the response body to JSON, timing it."""
+    start = time.perf_counter()
+    body = json.dumps(content).encode()
+    timer.observe(time.perf_counter() - start)
+    return Response(content=body, media_type="application/json")
+
+
+def request_body(schema):
+    """OpenAPI description of a JSON body validated by parse_body (the endpoints read the raw request)."""
+    return {"requestBody": {"required": True,
+                            "content": {"application/json": {"schema": schema.model_json_schema()}}}}
+
+
+# --- 5. Define Prediction Endpoint ---
 # This is the main endpoint where users will send data to get a prediction.
-@app.post("/predict_house_value/", response_model=dict, summary="Predict median house value")
-async def predict_house_value(features: HouseFeatures):
+@app.post("/predict_house_value/", summary="Predict median house value", openapi_extra=request_body(HouseFeatures))
+async def predict_house_value(request: Request):
     """
     Accepts a set of house features and returns the predicted median house value.
     The API performs internal feature engineering (polynomial, log, interaction terms)
     before making the prediction using the loaded Random Forest model.
+    Concurrent requests are scored together in one batch (see BATCH_MAX_SIZE), and
+    repeated queries are answered from the prediction cache (see CACHE_MAX_SIZE).
+    Returns 503 when no model is loaded or the inference queue is full.
     """
-    if model is None:
-        raise HTTPException(status_code=500, detail="Prediction model is not loaded.")
-
-    # Extract original features from the incoming request data.
-    medinc = features.MedInc
-    houseage = features.HouseAge
-    averooms = features.AveRooms
-    population = features.Population
-
-    # --- Re-perform the exact same Feature Engineering steps as during model training ---
-    # This is ABSOLUTELY CRUCIAL. The model expects input in the exact same format
-    # it was trained on (same features, same order, same transformations).
-    medinc_sq = medinc**2
-    log_population = np.log1p(population) # Use np.log1p for consistency with training
-    medinc_x_averooms = medinc * averooms
-
-    # Create a NumPy array for the model prediction.
-    # The order of features in this array MUST match the order used during model training.
-    # The order was: ['MedInc', 'HouseAge', 'AveRooms', 'Population', 'MedInc_Sq', 'Log_Population', 'MedInc_x_AveRooms']
-    input_data_array = np.array([
-        medinc,
-        houseage,
-        averooms,
-        population,
-        medinc_sq,            # Engineered feature
-        log_population,       # Engineered feature
-        medinc_x_averooms     # Engineered feature
-    ]).reshape(1, -1) # .reshape(1, -1) reshapes the array to be 1 sample with N features.
-
-    # Make the prediction using the loaded Random Forest model.
-    prediction = model.predict(input_data_array)[0] # [0] extracts the scalar prediction value.
+    features = parse_body(await request.body(), HouseFeatures, STAGES["predict_house_value", "validation"])
+    if not store.ready:
+        raise not_ready()
+
+    # Cache lookup first: a hit needs neither the model nor room in the inference queue.
+    values = cache.quantise([getattr(features, name) for name in HouseFeatures.model_fields])
+    key = (store.version, values)
+    prediction = cache.get(key)
+    if prediction is not None:
+        return json_response({"predicted_median_house_value": prediction},
+                             STAGES["predict_house_value", "serialisation"])
+    if cache.decimals is not None:
+        # Predict on the quantised inputs, so that the cached value does not depend on which query came first.
+        features = HouseFeatures.model_construct(**dict(zip(HouseFeatures.model_fields, values)))
+
+    if pool.full:
+        raise busy()
+
+    # Queue the request; it is scored together with the other requests of its batch.
+    try:
+        prediction, version = await batcher.submit(features)
+    except PoolFull:
+        raise busy()
+    prediction = float(prediction)
+    if version == store.version:
+        # A prediction of a model replaced meanwhile (by /admin/reload) could never be hit: keep it out.
+        cache.put((version, values), prediction)
 
     # Return the prediction as a JSON response.
-    return {"predicted_median_house_value": float(prediction)}
+    return json_response({"predicted_median_house_value": prediction}, STAGES["predict_house_value", "serialisation"])
+
+
+@app.post("/predict_house_value/bulk/", summary="Predict median house values in bulk",
+          openapi_extra=request_body(HouseFeaturesBulk))
+async def predict_house_value_bulk(request: Request):
+    """
+    Accepts columnar arrays of house features (one array per feature, up to BULK_MAX_ROWS rows) and
+    returns the predicted median house values in the same order.
+    The whole input matrix is engineered with column-wise NumPy operations and scored in ONE model.predict call.
+    Returns 503 when no model is loaded or the inference queue is full.
+    """
+    features = parse_body(await request.body(), HouseFeaturesBulk, STAGES["predict_house_value_bulk", "validation"])
+    if not store.ready:
+        raise not_ready()
+    if not features.MedInc:
+        return {"predicted_median_house_value": []}
+
+    with STAGES["predict_house_value_bulk", "features"].time():
+        X = engineer_features(features.model_dump())
+    try:
+        predictions = await pool.predict(X, timer=STAGES["predict_house_value_bulk", "predict"].observe)
+    except PoolFull:
+        raise busy()
+
+    return json_response({"predicted_median_house_value": predictions.tolist()},
+                         STAGES["predict_house_value_bulk", "serialisation"])
+
+
+@app.get("/stats/batching", summary="Micro-batching statistics")
+async def batching_stats():
+    """
+    Returns the batch-size distribution and the time requests spent waiting for their batch.
+    """
+    return batcher.stats()
+
+
+@app.get("/stats/cache", summary="Prediction cache statistics")
+async def cache_stats():
+    """
+    Returns the cache hit/miss counters, hit rate, evictions, expirations and current size.
+    """
+    return cache.stats()
+
+
+@app.get("/stats/inference", summary="Inference executor statistics")
+async def inference_stats():
+    """
+    Returns the executor settings, the number of pending predictions and the completed/rejected counts.
+    """
+    return pool.stats()
+
+
+async def predict_when_free(X, timer):
+    """pool.predict, waiting for room in the inference queue (at most STREAM_MAX_WAIT_S) instead of failing."""
+    deadline = time.perf_counter() + STREAM_MAX_WAIT_S
+    while True:
+        try:
+            return await pool.predict(X, timer=timer)
+        except PoolFull:
+            if time.perf_counter() > deadline:
+                raise
+            await asyncio.sleep(0.01)
+
+
+async def score_stream(first, blocks, fmt):
+    """
+    Body of the streaming response: scores the blocks of input columns one at a time and yields their
+    predictions. A malformed row, or an inference queue that stays full, ends the stream with an error line.
+    """
+    stages = {stage: STAGES["predict_house_value_stream", stage] for stage in ("features", "predict", "serialisation")}
+    yield format_header(fmt)
+    columns = first
+    try:
+        while columns is not None:
+            with stages["features"].time():
+                X = engineer_features(columns)
+            predictions = await predict_when_free(X, stages["predict"].observe)
+            with stages["serialisation"].time():
+                chunk = format_predictions(predictions, fmt)
+            yield chunk                                 # Waits until the client has taken it (backpressure).
+            with STAGES["predict_house_value_stream", "validation"].time():
+                columns = await anext(blocks, None)     # Only now is the next block of the body read.
+    except StreamFormatError as e:
+        yield format_error(str(e), fmt)
+    except PoolFull:
+        yield format_error("server is busy: inference queue full for too long", fmt)
+    except ClientDisconnect:
+        return                                          # Nobody is left to send predictions to.
+
+
+STREAM_BODY = {"requestBody": {"required": True, "content": {
+    media_type: {"schema": {"type": "string"}} for media_types in FORMATS.values() for media_type in media_types}}}
+
+
+@app.post("/predict_house_value/stream/", summary="Stream NDJSON or CSV rows and receive predictions as they are made",
+          openapi_extra=STREAM_BODY)
+async def predict_house_value_stream(request: Request):
+    """
+    Scores an NDJSON (Content-Type: application/x-ndjson) or CSV (Content-Type: text/csv) body of
+    MedInc, HouseAge, AveRooms, Population rows, and streams the predictions back in the same format,
+    in order, one line per row, block by block (see STREAM_BLOCK_ROWS).
+    Neither the input nor the output is ever held in memory as a whole. An error in the first block
+    gives a 422; an error after streaming has started ends the response with an error line.
+    Returns 415 for other content types and 503 when no model is loaded.
+    """
+    fmt = stream_format(request.headers.get("content-type"))
+    if fmt is None:
+        raise HTTPException(status_code=415,
+                            detail=f"Send NDJSON ({FORMATS['ndjson'][0]}) or CSV ({FORMATS['csv'][0]}).")
+    if not store.ready:
+        raise not_ready()
+
+    blocks = iter_column_blocks(request.stream(), fmt, STREAM_BLOCK_ROWS, HouseFeatures)
+    # The first block is parsed before answering, so that a wrong payload still gets a proper 422.
+    try:
+        with STAGES["predict_house_value_stream", "validation"].time():
+            first = await anext(blocks, None)
+    except StreamFormatError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return DuplexStreamingResponse(score_stream(first, blocks, fmt), send_timeout=STREAM_SEND_TIMEOUT_S,
+                                   media_type=FORMATS[fmt][0])
+
+
+@app.get("/metrics", summary="Prometheus metrics")
+async def metrics():
+    """
+    Returns request counts, per-stage latency histograms, queue depths and in-flight requests
+    in the Prometheus text exposition format.
+    """
+    return Response(content=registry.render(), media_type=CONTENT_TYPE)
+
+
+# --- Readiness and Hot Reload ---
+@app.get("/ready", summary="Readiness probe")
+async def ready():
+    """
+    Returns 200 with the model details once a model is loaded and predictions can be served, 503 otherwise.
+    """
+    return JSONResponse(status_code=200 if store.ready else 503, content=store.status())
+
+
+reload_lock = asyncio.Lock()
+
+# Admin endpoints require the token set in the ADMIN_TOKEN environment variable, sent as
+# "Authorization: Bearer <token>". Without ADMIN_TOKEN they are disabled altogether.
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+admin_bearer = HTTPBearer(auto_error=False)
+
+
+def require_admin(credentials: HTTPAuthorizationCredentials = Depends(admin_bearer)):
+    """Dependency of the admin endpoints: 403 if they are disabled, 401 without the right token."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403,
+                            detail="Admin endpoints are disabled: set the ADMIN_TOKEN environment variable.")
+    if credentials is None or not secrets.compare_digest(credentials.credentials.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Missing or invalid admin token.",
+                            headers={"WWW-Authenticate": "Bearer"})
+
+
+@app.post("/admin/reload", summary="Hot-reload the model file", dependencies=[Depends(require_admin)])
+async def reload_model():
+    """
+    Loads the current MODEL_PATH file (replace it first, e.g. by an atomic `mv`) and swaps it in.
+    Loading runs in a background thread, and requests in flight finish with the model they started
+    with: there is no downtime. On failure the current model keeps serving.
+    Requires "Authorization: Bearer <ADMIN_TOKEN>"; disabled (403) when ADMIN_TOKEN is not set.
+    """
+    def hand_to_pool(model, version, compiled):
+        pool.swap(model, MODEL_PATH, compiled, version)
+
+    async with reload_lock:                         # One reload at a time.
+        previous = store.version
+        try:
+            await asyncio.to_thread(store.reload, hand_to_pool)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Reload failed, still serving version {previous}: {e}")
+        cache.clear()                               # Entries of the old version can no longer be hit.
+    return {"previous_version": previous, **store.status()}
 
 
-# --- 5. Root Endpoint (Optional) ---
+# --- 6. Root Endpoint (Optional) ---
 # A simple endpoint to confirm the API is running.
 @app.get("/", summary="Root endpoint")
 async def root():
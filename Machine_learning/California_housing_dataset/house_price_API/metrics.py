@@ -0,0 +1,208 @@
+# metrics.py
+# Request counts, latency histograms and gauges in the Prometheus text exposition format.
+#
+# A minimal, dependency-free subset of what prometheus_client offers, sized for the hot path of this API:
+# recording a latency is one bisect over the bucket edges and two additions on plain Python lists, and
+# gauges are callbacks read only when /metrics is scraped. Like the batcher and the cache, everything is
+# updated from the asyncio event loop, so no locks are taken.
+import time
+from bisect import bisect_left
+
+
+# Upper edges (seconds) of the latency buckets: 50 µs to 10 s.
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                   0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _labels(names, values, extra=''):
+    """Formats a label set, e.g. {stage="predict",le="0.01"}."""
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    return '+Inf' if value == float('inf') else repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _HistogramChild:
+    """The buckets of one label set of a Histogram."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # Per bucket (not cumulative); the last one is +Inf.
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def time(self):
+        """Context manager observing the duration of its block."""
+        return _Timer(self)
+
+
+class _Timer:
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self.start)
+
+
+class Histogram:
+    """A histogram, optionally split by labels; labels(...) returns the child to observe values with."""
+
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._children = {}
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = _HistogramChild(self.buckets)
+        return child
+
+    def samples(self):
+        for values, child in sorted(self._children.items()):
+            cumulative = 0
+            for edge, count in zip(self.buckets + (float('inf'),), child.counts):
+                cumulative += count
+                le = 'le="' + _number(edge) + '"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, values, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, values)} {_number(child.sum)}"
+            yield f"{self.name}_count{_labels(self.labelnames, values)} {cumulative}"
+
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Counter:
+    """A monotonically increasing count, optionally split by labels."""
+
+    type = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = _CounterChild()
+        return child
+
+    def samples(self):
+        for values, child in sorted(self._children.items()):
+            yield f"{self.name}{_labels(self.labelnames, values)} {_number(child.value)}"
+
+
+class Gauge:
+    """
+    A value read from `function()` when the metrics are rendered: nothing is recorded on the hot path.
+    Use type='counter' for a running total kept elsewhere (e.g. the cache hit count).
+    """
+
+    def __init__(self, name, help, function, type='gauge'):
+        self.name = name
+        self.help = help
+        self.function = function
+        self.type = type
+
+    def samples(self):
+        yield f"{self.name} {_number(self.function())}"
+
+
+class Registry:
+    """The metrics exposed on /metrics, rendered in registration order."""
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, *args, **kwargs):
+        return self.register(Histogram(*args, **kwargs))
+
+    def counter(self, *args, **kwargs):
+        return self.register(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs):
+        return self.register(Gauge(*args, **kwargs))
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+class HttpMetrics:
+    """HTTP request count, latency histogram and in-flight gauge, by endpoint; recorded by MetricsMiddleware."""
+
+    def __init__(self, registry, prefix):
+        self.requests = registry.counter(f"{prefix}_http_requests_total", "HTTP requests by endpoint and status.",
+                                         labelnames=("endpoint", "status"))
+        self.latency = registry.histogram(f"{prefix}_http_request_duration_seconds",
+                                          "HTTP request latency by endpoint, from first byte in to last byte out.",
+                                          labelnames=("endpoint",))
+        self.in_flight = 0
+        registry.gauge(f"{prefix}_http_requests_in_flight", "HTTP requests being processed.", lambda: self.in_flight)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording every HTTP request into an HttpMetrics. Endpoints are labelled by the name of the
+    function that handled them ('unmatched' for unknown paths), so arbitrary URLs cannot blow up the number of series.
+    """
+
+    def __init__(self, app, http_metrics):
+        self.app = app
+        self.metrics = http_metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        status = 500                # Reported if the application fails before starting a response.
+
+        async def send_and_record_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        metrics = self.metrics
+        metrics.in_flight += 1
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_and_record_status)
+        finally:
+            metrics.in_flight -= 1
+            endpoint = getattr(scope.get('endpoint'), '__name__', 'unmatched')   # Set by the router.
+            metrics.latency.labels(endpoint).observe(time.perf_counter() - start)
+            metrics.requests.labels(endpoint, str(status)).inc()
@@ -0,0 +1,195 @@
+# model_store.py
+# Loading, sharing and hot-swapping the prediction model.
+#
+# Unpickling the 150 MB forest takes seconds, and every uvicorn worker that does it holds a private copy.
+# Instead, the forest is compiled ONCE per model file into flat .npy node arrays (forest_engine.py) under
+# COMPILED_FOLDER/<version>/, and every worker memory-maps those files read-only: N workers share one resident
+# copy through the page cache, and a worker starts in milliseconds. The version is the model file's size and
+# modification time, so replacing the file leads to a fresh compilation. Workers starting together take a
+# lock file, so only the first compiles; the folder is written under a temporary name and renamed when
+# complete, so no worker ever maps a half-written model. Compiled versions are only deleted after a reload, and
+# the one it replaced is kept for the workers that have not reloaded yet.
+#
+# ModelStore holds the current (model, version) pair as ONE tuple, replaced in a single assignment: a request
+# reads the model it started with, and a reload swaps in the new one without waiting for, or disturbing,
+# requests in flight.
+import functools
+import os
+import shutil
+import time
+
+import joblib
+
+from forest_engine import FLAT_MAX_ROWS, FlatForest, HybridForest, compile_model
+
+try:
+    import fcntl    # File locks (POSIX). Without them, workers starting together may each compile the model.
+except ImportError:
+    fcntl = None
+
+
+COMPILED_FOLDER = 'compiled_model'
+
+
+def file_version(path):
+    """Identifies a model file by its size and modification time."""
+    stat = os.stat(path)
+    return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+
+def load_unchanged(path, version, n_jobs=None):
+    """
+    Unpickles the model file, provided it is still the given version (raises ValueError otherwise): the
+    scikit-learn model a HybridForest loads must be the one its flat arrays were compiled from.
+    """
+    if file_version(path) != version:
+        raise ValueError(f"'{path}' has been replaced since version {version} was loaded.")
+    model = joblib.load(path)
+    if n_jobs is not None and hasattr(model, 'n_jobs'):
+        model.n_jobs = n_jobs
+    return model
+
+
+class ModelStore:
+    """
+    The model currently served, with its version, and how to (re)load it.
+
+    With `flat`, the model is the compiled, memory-mapped FlatForest, wrapped in a HybridForest that scores
+    batches of more than `flat_max_rows` rows with the scikit-learn model (unless `flat_max_rows` is None);
+    otherwise the unpickled scikit-learn model.
+    """
+
+    def __init__(self, path, flat=True, compiled_folder=COMPILED_FOLDER, flat_max_rows=FLAT_MAX_ROWS):
+        self.path = path
+        self.flat = flat
+        self.flat_max_rows = flat_max_rows
+        self.compiled_folder = compiled_folder
+        self._current = (None, None, None)      # (model, version, compiled folder or None)
+        self.loaded_at = None                   # Time (epoch s) the current model was swapped in.
+        self.load_seconds = None                # How long loading it took.
+        self.error = None                       # Message of the last failed load, if any.
+
+    @property
+    def model(self):
+        return self._current[0]
+
+    @property
+    def version(self):
+        return self._current[1]
+
+    @property
+    def compiled(self):
+        return self._current[2]
+
+    @property
+    def ready(self):
+        return self._current[0] is not None
+
+    def compiled_path(self, version):
+        return os.path.join(self.compiled_folder, version)
+
+    def load(self):
+        """
+        Loads the model file at self.path WITHOUT serving it yet.
+
+        Returns (model, version, compiled folder or None). If the model cannot be compiled (e.g. it is not a
+        forest, or the parity check fails), the scikit-learn model itself is returned, with no folder.
+        Raises whatever the loading raised.
+        """
+        version = file_version(self.path)
+        if not self.flat:
+            return joblib.load(self.path), version, None
+        folder = self.compiled_path(version)
+        if not os.path.isdir(folder):
+            uncompiled = self._compile(version, folder)
+            if uncompiled is not None:
+                return uncompiled, version, None
+        model = FlatForest.load(folder, mmap=True)
+        if self.flat_max_rows is not None:
+            model = HybridForest(model, functools.partial(load_unchanged, self.path, version), self.flat_max_rows)
+        return model, version, folder
+
+    def _compile(self, version, folder):
+        """
+        Compiles the model file into `folder`, unless another process does (or did) it first.
+        Returns None, or the unpickled scikit-learn model if it could not be compiled.
+        """
+        os.makedirs(self.compiled_folder, exist_ok=True)
+        with open(os.path.join(self.compiled_folder, '.lock'), 'w') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)    # Released when the file is closed.
+            if os.path.isdir(folder):               # Compiled by another worker while we waited.
+                return
+            print(f"Compiling '{self.path}' (version {version}) into '{folder}'...")
+            model = joblib.load(self.path)
+            try:
+                engine = compile_model(model)       # Checks parity with scikit-learn.
+            except Exception as e:
+                print(f"Could not compile the forest, predicting with scikit-learn instead: {e}")
+                return model
+            temporary = f"{folder}.tmp-{os.getpid()}"
+            shutil.rmtree(temporary, ignore_errors=True)
+            engine.save(temporary)
+            os.rename(temporary, folder)            # Atomic: the folder appears complete or not at all.
+
+    def _prune(self, keep):
+        """
+        Deletes the compiled versions not in `keep` (folders), e.g. those of model files replaced two reloads
+        ago. Compilations in progress (temporary folders) are left alone.
+        """
+        with open(os.path.join(self.compiled_folder, '.lock'), 'w') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)    # Not while another process compiles.
+            for name in os.listdir(self.compiled_folder):
+                path = os.path.join(self.compiled_folder, name)
+                if path not in keep and '.tmp-' not in name and os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)
+
+    def swap(self, model, version, compiled=None):
+        """Serves `model` from now on. Requests already running keep the model they started with."""
+        self._current = (model, version, compiled)
+        self.loaded_at = time.time()
+
+    def reload(self, before_swap=None):
+        """
+        Loads the model file and swaps it in. On failure, records the error, keeps the current model and re-raises.
+
+        `before_swap(model, version, compiled)`, if given, is called once the new model is loaded and before it
+        is served (e.g. to hand it to the inference executor).
+
+        Once a new model has been swapped in over a previous one, compiled versions older than both are deleted.
+        The previous one is kept: other workers that have not reloaded yet may still be using it. Nothing is
+        deleted on the first load, as other processes may be serving any version at that point.
+        """
+        start = time.perf_counter()
+        try:
+            model, version, compiled = self.load()
+            if before_swap is not None:
+                before_swap(model, version, compiled)
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+            raise
+        previous = self.compiled
+        first_load = not self.ready
+        self.swap(model, version, compiled)
+        self.load_seconds = time.perf_counter() - start
+        self.error = None
+        if not first_load and compiled is not None:
+            try:
+                self._prune({compiled, previous})
+            except OSError as e:
+                print(f"Could not delete old compiled models in '{self.compiled_folder}': {e}")
+        return version
+
+    def status(self):
+        """Readiness and model details as plain JSON-serialisable values."""
+        return {
+            "ready": self.ready,
+            "model_path": self.path,
+            "model_version": self.version,
+            "engine": None if self.model is None else type(self.model).__name__,
+            "memory_mapped": self.compiled is not None,
+            "loaded_at": self.loaded_at,
+            "load_seconds": self.load_seconds,
+            "error": self.error,
+        }
@@ -0,0 +1,218 @@
+# streaming.py
+# Parsing and formatting for the streaming endpoint: NDJSON or CSV rows in, predictions out, block by block.
+#
+# The request body is read chunk by chunk (request.stream()) and cut into blocks of at most `block_rows`
+# rows; each block is turned into the 4 input columns, scored, and its predictions are sent before the next
+# block is read. At any time the service therefore holds one block of input and one of output, whatever the
+# size of the upload. Because the body is only read when the previous block has been sent, a client that
+# reads the predictions slowly also slows down the upload (backpressure, through the server's flow control),
+# instead of piling predictions up in memory.
+#
+#   NDJSON (application/x-ndjson): one object per line, {"MedInc": ..., "HouseAge": ..., "AveRooms": ...,
+#       "Population": ...}; answered with one {"predicted_median_house_value": ...} object per line.
+#   CSV (text/csv): one row per line, in the order MedInc,HouseAge,AveRooms,Population or in the order of an
+#       optional header line naming the columns; answered with a 'predicted_median_house_value' header and one
+#       value per line.
+import asyncio
+import json
+from typing import List
+
+import numpy as np
+from pydantic import TypeAdapter, ValidationError
+from starlette.responses import StreamingResponse
+
+from features import INPUT_NAMES
+
+
+# Media types accepted for each format (the first one is used for the response).
+FORMATS = {
+    'ndjson': ('application/x-ndjson', 'application/ndjson', 'application/jsonl'),
+    'csv': ('text/csv', 'application/csv'),
+}
+MAX_LINE_BYTES = 64 * 1024          # A longer line is an error rather than an unbounded buffer.
+
+
+class StreamFormatError(ValueError):
+    """Raised for a malformed row; `row` is its 1-based number among the data rows."""
+
+    def __init__(self, message, row=None):
+        super().__init__(message if row is None else f"row {row}: {message}")
+        self.row = row
+
+
+def stream_format(content_type):
+    """The format ('ndjson' or 'csv') of a Content-Type header, or None if it is not supported."""
+    media_type = (content_type or '').split(';')[0].strip().lower()
+    for name, media_types in FORMATS.items():
+        if media_type in media_types:
+            return name
+    return None
+
+
+async def iter_line_blocks(chunks, block_rows):
+    """
+    Cuts a stream of byte chunks into lists of at most `block_rows` non-empty lines (without line endings).
+    """
+    buffer = b''
+    block = []
+    async for chunk in chunks:
+        buffer += chunk
+        lines = buffer.split(b'\n')
+        buffer = lines.pop()                # Incomplete last line: wait for the next chunk.
+        if len(buffer) > MAX_LINE_BYTES:
+            raise StreamFormatError(f"line longer than {MAX_LINE_BYTES} bytes")
+        for line in lines:
+            line = line.strip()
+            if line:
+                block.append(line)
+                if len(block) == block_rows:
+                    yield block
+                    block = []
+    if buffer.strip():
+        block.append(buffer.strip())
+    if block:
+        yield block
+
+
+def _number(field):
+    try:
+        return float(field)
+    except ValueError:
+        return None
+
+
+class NDJSONParser:
+    """Turns blocks of NDJSON lines into input columns, validated like HouseFeatures."""
+
+    def __init__(self, schema):
+        self.rows = TypeAdapter(List[schema])
+        self.seen = 0                       # Data rows parsed so far.
+
+    def __call__(self, lines):
+        try:
+            # One JSON array per block: pydantic parses and validates all of its rows in a single call.
+            houses = self.rows.validate_json(b'[' + b','.join(lines) + b']')
+        except ValidationError as e:
+            error = e.errors(include_url=False)[0]
+            loc = error['loc']
+            row = self.seen + loc[0] + 1 if loc and isinstance(loc[0], int) else None
+            field = '.'.join(str(part) for part in loc[1:])
+            raise StreamFormatError(f"{field + ': ' if field else ''}{error['msg']}", row)
+        self.seen += len(houses)
+        return {name: [getattr(house, name) for house in houses] for name in INPUT_NAMES}
+
+
+class CSVParser:
+    """Turns blocks of CSV lines into input columns; the first line may be a header naming the columns."""
+
+    def __init__(self):
+        self.order = None                   # Position of each input column in a row, once known.
+        self.n_fields = None
+        self.seen = 0
+
+    def __call__(self, lines):
+        if self.order is None:
+            try:
+                first = [field.strip().decode() for field in lines[0].split(b',')]
+            except UnicodeDecodeError:
+                raise StreamFormatError("CSV header is not valid UTF-8", 1) from None
+            if any(_number(field) is None for field in first):
+                missing = [name for name in INPUT_NAMES if name not in first]
+                if missing:
+                    raise StreamFormatError(f"CSV header {first} lacks the columns {missing}")
+                self.order = [first.index(name) for name in INPUT_NAMES]
+                lines = lines[1:]
+            elif len(first) != len(INPUT_NAMES):
+                raise StreamFormatError(f"expected {len(INPUT_NAMES)} fields ({', '.join(INPUT_NAMES)}) "
+                                        f"or a header line, got {len(first)}", 1)
+            else:
+                self.order = list(range(len(INPUT_NAMES)))
+            self.n_fields = len(first)
+        if not lines:
+            return {name: [] for name in INPUT_NAMES}
+        rows = [line.split(b',') for line in lines]
+        for i, fields in enumerate(rows):
+            if len(fields) != self.n_fields:
+                raise StreamFormatError(f"expected {self.n_fields} fields, got {len(fields)}", self.seen + i + 1)
+        try:
+            values = np.array(rows, dtype=float)
+        except ValueError:
+            bad = next(i for i, fields in enumerate(rows) if any(_number(field) is None for field in fields))
+            raise StreamFormatError("non-numeric value", self.seen + bad + 1)
+        self.seen += len(rows)
+        return {name: values[:, j] for name, j in zip(INPUT_NAMES, self.order)}
+
+
+async def iter_column_blocks(chunks, fmt, block_rows, schema):
+    """
+    Parses a stream of byte chunks in format `fmt` into blocks of input columns (dicts of equal-length
+    sequences keyed by INPUT_NAMES, at most `block_rows` rows each). Raises StreamFormatError on a bad row.
+    """
+    parse = NDJSONParser(schema) if fmt == 'ndjson' else CSVParser()
+    async for lines in iter_line_blocks(chunks, block_rows):
+        columns = parse(lines)
+        if len(columns[INPUT_NAMES[0]]):
+            yield columns
+
+
+def format_header(fmt):
+    """What the response starts with."""
+    return 'predicted_median_house_value\n' if fmt == 'csv' else ''
+
+
+def format_predictions(predictions, fmt):
+    """One block of predictions, one line per row."""
+    values = predictions.tolist()
+    if fmt == 'csv':
+        return ''.join(f"{value!r}\n" for value in values)
+    return ''.join(f'{{"predicted_median_house_value": {value!r}}}\n' for value in values)
+
+
+def format_error(message, fmt):
+    """The last line of a response whose input turned out to be invalid after streaming had started."""
+    if fmt == 'csv':
+        return f"# error: {message}\n"
+    return json.dumps({"error": message}) + '\n'
+
+
+class StreamStalled(RuntimeError):
+    """Raised when the client has not taken any of the response for `send_timeout` seconds."""
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    """
+    A StreamingResponse that can be sent while the request body is still being read.
+
+    For ASGI servers older than spec 2.4, Starlette's StreamingResponse watches for client disconnects by
+    reading from `receive` concurrently, which would swallow the request body chunks the response is made of.
+    This one only sends; a disconnect shows up as ClientDisconnect when the body iterator reads the request.
+
+    The client must read the response while it uploads. One that only reads once its upload is complete
+    (as many HTTP libraries do) stops taking predictions, so the service stops reading its rows, and both
+    would wait forever; instead, a chunk that cannot be sent within `send_timeout` seconds aborts the response.
+    """
+
+    def __init__(self, content, send_timeout=30.0, **kwargs):
+        super().__init__(content, **kwargs)
+        self.send_timeout = send_timeout
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+    async def stream_response(self, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        try:
+            async for chunk in self.body_iterator:
+                if not isinstance(chunk, (bytes, memoryview)):
+                    chunk = chunk.encode(self.charset)
+                try:
+                    await asyncio.wait_for(send({"type": "http.response.body", "body": chunk, "more_body": True}),
+                                           self.send_timeout)
+                except asyncio.TimeoutError:
+                    raise StreamStalled(f"The client took no response data for {self.send_timeout} s; it must read "
+                                        f"the predictions while uploading. Stream aborted.") from None
+        finally:
+            await self.body_iterator.aclose()
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
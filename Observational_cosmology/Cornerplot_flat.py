@@ -41,8 +41,6 @@ figure = corner.corner(data,
                         show_titles=True,               # Display titles with median and uncertainty for each parameter
                         )
 
-Sources
-
 # --- Define Output Folder for Plots ---
 OUTPUT_PLOT_FOLDER = "Corner_plots"
 if not os.path.exists(OUTPUT_PLOT_FOLDER):
@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Observational cosmology - likelihood benchmark
+
+{Throughput, peak memory and scaling of the fitting code against catalog size}
+Builds synthetic catalogs in the 9-column layout of supernovae_data.dat, from the size of the demo
+file up to about a million supernovae, and times the open, closed and flat models on each of them:
+the CosmologyModel + ParamEstim build (including the distance engine), single-point log_likelihood
+calls as CPNest makes them, and batched log_likelihood_batch calls. Peak memory is measured with
+tracemalloc (numpy allocations included), and the scaling exponent of the cost per evaluation with
+catalog size is fitted per model.
+
+Results can be saved as a JSON baseline and compared against a previous one (e.g. from another
+commit); ratios worse than --threshold are flagged.
+
+Usage:
+    python ObsCosBench.py [--sizes 60 1000 10000 100000 1000000] [--models open closed flat]
+                          [--min-time 1.0] [--save bench.json] [--compare baseline.json]
+    python ObsCosBench.py --write-catalog 100000 synthetic_100k.dat
+"""
+from __future__ import print_function, division
+
+import argparse
+import importlib
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np # Import numpy for numerical computations and array handling.
+
+from ObsCosEngine import get_engine, sinn
+from ObsCosLikelihood import ParamEstim
+
+
+SIZES = [60, 1000, 10000, 100000, 1000000]  # Catalog sizes (number of supernovae).
+MODELS = ['open', 'closed', 'flat']         # ObsCosNest_<model>.py scripts to benchmark.
+TEMPLATE = 'supernovae_data.dat'            # Catalog whose columns are resampled for the synthetic ones.
+FIDUCIAL = {'CurlyM': -3.0, 'omega_m': 0.3, 'omega_L': 0.7}    # Cosmology the synthetic meff follow.
+MAX_BATCH_ELEMENTS = 2 * 10 ** 6            # Cap on n_points x n_supernovae in one batched call.
+THRESHOLD = 1.2                             # Slow-down ratio flagged as a regression by --compare.
+c = 299792.458 # Define the speed of light in km/s.
+
+
+def synthetic_catalog(n, seed=0, template=TEMPLATE):
+    """
+    Synthetic supernova catalog in the layout of supernovae_data.dat.
+
+    Rows of the template are resampled for the error and photometry columns, redshifts are drawn
+    uniformly over the template's range, and meff (column 7) is the fiducial cosmology plus Gaussian
+    noise of the row's sigmam (column 8).
+
+    Args:
+        n (int): Number of supernovae.
+        seed (int): Seed of the random number generator.
+        template (str): Catalog to resample.
+
+    Returns:
+        ndarray: Array of shape (n, 9).
+    """
+    data = np.loadtxt(template)
+    rng = np.random.RandomState(seed)
+    catalog = data[rng.randint(len(data), size=n)]
+    catalog[:, 0] = np.sort(rng.uniform(data[:, 0].min(), data[:, 0].max(), size=n))
+    omega_k = 1 - FIDUCIAL['omega_m'] - FIDUCIAL['omega_L']
+    D = get_engine(catalog[:, 0], 'gauss', 1e-8).comoving_distance(FIDUCIAL['omega_m'], FIDUCIAL['omega_L'])
+    mu = FIDUCIAL['CurlyM'] + 5 * np.log10(c * (1 + catalog[:, 0]) * sinn(D, omega_k))
+    catalog[:, 7] = mu + catalog[:, 8] * rng.normal(size=n)
+    return catalog
+
+
+def load_models(models=MODELS):
+    """
+    Imports the model scripts (without running CPNest) for their CosmologyModel, names and bounds.
+
+    Args:
+        models (list): Curvature models.
+
+    Returns:
+        dict: Model name -> imported ObsCosNest_<model> module.
+    """
+    return {model: importlib.import_module('ObsCosNest_' + model) for model in models}
+
+
+def peak_memory(func):
+    """
+    Peak memory allocated while running func (numpy arrays included).
+
+    Args:
+        func (callable): Function of no arguments.
+
+    Returns:
+        tuple: (result of func, peak in MB).
+    """
+    tracemalloc.start()
+    try:
+        result = func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, peak / 2 ** 20
+
+
+def rate(func, min_time):
+    """
+    Calls func repeatedly for at least min_time seconds.
+
+    Args:
+        func (callable): Function of no arguments.
+        min_time (float): Minimum total time in seconds.
+
+    Returns:
+        float: Seconds per call.
+    """
+    calls, start = 0, time.perf_counter()
+    while True:
+        func()
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return elapsed / calls
+
+
+def bench_case(script, catalog, min_time=1.0, seed=0):
+    """
+    Benchmarks one model on one catalog.
+
+    Args:
+        script (module): Imported ObsCosNest_<model> script.
+        catalog (ndarray): Catalog of shape (n, 9).
+        min_time (float): Minimum time spent on each timed measurement.
+        seed (int): Seed for the parameter points.
+
+    Returns:
+        dict: n, build time, single-point and batched throughput (evaluations per second), seconds
+            per evaluation and peak memory (MB) of the build, a single call and a batched call.
+    """
+    z = np.ascontiguousarray(catalog[:, 0])
+    meff, sigma = catalog[:, 7], np.mean(catalog[:, 8])
+    n = len(z)
+
+    def build():
+        mod = ParamEstim(script.names, script.bounds, meff, script.CosmologyModel, sigma, z)
+        mod.log_likelihood(mod.prior(np.full(len(mod.names), 0.5)))     # First call builds the engine.
+        return mod
+
+    start = time.perf_counter()
+    mod, build_memory = peak_memory(build)
+    build_time = time.perf_counter() - start
+
+    unit = np.random.RandomState(seed).uniform(size=(4096, len(mod.names)))
+    points = np.array([lower + (upper - lower) * unit[:, i] for i, (lower, upper) in enumerate(mod.bounds)]).T
+    livepoints = itertools.cycle([dict(zip(mod.names, p)) for p in points[:256]])     # Prior draws, as CPNest passes them.
+    single = rate(lambda: mod.log_likelihood(next(livepoints)), min_time)
+    _, single_memory = peak_memory(lambda: mod.log_likelihood(next(livepoints)))
+
+    batch = int(np.clip(MAX_BATCH_ELEMENTS // n, 1, len(points)))
+    per_batch = rate(lambda: mod.log_likelihood_batch(points[:batch]), min_time)
+    _, batch_memory = peak_memory(lambda: mod.log_likelihood_batch(points[:batch]))
+
+    return {'n': n, 'build_s': build_time, 'build_mb': build_memory,
+            'single_s': single, 'single_per_s': 1. / single, 'single_mb': single_memory,
+            'batch': batch, 'batch_s': per_batch / batch, 'batch_per_s': batch / per_batch, 'batch_mb': batch_memory}
+
+
+def scaling(rows):
+    """
+    Scaling exponents of the cost per evaluation with catalog size, from a log-log least-squares fit.
+
+    Args:
+        rows (list): bench_case results of one model, for several sizes.
+
+    Returns:
+        dict: Exponents for the single-point and batched evaluations (1 = linear in n).
+    """
+    if len(rows) < 2:
+        return {'single': None, 'batch': None}
+    n = np.log([row['n'] for row in rows])
+    return {key: float(np.polyfit(n, np.log([row[key + '_s'] for row in rows]), 1)[0]) for key in ('single', 'batch')}
+
+
+def environment():
+    """Machine, library versions and git commit the benchmark ran on."""
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                         cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'python': platform.python_version(), 'numpy': np.__version__,
+            'machine': platform.machine(), 'processor': platform.processor(), 'cpus': os.cpu_count(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def run(models=MODELS, sizes=SIZES, min_time=1.0, seed=0, log=print):
+    """
+    Runs the benchmark for every model and catalog size.
+
+    Args:
+        models (list): Curvature models.
+        sizes (list): Catalog sizes.
+        min_time (float): Minimum time spent on each timed measurement.
+        seed (int): Seed of the synthetic catalogs.
+        log (callable): Called with one formatted line per case as results come in.
+
+    Returns:
+        dict: 'environment', 'results' (model -> list of bench_case rows) and 'scaling' (model -> exponents).
+    """
+    scripts = load_models(models)
+    results = {model: [] for model in models}
+    log('{0:<7} {1:>8} {2:>9} {3:>12} {4:>9} {5:>6} {6:>12} {7:>9}'.format(
+        'model', 'n', 'build [s]', 'single [/s]', 'MB', 'batch', 'batch [/s]', 'MB'))
+    for n in sizes:
+        catalog = synthetic_catalog(n, seed)
+        for model in models:
+            row = bench_case(scripts[model], catalog, min_time, seed)
+            results[model].append(row)
+            log('{0:<7} {n:>8d} {build_s:>9.3f} {single_per_s:>12.1f} {single_mb:>9.2f} {batch:>6d} '
+                '{batch_per_s:>12.1f} {batch_mb:>9.2f}'.format(model, **row))
+    return {'environment': environment(), 'min_time': min_time, 'results': results,
+            'scaling': {model: scaling(rows) for model, rows in results.items()}}
+
+
+def compare(current, baseline, threshold=THRESHOLD):
+    """
+    Compares two benchmark results, case by case.
+
+    Args:
+        current (dict): Output of run().
+        baseline (dict): Earlier output of run(), e.g. loaded from a saved JSON file.
+        threshold (float): Slow-down ratio above which a measurement is flagged.
+
+    Returns:
+        list: (model, n, measurement, baseline value, current value, ratio, flagged) tuples, where the
+            ratio is > 1 when the current code is slower or uses more memory.
+    """
+    rows = []
+    for model, results in current['results'].items():
+        old = {row['n']: row for row in baseline['results'].get(model, [])}
+        for row in results:
+            if row['n'] not in old:
+                continue
+            for key in ('single_s', 'batch_s', 'build_s', 'single_mb', 'batch_mb'):
+                before, after = old[row['n']][key], row[key]
+                ratio = after / before if before else np.inf
+                rows.append((model, row['n'], key, before, after, ratio, ratio > threshold))
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', nargs='+', type=int, default=SIZES, help='Catalog sizes.')
+    parser.add_argument('--models', nargs='+', default=MODELS, choices=MODELS)
+    parser.add_argument('--min-time', type=float, default=1.0, help='Seconds per timed measurement.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', help='Write the results to this JSON file.')
+    parser.add_argument('--compare', help='Baseline JSON file to compare against.')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD, help='Slow-down ratio flagged as a regression.')
+    parser.add_argument('--write-catalog', nargs=2, metavar=('N', 'PATH'),
+                        help='Only write a synthetic catalog of N supernovae to PATH.')
+    args = parser.parse_args()
+
+    if args.write_catalog:
+        n, path = args.write_catalog
+        np.savetxt(path, synthetic_catalog(int(n), args.seed), fmt='%.6g')
+        sys.exit(0)
+
+    result = run(args.models, args.sizes, args.min_time, args.seed)
+    print('\nscaling exponent of time per evaluation in n:')
+    for model, exponents in result['scaling'].items():
+        print('  {0:<7} single {1}  batch {2}'.format(model, *['-' if e is None else '{0:.2f}'.format(e)
+                                                            for e in (exponents['single'], exponents['batch'])]))
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(result, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print('\ncompared with {0} (commit {1}):'.format(args.compare, baseline['environment'].get('commit')))
+        regressions = 0
+        for model, n, key, before, after, ratio, flagged in compare(result, baseline, args.threshold):
+            regressions += flagged
+            print('  {0:<7} {1:>8d} {2:<10} {3:>12.4g} {4:>12.4g} {5:>7.2f}{6}'.format(
+                model, n, key, before, after, ratio, '  <-- regression' if flagged else ''))
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Observational cosmology - supernova catalog loader
+
+{Binary columnar cache of supernovae_data.dat, memory-mapped on first use}
+The text catalog is parsed once into one .npy file per column (z, sigmaz, meff, sigmam) in
+Catalog_cache/, with a manifest recording the file's size, mtime and sha256. Later loads memory-map
+the .npy files directly. The cache is rebuilt when the size or mtime changes and the content hash
+no longer matches.
+
+Catalog defers all of this until a column is first accessed, so importing a model script (and
+starting a CPNest worker process) does not read the catalog at all, and processes using the same
+catalog share its pages through the operating system's file cache instead of each holding a copy.
+"""
+from __future__ import print_function, division
+
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np # Import numpy for numerical computations and array handling.
+
+
+CACHE_FOLDER = "Catalog_cache" # Folder of the binary caches, next to the model scripts.
+COLUMNS = {'z': 0, 'sigmaz': 1, 'meff': 7, 'sigmam': 8} # Cached columns of supernovae_data.dat.
+MANIFEST = 'manifest.json'
+
+
+def file_hash(path, chunk=2 ** 20):
+    """
+    sha256 of a file, read in chunks.
+
+    Args:
+        path (str): File to hash.
+        chunk (int): Bytes read at a time.
+
+    Returns:
+        str: Hex digest.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_dir(path, cache_folder=CACHE_FOLDER):
+    """
+    Cache directory of a catalog: one per catalog path.
+
+    Args:
+        path (str): Text catalog.
+        cache_folder (str): Folder holding the caches.
+
+    Returns:
+        str: Directory holding the .npy columns and the manifest.
+    """
+    name = os.path.splitext(os.path.basename(path))[0]
+    tag = hashlib.sha256(os.path.abspath(path).encode()).hexdigest()[:12]
+    return os.path.join(cache_folder, '{0}_{1}'.format(name, tag))
+
+
+def _is_fresh(path, folder, columns):
+    """
+    Checks the manifest of a cache against the text catalog.
+
+    Args:
+        path (str): Text catalog.
+        folder (str): Cache directory.
+        columns (dict): Column name -> index in the text file.
+
+    Returns:
+        bool: True if every requested column is cached from the current content of the catalog.
+    """
+    try:
+        with open(os.path.join(folder, MANIFEST)) as f:
+            manifest = json.load(f)
+    except (IOError, OSError, ValueError):
+        return False
+    if any(manifest['columns'].get(name) != index for name, index in columns.items()):
+        return False
+    stat = os.stat(path)
+    if manifest['size'] == stat.st_size and manifest['mtime'] == stat.st_mtime:
+        return True
+    if manifest['size'] != stat.st_size or manifest['sha256'] != file_hash(path):
+        return False
+    manifest['mtime'] = stat.st_mtime   # Touched but unchanged: keep the cache, skip hashing next time.
+    _write_json(os.path.join(folder, MANIFEST), manifest)
+    return True
+
+
+def _write_json(path, obj):
+    """Writes JSON atomically, so concurrent readers never see a partial manifest."""
+    handle, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(handle, 'w') as f:
+        json.dump(obj, f, indent=2)
+    os.replace(tmp, path)
+
+
+def build_cache(path, columns=COLUMNS, cache_folder=CACHE_FOLDER):
+    """
+    Parses the text catalog and writes one .npy file per column plus the manifest.
+
+    Each file is written under a temporary name and renamed into place, and the manifest is written
+    last, so several processes can build or read the same cache at once.
+
+    Args:
+        path (str): Text catalog.
+        columns (dict): Column name -> index in the text file.
+        cache_folder (str): Folder holding the caches.
+
+    Returns:
+        str: The cache directory.
+    """
+    folder = cache_dir(path, cache_folder)
+    if not os.path.exists(folder):
+        os.makedirs(folder, exist_ok=True)
+    stat = os.stat(path)
+    names = sorted(columns, key=columns.get)
+    table = np.loadtxt(path, usecols=[columns[name] for name in names], ndmin=2)
+    for i, name in enumerate(names):
+        handle, tmp = tempfile.mkstemp(dir=folder, suffix='.npy')
+        with os.fdopen(handle, 'wb') as f:
+            np.save(f, np.ascontiguousarray(table[:, i]))
+        os.replace(tmp, os.path.join(folder, name + '.npy'))
+    _write_json(os.path.join(folder, MANIFEST), {'source': os.path.abspath(path), 'size': stat.st_size,
+                                                 'mtime': stat.st_mtime, 'sha256': file_hash(path),
+                                                 'rows': len(table), 'columns': dict(columns)})
+    return folder
+
+
+def load_columns(path, columns=COLUMNS, cache_folder=CACHE_FOLDER, mmap_mode='r'):
+    """
+    Loads catalog columns from the binary cache, (re)building it first if it is missing or stale.
+
+    Args:
+        path (str): Text catalog.
+        columns (dict): Column name -> index in the text file.
+        cache_folder (str): Folder holding the caches.
+        mmap_mode (str): Passed to np.load; 'r' memory-maps read-only, None reads into memory.
+
+    Returns:
+        dict: Column name -> array.
+    """
+    folder = cache_dir(path, cache_folder)
+    if not _is_fresh(path, folder, columns):
+        build_cache(path, columns, cache_folder)
+    return {name: np.load(os.path.join(folder, name + '.npy'), mmap_mode=mmap_mode) for name in columns}
+
+
+class Catalog(object):
+    """
+    Supernova catalog whose columns are loaded from the binary cache on first access.
+    """
+    def __init__(self, path, columns=COLUMNS, cache_folder=CACHE_FOLDER):
+        """
+        Initializes the catalog without reading it.
+
+        Args:
+            path (str): Text catalog (e.g. 'supernovae_data.dat').
+            columns (dict): Column name -> index in the text file; each becomes an attribute.
+            cache_folder (str): Folder holding the caches.
+        """
+        self.path = path
+        self.columns = dict(columns)
+        self.cache_folder = cache_folder
+        self._arrays = None
+
+
+    def load(self):
+        """
+        Memory-maps the columns (building the cache if needed) the first time it is called.
+
+        Returns:
+            dict: Column name -> array; the same array objects on every call.
+        """
+        if self._arrays is None:
+            self._arrays = load_columns(self.path, self.columns, self.cache_folder)
+        return self._arrays
+
+
+    @property
+    def loaded(self):
+        """True once the columns have been mapped."""
+        return self._arrays is not None
+
+
+    def __getattr__(self, name):
+        if name in self.__dict__.get('columns', {}):
+            return self.load()[name]
+        raise AttributeError(name)
+
+
+    def __len__(self):
+        return len(self.load()['z'])
+
+
+    @property
+    def sigma(self):
+        """Mean distance modulus error, the scalar sigma of the likelihood."""
+        return float(np.mean(self.load()['sigmam']))
+
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_arrays'] = None     # Pickled (e.g. into a resume file) without the data; re-mapped on use.
+        return state
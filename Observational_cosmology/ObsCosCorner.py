@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Observational cosmology - batch corner plots
+
+{All corner plots in one run: cached posteriors, precomputed histograms, parallel rendering}
+Replaces running Cornerplot_open.py, Cornerplot_closed.py and Cornerplot_flat.py one after the other.
+Each posterior_<model>.dat is parsed once into a memory-mapped binary cache in Posterior_cache/ (the
+catalog cache of ObsCosCatalog, rebuilt when the text file changes). The 1D and 2D weighted
+histograms, credible-region contour levels and quantiles of every model are computed up front in
+NumPy, with one bincount for all parameters and one for all parameter pairs, and only these small
+arrays are passed to the worker processes that draw the figures.
+
+Labels are rendered with matplotlib's own mathtext and Computer Modern fonts by default, which needs
+no LaTeX installation; --usetex renders them with LaTeX as the original scripts do (slower: LaTeX is
+run for every distinct label and tick). Samples from a nested_stream.bin (ObsCosStream) are used with
+their posterior weights when --stream is given.
+
+Usage:
+    python ObsCosCorner.py [--models open closed flat curved] [--usetex] [--stream] [--bins 20]
+"""
+from __future__ import print_function, division
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np # Import numpy for numerical computations and array handling.
+
+from ObsCosCatalog import load_columns
+from ObsCosStream import provisional_posterior, weighted_quantiles
+
+
+# Posterior file, sampled parameters (column index in the file) and axis labels of each model.
+MODELS = {
+    'open':   {'path': os.path.join('Run_files_open', 'posterior_open.dat'),
+               'columns': {'CurlyM': 0, 'omega_L': 1, 'omega_m': 2},
+               'labels': [r"$M$", r"$\Omega_{\lambda}$", r"$\Omega_M$"]},
+    'closed': {'path': os.path.join('Run_files_closed', 'posterior_closed.dat'),
+               'columns': {'CurlyM': 0, 'omega_L': 1, 'omega_m': 2},
+               'labels': [r"$M$", r"$\Omega_{\lambda}$", r"$\Omega_M$"]},
+    'flat':   {'path': os.path.join('Run_files_flat', 'posterior_flat.dat'),
+               'columns': {'CurlyM': 0, 'omega_m': 1},
+               'labels': [r"$M$", r"$\Omega_M$"]},
+    'curved': {'path': os.path.join('Run_files_curved', 'posterior_curved.dat'),
+               'columns': {'CurlyM': 0, 'omega_L': 1, 'omega_m': 2},
+               'labels': [r"$M$", r"$\Omega_{\Lambda}$", r"$\Omega_M$"]},
+}
+CACHE_FOLDER = "Posterior_cache"            # Binary caches of the posterior files.
+OUTPUT_PLOT_FOLDER = "Corner_plots"         # cornerplot_<model>.png, as written by the Cornerplot_* scripts.
+BINS = 20                                   # Histogram bins per parameter (corner's default).
+QUANTILES = [0.16, 0.5, 0.84]               # Marked on the 1D histograms and quoted in the titles.
+# Probability mass inside the 2D contours: 0.5, 1, 1.5 and 2 sigma of a 2D Gaussian (corner's default).
+LEVELS = 1.0 - np.exp(-0.5 * np.arange(0.5, 2.1, 0.5) ** 2)
+TITLE_FMT = '.4f'
+
+
+def load_posterior(name, stream=False, cache_folder=CACHE_FOLDER):
+    """
+    Samples and weights of one model's posterior.
+
+    Args:
+        name (str): Model name (key of MODELS).
+        stream (bool): Read the weighted nested samples of the model's nested_stream.bin instead of the
+            equally weighted posterior file.
+        cache_folder (str): Folder of the binary posterior caches.
+
+    Returns:
+        tuple: (samples of shape (n, n_params), weights of shape (n,)).
+    """
+    spec = MODELS[name]
+    if stream:
+        names, samples, weights = provisional_posterior(os.path.dirname(spec['path']))
+        return samples[:, [names.index(p) for p in spec['columns']]], weights
+    columns = load_columns(spec['path'], spec['columns'], cache_folder)   # '#' header skipped by loadtxt.
+    samples = np.column_stack([columns[p] for p in sorted(spec['columns'], key=spec['columns'].get)])
+    return samples, np.ones(len(samples))
+
+
+def credible_levels(hist, levels=LEVELS):
+    """
+    Density thresholds of the highest-density regions enclosing given probability masses.
+
+    Args:
+        hist (ndarray): Histograms of shape (..., bins, bins).
+        levels (array_like): Enclosed probability masses, increasing.
+
+    Returns:
+        ndarray: Thresholds of shape (..., len(levels)), decreasing, one set per histogram.
+    """
+    flat = hist.reshape(hist.shape[:-2] + (-1,))
+    ordered = -np.sort(-flat, axis=-1)                          # Bins from the densest down.
+    cumulative = np.cumsum(ordered, axis=-1)
+    cumulative /= cumulative[..., -1:]
+    index = np.stack([np.searchsorted(c, levels) for c in cumulative.reshape(-1, flat.shape[-1])])
+    index = np.minimum(index, flat.shape[-1] - 1).reshape(flat.shape[:-1] + (len(levels),))
+    return np.take_along_axis(ordered, index, axis=-1)
+
+
+def summarise(samples, weights, bins=BINS, quantiles=QUANTILES, levels=LEVELS):
+    """
+    Everything a corner plot draws, computed from the samples in one pass.
+
+    Args:
+        samples (ndarray): Samples of shape (n, n_params).
+        weights (ndarray): Sample weights of shape (n,).
+        bins (int): Histogram bins per parameter.
+        quantiles (list): Quantiles of each parameter.
+        levels (array_like): Probability masses enclosed by the 2D contours.
+
+    Returns:
+        dict: 'edges' (n_params, bins + 1), 'hist1d' (n_params, bins), 'hist2d' (n_pairs, bins, bins) with
+            pairs (i, j), i > j, in row order, 'pairs', 'thresholds' (n_pairs, len(levels)) and
+            'quantiles' (n_params, len(quantiles)).
+    """
+    samples = np.asarray(samples, dtype=float)
+    n, ndim = samples.shape
+    lower, upper = samples.min(axis=0), samples.max(axis=0)
+    upper = np.where(upper > lower, upper, lower + 1.)             # Constant parameter: one unit wide.
+    edges = lower[:, np.newaxis] + (upper - lower)[:, np.newaxis] * np.linspace(0, 1, bins + 1)
+    # Bin index of every sample in every parameter, computed once for the 1D and 2D histograms.
+    index = np.clip(((samples - lower) / (upper - lower) * bins).astype(int), 0, bins - 1)
+
+    offsets = np.arange(ndim) * bins
+    hist1d = np.bincount((index + offsets).ravel(), np.repeat(weights, ndim),
+                         minlength=ndim * bins).reshape(ndim, bins)
+
+    pairs = [(i, j) for i in range(ndim) for j in range(i)]
+    if pairs:
+        rows, cols = np.array(pairs).T
+        flat = index[:, rows] * bins + index[:, cols] + np.arange(len(pairs)) * bins ** 2
+        hist2d = np.bincount(flat.ravel(), np.repeat(weights, len(pairs)),
+                             minlength=len(pairs) * bins ** 2).reshape(len(pairs), bins, bins)
+        thresholds = credible_levels(hist2d, levels)
+    else:
+        hist2d, thresholds = np.empty((0, bins, bins)), np.empty((0, len(levels)))
+
+    return {'edges': edges, 'hist1d': hist1d, 'hist2d': hist2d, 'pairs': pairs, 'thresholds': thresholds,
+            'quantiles': np.array([weighted_quantiles(samples[:, i], weights, quantiles) for i in range(ndim)])}
+
+
+def setup_matplotlib(usetex=False):
+    """
+    Selects the Agg backend and the fonts of the original scripts, with LaTeX or with mathtext.
+
+    Args:
+        usetex (bool): Render text with LaTeX (requires a LaTeX installation).
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib import rc
+    if usetex:
+        rc('font', **{'family': 'serif', 'sans-serif': ['Computer Modern Roman']})
+        rc('text', usetex=True)
+    else:
+        # Computer Modern from matplotlib's bundled fonts: the same look without starting LaTeX.
+        rc('font', **{'family': 'serif', 'serif': ['cmr10', 'DejaVu Serif']})
+        rc('mathtext', fontset='cm')
+        matplotlib.rcParams.update({'axes.unicode_minus': False,          # cmr10 has no unicode minus glyph.
+                                    'axes.formatter.use_mathtext': True})
+    rc('font', size=11)
+    rc('xtick', labelsize=8)
+    rc('ytick', labelsize=8)
+
+
+def title(label, q, fmt=TITLE_FMT):
+    """Title of a 1D panel, median with the distances to the outer quantiles, as corner writes it."""
+    lo, mid, hi = (format(v, fmt) for v in (q[1] - q[0], q[1], q[2] - q[1]))
+    return r"{0} = ${1}_{{-{2}}}^{{+{3}}}$".format(label, mid, lo, hi)
+
+
+def render(name, summary, labels, output_folder=OUTPUT_PLOT_FOLDER, usetex=False):
+    """
+    Draws and saves one corner plot from its precomputed summary.
+
+    Args:
+        name (str): Model name, used in the file name cornerplot_<name>.png.
+        summary (dict): Output of summarise().
+        labels (list): Axis labels, one per parameter.
+        output_folder (str): Folder the figure is saved to.
+        usetex (bool): Render text with LaTeX.
+
+    Returns:
+        str: Path of the saved figure.
+    """
+    setup_matplotlib(usetex)
+    import matplotlib.pyplot as plt
+
+    edges, ndim = summary['edges'], len(summary['edges'])
+    centres = 0.5 * (edges[:, 1:] + edges[:, :-1])
+    # Same figure geometry as corner.corner: 2 inch panels with fixed margins.
+    factor, lbdim, trdim, whspace = 2.0, 0.5 * 2.0, 0.2 * 2.0, 0.05
+    dim = lbdim + factor * ndim + factor * (ndim - 1.) * whspace + trdim
+    fig, axes = plt.subplots(ndim, ndim, figsize=(dim, dim), squeeze=False)
+    fig.subplots_adjust(left=lbdim / dim, bottom=lbdim / dim, right=(lbdim + factor * ndim) / dim,
+                        top=(lbdim + factor * ndim) / dim, wspace=whspace, hspace=whspace)
+
+    for i in range(ndim):
+        ax = axes[i, i]
+        ax.stairs(summary['hist1d'][i], edges[i], color='k')
+        for value in summary['quantiles'][i]:
+            ax.axvline(value, ls='dashed', color='k')
+        ax.set_title(title(labels[i], summary['quantiles'][i]))
+        ax.set_yticklabels([])
+        ax.set_ylim(0, 1.1 * summary['hist1d'][i].max())
+    for (i, j), hist, thresholds in zip(summary['pairs'], summary['hist2d'], summary['thresholds']):
+        ax = axes[i, j]
+        levels = np.append(np.unique(thresholds), hist.max() * (1 + 1e-9))  # contourf needs increasing levels.
+        if len(levels) > 1:
+            ax.contourf(centres[j], centres[i], hist, levels=levels, cmap='Greys', alpha=0.6)
+            ax.contour(centres[j], centres[i], hist, levels=levels[:-1], colors='k', linewidths=0.8)
+        ax.set_ylim(edges[i, 0], edges[i, -1])
+    for i in range(ndim):
+        for j in range(ndim):
+            ax = axes[i, j]
+            if j > i:
+                ax.set_axis_off()
+                continue
+            ax.set_xlim(edges[j, 0], edges[j, -1])
+            ax.xaxis.set_major_locator(plt.MaxNLocator(5, prune='lower'))
+            ax.yaxis.set_major_locator(plt.MaxNLocator(5, prune='lower'))
+            if i < ndim - 1:
+                ax.set_xticklabels([])
+            else:
+                ax.set_xlabel(labels[j])
+                ax.xaxis.set_label_coords(0.5, -0.3)
+                ax.tick_params(axis='x', labelrotation=45)
+            if j == 0 and i > 0:
+                ax.set_ylabel(labels[i])
+                ax.yaxis.set_label_coords(-0.3, 0.5)
+                ax.tick_params(axis='y', labelrotation=45)
+            elif j < i:
+                ax.set_yticklabels([])
+
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder, exist_ok=True)
+    path = os.path.join(output_folder, 'cornerplot_{0}.png'.format(name))
+    fig.savefig(path)
+    plt.close(fig)
+    return path
+
+
+def _render(args):
+    """Worker entry point: render() with its arguments packed in a tuple."""
+    return render(*args)
+
+
+def run(models, bins=BINS, usetex=False, stream=False, output_folder=OUTPUT_PLOT_FOLDER, workers=None):
+    """
+    Summarises the posteriors of several models in this process and renders them in parallel.
+
+    Args:
+        models (list): Model names (keys of MODELS); models without a posterior file are skipped.
+        bins (int): Histogram bins per parameter.
+        usetex (bool): Render text with LaTeX instead of mathtext.
+        stream (bool): Use the weighted samples of nested_stream.bin.
+        output_folder (str): Folder the figures are saved to.
+        workers (int): Worker processes; one per figure (up to the number of cores) by default.
+
+    Returns:
+        list: Paths of the saved figures.
+    """
+    jobs = []
+    for name in models:
+        source = os.path.dirname(MODELS[name]['path']) if stream else MODELS[name]['path']
+        if not os.path.exists(source):
+            print(f"Skipping {name}: no {source}")
+            continue
+        samples, weights = load_posterior(name, stream)
+        jobs.append((name, summarise(samples, weights, bins), MODELS[name]['labels'], output_folder, usetex))
+    if not jobs:
+        return []
+    workers = workers or min(len(jobs), os.cpu_count() or 1)
+    if workers == 1:
+        return [_render(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_render, jobs))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--models', nargs='+', default=['open', 'closed', 'flat', 'curved'], choices=sorted(MODELS))
+    parser.add_argument('--bins', type=int, default=BINS, help='Histogram bins per parameter.')
+    parser.add_argument('--usetex', action='store_true', help='Render text with LaTeX (slow) instead of mathtext.')
+    parser.add_argument('--stream', action='store_true', help='Plot the weighted samples of nested_stream.bin.')
+    parser.add_argument('--workers', type=int, help='Worker processes (default: one per figure).')
+    parser.add_argument('--output', default=OUTPUT_PLOT_FOLDER, help='Output folder for the figures.')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    for path in run(args.models, args.bins, args.usetex, args.stream, args.output, args.workers):
+        print(f"Corner plot saved to: {path}")
+    print(f"Done in {time.perf_counter() - start:.2f} s")
@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Observational cosmology - distance emulator
+
+{Optional precomputed table for the luminosity distance integral}
+Nested sampling keeps revisiting the same narrow region of (omega_m, omega_L), and every visit used to
+redo the same numerical integral. The emulator tabulates the dimensionless comoving distance (the
+integral of 1/E(z), which the ObsCosNest_* models turn into a luminosity distance) once, on a dense
+(omega_m, omega_L) grid covering the parameter bounds and on a fixed redshift grid from 0 to max(z).
+The size of the table therefore does not depend on the number of supernovae; for the flat model
+(omega_L = 1 - omega_m) it is a single line over omega_m. The table is saved as a memory-mappable .npy
+file keyed on the grid specification, and CosmologyModel queries are answered by bilinear interpolation
+in (omega_m, omega_L) (linear for the flat model) followed by linear interpolation in z.
+"""
+from __future__ import print_function, division
+
+import hashlib # Import hashlib for the cache key (grid specification).
+import json
+import os # Import the os module for creating the cache directory and atomic file replacement.
+
+import numpy as np # Import numpy for numerical computations and array handling.
+
+from ObsCosEngine import make_engine
+
+
+CACHE_FOLDER = "Emulator_cache" # Default directory for the tabulated distances.
+NGRID = 241 # Default number of nodes along each of the omega_m and omega_L axes.
+DZ = 0.01 # Default spacing of the redshift grid of the table.
+FLAT_TOL = 1e-9 # |omega_m + omega_L - 1| up to which a flat emulator answers a query.
+
+
+class DistanceEmulator(object):
+    """
+    Interpolator over a precomputed table of comoving distances.
+
+    It has the same comoving_distance(omega_m, omega_L) interface as ObsCosEngine.DistanceEngine, so it
+    can be registered in its place (ObsCosEngine.register_engine) without touching CosmologyModel.
+    The table holds D(z)/z, which tends to 1 at z = 0 and varies slowly, so that linear interpolation
+    in z keeps the same relative accuracy at low and high redshift. Queries outside the tabulated bounds
+    (or off the omega_m + omega_L = 1 line, for a flat emulator), or in cells that touch the unphysical
+    region where E(z)^2 < 0, fall back to the direct integral.
+    """
+    def __init__(self, z, omega_m_range, omega_L_range=None, n_m=NGRID, n_L=NGRID, dz=DZ, method='gauss',
+                 tol=1e-8, cache_folder=CACHE_FOLDER):
+        """
+        Initializes the emulator, loading the table from the cache or building and saving it.
+
+        Args:
+            z (array_like): Redshifts of the supernovae.
+            omega_m_range (tuple): (lower, upper) range of omega_m to tabulate.
+            omega_L_range (tuple): (lower, upper) range of omega_L to tabulate, or None for the flat
+                model, whose table only covers omega_L = 1 - omega_m.
+            n_m (int): Number of omega_m nodes.
+            n_L (int): Number of omega_L nodes (ignored for the flat model).
+            dz (float): Target spacing of the redshift grid; the grid ends at the first multiple of dz
+                at or above max(z), so catalogs with similar redshift ranges share a table.
+            method (str): Integration backend used to fill the table (see ObsCosEngine.make_engine).
+            tol (float): Tolerance of that backend.
+            cache_folder (str): Directory for the .npy cache, or None to keep the table in memory only.
+        """
+        self.engine = make_engine(z, method, tol)   # Direct integral at the supernovae, used as fallback.
+        self.z = np.asarray(z, dtype=float)
+        self.flat = omega_L_range is None
+        self.method, self.tol = method, tol
+        self.omega_m_grid = np.linspace(omega_m_range[0], omega_m_range[1], n_m)
+        self._hm = self.omega_m_grid[1] - self.omega_m_grid[0]
+        if self.flat:
+            self.omega_L_grid = None
+        else:
+            self.omega_L_grid = np.linspace(omega_L_range[0], omega_L_range[1], n_L)
+            self._hL = self.omega_L_grid[1] - self.omega_L_grid[0]
+
+        # Fixed redshift grid, and each supernova's cell and fractional position in it.
+        nz = max(int(np.ceil(round(self.z.max() / dz, 9))), 1) if self.z.size else 1
+        self.z_grid = np.linspace(0., nz * dz, nz + 1)
+        self._idx = np.clip(np.searchsorted(self.z_grid, self.z, side='right') - 1, 0, nz - 1)
+        self._frac = ((self.z - self.z_grid[self._idx]) / (self.z_grid[1] - self.z_grid[0]))
+
+        spec = {'omega_m': [float(omega_m_range[0]), float(omega_m_range[1]), int(n_m)],
+                'omega_L': 'flat' if self.flat else [float(omega_L_range[0]), float(omega_L_range[1]), int(n_L)],
+                'z': [float(self.z_grid[-1]), int(nz)], 'method': method, 'tol': tol}
+        self.key = hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()[:16]
+
+        self.path = None
+        if cache_folder is None:
+            self.table = self._build()
+        else:
+            self.path = os.path.join(cache_folder, 'distance_table_{0}.npy'.format(self.key))
+            if not os.path.exists(self.path):
+                if not os.path.exists(cache_folder):
+                    os.makedirs(cache_folder)
+                tmp = self.path + '.{0}.tmp'.format(os.getpid())
+                with open(tmp, 'wb') as f:
+                    np.save(f, self._build())
+                os.replace(tmp, self.path)      # Atomic, so concurrent runs never read a partial table.
+            self.table = np.load(self.path, mmap_mode='r')  # Shared between processes through the page cache.
+
+    @classmethod
+    def from_bounds(cls, z, names, bounds, **kwargs):
+        """
+        Builds an emulator covering the prior bounds of an ObsCosNest_* model.
+
+        For the flat model (no omega_L parameter) the table is a single line over omega_m,
+        with omega_L = 1 - omega_m.
+
+        Args:
+            z (array_like): Redshifts of the supernovae.
+            names (list): Parameter names, as passed to ParamEstim.
+            bounds (list): Parameter bounds [(lower, upper), ...], as passed to ParamEstim.
+            **kwargs: Passed on to DistanceEmulator.
+
+        Returns:
+            DistanceEmulator: The emulator.
+        """
+        limits = dict(zip(names, bounds))
+        return cls(z, limits['omega_m'], limits.get('omega_L'), **kwargs)
+
+    def _build(self):
+        """
+        Fills the table of D(z)/z on the redshift grid with the direct integral, one omega_m row at a time.
+
+        Returns:
+            ndarray: Shape (n_m, n_L, n_z), or (n_m, n_z) for the flat model.
+        """
+        z_nodes = self.z_grid[1:]
+        engine = make_engine(z_nodes, self.method, self.tol)
+        if self.flat:
+            table = np.empty((self.omega_m_grid.size, self.z_grid.size))
+        else:
+            table = np.empty((self.omega_m_grid.size, self.omega_L_grid.size, self.z_grid.size))
+        table[..., 0] = 1.      # D(z)/z -> 1/E(0) = 1.
+        with np.errstate(invalid='ignore'):
+            for i, omega_m in enumerate(self.omega_m_grid):
+                omega_L = 1 - omega_m if self.flat else self.omega_L_grid[:, np.newaxis]
+                table[i, ..., 1:] = engine.comoving_distance(omega_m, omega_L) / z_nodes
+        return table
+
+    def comoving_distance(self, omega_m, omega_L):
+        """
+        Interpolated dimensionless comoving distance for every supernova.
+
+        Args:
+            omega_m (float or ndarray): Matter density parameter(s), scalar or with a trailing
+                length-1 axis (see ObsCosEngine.as_column).
+            omega_L (float or ndarray): Dark energy density parameter(s), same shape as omega_m.
+
+        Returns:
+            ndarray: Shape (..., n_supernovae), as for DistanceEngine.comoving_distance.
+        """
+        omega_m, omega_L = np.broadcast_arrays(np.asarray(omega_m, dtype=float),
+                                               np.asarray(omega_L, dtype=float))
+        if omega_m.ndim and omega_m.shape[-1] == 1:
+            omega_m, omega_L = omega_m[..., 0], omega_L[..., 0]   # Drop the supernova broadcast axis.
+        scalar = omega_m.ndim == 0
+        om = np.atleast_1d(omega_m)
+        oL = np.atleast_1d(omega_L)
+
+        # Cell indices and fractional positions along each parameter axis.
+        table = self.table
+        x = (om - self.omega_m_grid[0]) / self._hm
+        inside = (x >= 0) & (x <= self.omega_m_grid.size - 1)
+        i = np.clip(np.floor(np.where(inside, x, 0)).astype(int), 0, self.omega_m_grid.size - 2)
+        t = (x - i)[..., np.newaxis]
+        if self.flat:
+            inside &= np.abs(om + oL - 1) <= FLAT_TOL
+            rows = (1 - t) * table[i] + t * table[i + 1]
+        else:
+            y = (oL - self.omega_L_grid[0]) / self._hL
+            inside &= (y >= 0) & (y <= self.omega_L_grid.size - 1)
+            j = np.clip(np.floor(np.where(inside, y, 0)).astype(int), 0, self.omega_L_grid.size - 2)
+            u = (y - j)[..., np.newaxis]
+            rows = ((1 - t) * (1 - u) * table[i, j] + t * (1 - u) * table[i + 1, j]
+                    + (1 - t) * u * table[i, j + 1] + t * u * table[i + 1, j + 1])
+
+        # Linear interpolation of D(z)/z at each supernova redshift.
+        lo = rows[..., self._idx]
+        result = self.z * (lo + self._frac * (rows[..., self._idx + 1] - lo))
+
+        # Direct integral for points outside the table or next to its unphysical (NaN) region.
+        redo = ~inside | np.isnan(result).any(axis=-1)
+        if redo.any():
+            result[redo] = self.engine.comoving_distance(om[redo][:, np.newaxis], oL[redo][:, np.newaxis])
+        return result[0] if scalar else result
+
+    def check_accuracy(self, nsample=2000, seed=0):
+        """
+        Compares the interpolated distances with the direct integral at random points within the table.
+
+        Args:
+            nsample (int): Number of random (omega_m, omega_L) points.
+            seed (int): Seed of the random number generator.
+
+        Returns:
+            dict: Number of points compared (where the direct integral is finite), maximum relative
+                error in the distance, and the corresponding maximum error in distance modulus (mag).
+        """
+        rng = np.random.RandomState(seed)
+        om = rng.uniform(self.omega_m_grid[0], self.omega_m_grid[-1], nsample)[:, np.newaxis]
+        if self.flat:
+            oL = 1 - om
+        else:
+            oL = rng.uniform(self.omega_L_grid[0], self.omega_L_grid[-1], nsample)[:, np.newaxis]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            direct = self.engine.comoving_distance(om, oL)
+            emulated = self.comoving_distance(om, oL)
+            good = np.isfinite(direct).all(axis=-1) & (direct > 0).all(axis=-1)
+            ratio = emulated[good] / direct[good]
+        return {
+            'npoints': int(good.sum()),
+            'max_rel_error': float(np.max(np.abs(ratio - 1))) if good.any() else float('nan'),
+            'max_mag_error': float(np.max(np.abs(5 * np.log10(ratio)))) if good.any() else float('nan'),
+        }
@@ -0,0 +1,406 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Observational cosmology - shared distance engine
+
+{Vectorised luminosity-distance machinery used by the ObsCosNest_* scripts}
+The original CosmologyModel functions built a fresh redshift grid and called the trapezoidal rule once
+per supernova, inside a Python loop, on every likelihood call. The engine below sorts the redshifts once,
+integrates the 1/E(z) integrand a single time up to max(z) with a cumulative trapezoidal rule, and reads
+every supernova's comoving distance off that one cumulative array. The cost of a model evaluation then
+grows with the size of the integration grid, not with N_supernovae x grid size.
+
+The integral is pluggable: besides the cumulative trapezoidal rule (DistanceEngine) there is a composite
+fixed-order Gauss-Legendre rule (GaussLegendreEngine) and, for the flat case omega_L = 1 - omega_m, a
+closed form in terms of the hypergeometric function (FlatClosedFormEngine). make_engine() builds any of
+them to a user-set tolerance, and get_engine() caches the one each CosmologyModel asks for.
+"""
+from __future__ import print_function, division
+
+import numpy as np # Import numpy for numerical computations and array handling.
+
+
+c = 299792.458 # Define the speed of light in km/s.
+
+DZ = 0.01 # Default redshift spacing for the integration grid (same as the original scripts).
+
+# Cosmologies (omega_m, omega_L) at which a backend's error is estimated when it is built to a tolerance.
+PROBES = ((0.3, 0.7), (1.0, 0.0), (0.05, 0.0), (1.5, 0.5), (0.3, 1.2))
+
+
+def inverse_E(z_grid, omega_m, omega_L):
+    """
+    Evaluates the integrand 1/E(z) of the luminosity distance integral.
+
+    Args:
+        z_grid (array_like): Redshifts at which to evaluate the integrand.
+        omega_m (float): Matter density parameter.
+        omega_L (float): Dark energy density parameter.
+
+    Returns:
+        ndarray: 1/E(z) on the given redshifts (NaN where E(z)^2 < 0).
+    """
+    return ((1 + z_grid) ** 2 * (1 + omega_m * z_grid) - z_grid * (2 + z_grid) * omega_L) ** (-0.5)
+
+
+class DistanceEngine(object):
+    """
+    Single-pass evaluator of the dimensionless comoving distance for a fixed set of redshifts.
+
+    Everything that depends only on the redshifts (sort order, integration grid, interpolation
+    indices and weights) is computed once here, so that each call only evaluates the integrand
+    on the grid, takes one cumulative sum and gathers the values at the supernova redshifts.
+    """
+    def __init__(self, z, dz=DZ):
+        """
+        Initializes the engine.
+
+        Args:
+            z (array_like): Redshifts of the supernovae (any order).
+            dz (float): Target spacing of the integration grid.
+        """
+        self.z = np.asarray(z, dtype=float)                 # Redshifts in the caller's order.
+        self.dz = dz
+        self._order = np.argsort(self.z, kind='mergesort')  # Sort the redshifts once.
+        self._inverse = np.empty_like(self._order)          # Permutation that undoes the sort.
+        self._inverse[self._order] = np.arange(self._order.size)
+        z_sorted = self.z[self._order]
+
+        # Uniform grid from 0 to max(z), with max(z) itself as the last node so the integral
+        # is not truncated short of the highest-redshift supernova.
+        zmax = z_sorted[-1] if z_sorted.size else 0.
+        nstep = max(int(np.ceil(zmax / dz)), 1)
+        self.grid = np.linspace(0., zmax, nstep + 1)
+        self._h = self.grid[1] - self.grid[0]               # Actual (slightly adjusted) grid spacing.
+
+        # Each supernova lies in the cell [grid[i], grid[i+1]]; store i and the fractional position.
+        idx = np.clip(np.searchsorted(self.grid, z_sorted, side='right') - 1, 0, nstep - 1)
+        self._idx = idx
+        self._frac = (z_sorted - self.grid[idx]) / self._h
+
+    @property
+    def nevals(self):
+        """Number of integrand evaluations per call."""
+        return self.grid.size
+
+    def cumulative(self, omega_m, omega_L):
+        """
+        Cumulative trapezoidal integral of 1/E(z) on the engine grid.
+
+        The density parameters may be scalars or arrays of shape (n_points, 1), in which case
+        the integrand is evaluated for all points at once on an (n_points, n_grid) array.
+
+        Args:
+            omega_m (float or ndarray): Matter density parameter(s).
+            omega_L (float or ndarray): Dark energy density parameter(s).
+
+        Returns:
+            ndarray: Integral from 0 to each grid node, shape (..., n_grid).
+        """
+        f = inverse_E(self.grid, omega_m, omega_L)
+        cum = np.empty_like(f)
+        cum[..., 0] = 0.
+        np.cumsum(0.5 * self._h * (f[..., 1:] + f[..., :-1]), axis=-1, out=cum[..., 1:])
+        return cum
+
+    def comoving_distance(self, omega_m, omega_L):
+        """
+        Dimensionless comoving distance (the integral of 1/E from 0 to z) for every supernova.
+
+        Args:
+            omega_m (float or ndarray): Matter density parameter(s); see cumulative().
+            omega_L (float or ndarray): Dark energy density parameter(s).
+
+        Returns:
+            ndarray: One value per supernova, in the order the redshifts were given,
+                shape (..., n_supernovae).
+        """
+        cum = self.cumulative(omega_m, omega_L)
+        lo = cum[..., self._idx]
+        hi = cum[..., self._idx + 1]
+        sorted_result = lo + self._frac * (hi - lo)   # Linear read-off inside the last grid cell.
+        return sorted_result[..., self._inverse]
+
+
+class GaussLegendreEngine(object):
+    """
+    Composite fixed-order Gauss-Legendre evaluator of the dimensionless comoving distance.
+
+    [0, max(z)] is split into panels of at most `panel` in redshift, with `order` Gauss-Legendre nodes
+    on each. Full panels are summed with the Gauss weights; the partial panel up to each supernova is
+    integrated exactly for the polynomial through that panel's nodes, using weights precomputed here.
+    A smooth integrand such as 1/E(z) then needs far fewer evaluations than the trapezoidal rule.
+    """
+    def __init__(self, z, order=8, panel=0.5):
+        """
+        Initializes the engine.
+
+        Args:
+            z (array_like): Redshifts of the supernovae.
+            order (int): Number of Gauss-Legendre nodes per panel.
+            panel (float): Maximum panel width in redshift.
+        """
+        self.z = np.asarray(z, dtype=float)
+        self.order = order
+        zmax = self.z.max() if self.z.size else 0.
+        npanel = max(int(np.ceil(zmax / panel)), 1)
+        edges = np.linspace(0., zmax, npanel + 1)
+        half = 0.5 * (edges[1:] - edges[:-1])
+        mid = 0.5 * (edges[1:] + edges[:-1])
+
+        x, w = np.polynomial.legendre.leggauss(order)
+        self.nodes = (mid[:, np.newaxis] + half[:, np.newaxis] * x).ravel()  # All nodes, panel by panel.
+        self._shape = (npanel, order)
+        self._weights = half[:, np.newaxis] * w                               # Full-panel weights.
+
+        # Partial-panel weights: the integral from the panel start to z of the Lagrange basis on the
+        # nodes, via the Legendre expansion of that basis (exact thanks to Gauss-Legendre orthogonality).
+        self._panel = np.clip(np.searchsorted(edges, self.z, side='right') - 1, 0, npanel - 1)
+        t = np.clip((self.z - mid[self._panel]) / half[self._panel], -1., 1.)
+        degree = np.arange(order)
+        to_legendre = (np.polynomial.legendre.legvander(x, order - 1) * w[:, np.newaxis]).T \
+            * (degree[:, np.newaxis] + 0.5)                                  # Node values -> coefficients.
+        antiderivative = np.polynomial.legendre.legint(np.eye(order), lbnd=-1)
+        integrals = np.polynomial.legendre.legval(t, antiderivative).T      # (n_supernovae, order)
+        partial = half[self._panel][:, np.newaxis] * integrals.dot(to_legendre)
+        # Grouped by panel: (supernova indices, their partial weights transposed to (order, n_in_panel)).
+        self._groups = [(i, partial[i].T) for i in (np.flatnonzero(self._panel == p) for p in range(npanel))]
+        self._nz = self.z.size
+
+    @property
+    def nevals(self):
+        """Number of integrand evaluations per call."""
+        return self.nodes.size
+
+    def comoving_distance(self, omega_m, omega_L):
+        """
+        Dimensionless comoving distance (the integral of 1/E from 0 to z) for every supernova.
+
+        Args:
+            omega_m (float or ndarray): Matter density parameter(s); see DistanceEngine.cumulative().
+            omega_L (float or ndarray): Dark energy density parameter(s).
+
+        Returns:
+            ndarray: Shape (..., n_supernovae), in the order the redshifts were given.
+        """
+        f = inverse_E(self.nodes, omega_m, omega_L)
+        f = f.reshape(f.shape[:-1] + self._shape)
+        full = np.sum(f * self._weights, axis=-1)          # Integral over each whole panel.
+        start = np.zeros_like(full)
+        np.cumsum(full[..., :-1], axis=-1, out=start[..., 1:])  # Integral up to the start of each panel.
+        # Panel by panel, so the only temporary as large as the result is the result itself (gathering f at
+        # every supernova's panel would take n_points x n_supernovae x order).
+        result = np.empty(full.shape[:-1] + (self._nz,))
+        for p, (i, weights) in enumerate(self._groups):
+            result[..., i] = start[..., p, np.newaxis] + f[..., p, :].dot(weights)
+        return result
+
+
+class FlatClosedFormEngine(object):
+    """
+    Closed-form comoving distance for a flat universe, omega_L = 1 - omega_m.
+
+    With x = 1 + z and E^2 = omega_m x^3 + omega_L, the integral of 1/E is
+    -2 / sqrt(omega_m) [x^(-1/2) 2F1(1/6, 1/2; 7/6; -omega_L / (omega_m x^3))] between 1 and 1 + z,
+    which is exact to machine precision; omega_m = 0 gives the integral z. Needs scipy.
+    """
+    def __init__(self, z):
+        """
+        Initializes the engine.
+
+        Args:
+            z (array_like): Redshifts of the supernovae.
+        """
+        from scipy.special import hyp2f1 # Optional dependency, only needed by this backend.
+        self._hyp2f1 = hyp2f1
+        self.z = np.asarray(z, dtype=float)
+        self._x = 1 + self.z
+
+    @property
+    def nevals(self):
+        """Number of hypergeometric function evaluations per call."""
+        return self.z.size + 1
+
+    def comoving_distance(self, omega_m, omega_L):
+        """
+        Dimensionless comoving distance for every supernova.
+
+        Args:
+            omega_m (float or ndarray): Matter density parameter(s); see DistanceEngine.cumulative().
+            omega_L (float or ndarray): Dark energy density parameter(s); must equal 1 - omega_m.
+
+        Returns:
+            ndarray: Shape (..., n_supernovae), in the order the redshifts were given.
+        """
+        omega_m = np.asarray(omega_m, dtype=float)
+        omega_L = np.asarray(omega_L, dtype=float)
+        if not np.allclose(omega_m + omega_L, 1.):
+            raise ValueError("FlatClosedFormEngine requires omega_L = 1 - omega_m")
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = -omega_L / omega_m
+            antiderivative = lambda x: x ** (-0.5) * self._hyp2f1(1 / 6, 0.5, 7 / 6, ratio / x ** 3)
+            result = -2 / np.sqrt(omega_m) * (antiderivative(self._x) - antiderivative(1.))
+        return np.where(omega_m == 0, self.z, result)
+
+
+def _calibrate(build, tol, levels):
+    """
+    Builds engines of increasing resolution until two successive ones agree to within tol at PROBES.
+
+    Args:
+        build (callable): Maps a resolution level to an engine.
+        tol (float): Absolute tolerance on the dimensionless comoving distance.
+        levels (iterable): Resolution levels to try, coarsest first.
+
+    Returns:
+        object: The first engine whose coarser neighbour was already within tol of it.
+    """
+    omega_m = np.array([p[0] for p in PROBES])[:, np.newaxis]
+    omega_L = np.array([p[1] for p in PROBES])[:, np.newaxis]
+    previous = None
+    for level in levels:
+        engine = build(level)
+        current = engine.comoving_distance(omega_m, omega_L)
+        if previous is not None and np.nanmax(np.abs(current - previous)) < tol:
+            return engine
+        previous = current
+    raise ValueError("Integration backend did not reach tolerance {0}".format(tol))
+
+
+def make_engine(z, method='trapezoid', tol=None, **options):
+    """
+    Builds a distance engine for the redshifts z.
+
+    Args:
+        z (array_like): Redshifts of the supernovae.
+        method (str): 'trapezoid' (DistanceEngine), 'gauss' (GaussLegendreEngine) or
+            'flat' (FlatClosedFormEngine, exact, only valid for omega_L = 1 - omega_m).
+        tol (float): Absolute tolerance on the dimensionless comoving distance. When given, the grid
+            spacing (trapezoid) or the number of nodes per panel (gauss) is refined until it is met;
+            when None, the options (dz, or order and panel) are used as they are.
+        **options: Passed on to the engine's constructor.
+
+    Returns:
+        object: The engine.
+    """
+    if method == 'trapezoid':
+        if tol is None:
+            return DistanceEngine(z, **options)
+        return _calibrate(lambda level: DistanceEngine(z, dz=0.1 / 2 ** level), tol, range(16))
+    if method == 'gauss':
+        if tol is None:
+            return GaussLegendreEngine(z, **options)
+        panel = options.get('panel', 0.5)
+        return _calibrate(lambda order: GaussLegendreEngine(z, order=order, panel=panel), tol, range(2, 65, 2))
+    if method == 'flat':
+        return FlatClosedFormEngine(z)     # Exact: any tolerance is met.
+    raise ValueError("Unknown integration method '{0}'".format(method))
+
+
+SERIES_LIMIT = 1e-3 # Below this |omega_k| * D^2 the sinn kernel uses its Taylor series.
+
+
+def sinn(integral, omega_k):
+    """
+    Curvature kernel: dimensionless transverse comoving distance from the line-of-sight integral.
+
+    Returns sinh(sqrt(omega_k) D) / sqrt(omega_k) for an open universe (omega_k > 0),
+    sin(sqrt(-omega_k) D) / sqrt(-omega_k) for a closed one (omega_k < 0) and D itself for a flat one,
+    choosing the branch element by element. Close to omega_k = 0 the Taylor series
+    D (1 + x/6 + x^2/120 + x^3/5040), x = omega_k D^2, is used, so the result is smooth through k = 0.
+
+    Args:
+        integral (ndarray): Line-of-sight comoving distance D (the integral of 1/E).
+        omega_k (float or ndarray): Curvature density 1 - omega_m - omega_L, broadcastable to integral.
+
+    Returns:
+        ndarray: The transverse comoving distance, same shape as the broadcast inputs.
+    """
+    integral, omega_k = np.broadcast_arrays(np.asarray(integral, dtype=float), np.asarray(omega_k, dtype=float))
+    x = omega_k * integral ** 2
+    root = np.sqrt(np.abs(omega_k))
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        curved = np.where(omega_k > 0, np.sinh(root * integral), np.sin(root * integral)) / root
+    series = integral * (1 + x / 6 * (1 + x / 20 * (1 + x / 42)))
+    return np.where(np.abs(x) < SERIES_LIMIT, series, curved)
+
+
+def curvature_class(omega_m, omega_L, flat_tol=0.):
+    """
+    Labels cosmologies as open (+1), flat (0) or closed (-1) from the sign of 1 - omega_m - omega_L.
+
+    Args:
+        omega_m (array_like): Matter density parameter(s).
+        omega_L (array_like): Dark energy density parameter(s).
+        flat_tol (float): |1 - omega_m - omega_L| up to which a cosmology counts as flat.
+
+    Returns:
+        ndarray: Integer labels with the broadcast shape of the inputs.
+    """
+    omega_k = 1 - np.asarray(omega_m, dtype=float) - np.asarray(omega_L, dtype=float)
+    return np.where(omega_k > flat_tol, 1, np.where(omega_k < -flat_tol, -1, 0))
+
+
+def as_column(value):
+    """
+    Prepares a parameter value for broadcasting against the supernova axis.
+
+    Scalars become shape (1,), which broadcasts to a plain (n_supernovae,) result, and arrays of
+    n_points values become shape (n_points, 1), which gives an (n_points, n_supernovae) result.
+
+    Args:
+        value (float or array_like): Parameter value(s).
+
+    Returns:
+        ndarray: value with a trailing length-1 axis.
+    """
+    return np.asarray(value, dtype=float)[..., np.newaxis]
+
+
+_ENGINE_CACHE = {} # Engines keyed on (id of the redshift array, backend); each holds a reference to the array.
+_REGISTERED = {} # Engines registered for a redshift array (keyed on its id), used whatever the backend.
+
+
+def get_engine(z, method='trapezoid', tol=None, **options):
+    """
+    Returns the distance engine for the redshift array z, reusing the one built on a previous call.
+
+    The CosmologyModel functions are always called with the same module-level redshift array, so the
+    engine is looked up by object identity; passing a different array builds (and caches) a new engine.
+    An engine registered for z with register_engine() takes precedence over the requested backend.
+
+    Args:
+        z (array_like): Redshifts of the supernovae.
+        method (str): Integration backend; see make_engine().
+        tol (float): Absolute tolerance on the dimensionless comoving distance; see make_engine().
+        **options: Passed on to make_engine().
+
+    Returns:
+        object: Engine for these redshifts.
+    """
+    engine = _REGISTERED.get(id(z))
+    if engine is not None and engine._source is z:
+        return engine
+    key = (id(z), method, tol, tuple(sorted(options.items())))
+    engine = _ENGINE_CACHE.get(key)
+    if engine is None or engine._source is not z:
+        if len(_ENGINE_CACHE) > 8:
+            _ENGINE_CACHE.clear()   # Keep the cache bounded if callers pass many temporary arrays.
+        engine = make_engine(z, method, tol, **options)
+        engine._source = z          # Keep the original object alive so its id cannot be reused.
+        _ENGINE_CACHE[key] = engine
+    return engine
+
+
+def register_engine(z, engine):
+    """
+    Makes get_engine(z) return a given engine, e.g. an ObsCosEmulator.DistanceEmulator.
+
+    Any object with a comoving_distance(omega_m, omega_L) method can be registered.
+
+    Args:
+        z (array_like): The redshift array the CosmologyModel functions are called with.
+        engine (object): Engine to use for that array.
+    """
+    engine._source = z
+    _REGISTERED[id(z)] = engine
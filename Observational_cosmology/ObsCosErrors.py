@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Observational cosmology - supernova error model
+
+{Covariance of the distance moduli, factorised once for the likelihood}
+The original likelihood uses one scalar sigma = mean(sigmam) for every supernova. ErrorModel also
+supports per-supernova errors, with the redshift error sigmaz propagated into distance modulus
+through dmu/dz at a fiducial cosmology,
+
+    sigma_i^2 = sigmam_i^2 + (dmu/dz(z_i) * sigmaz_i)^2,
+
+optionally plus a full covariance matrix (e.g. systematics) read from a file. The Cholesky factor
+of the total covariance and its log-determinant are computed once when the model is built; every
+likelihood evaluation then whitens the residuals with one triangular solve (a plain division when
+the covariance is diagonal) and the chi-square is the sum of their squares.
+"""
+from __future__ import print_function, division
+
+import numpy as np # Import numpy for numerical computations and array handling.
+from scipy.linalg import cholesky, solve_triangular
+
+from ObsCosEngine import get_engine, inverse_E, sinn
+
+
+MODES = ('scalar', 'diagonal')     # Base error models; a covariance matrix can be added to either.
+FIDUCIAL = (0.3, 0.7)              # (omega_m, omega_L) at which dmu/dz is evaluated.
+
+
+def dmu_dz(z, omega_m=FIDUCIAL[0], omega_L=FIDUCIAL[1]):
+    """
+    Derivative of the distance modulus with respect to redshift.
+
+    mu = 5 log10(c (1 + z) D_M(z)) + const, with D_M the transverse comoving distance, so
+    dmu/dz = 5 / ln(10) * (1 / (1 + z) + D_M'(z) / D_M(z)) and D_M' = cosn(sqrt|omega_k| D) / E(z).
+
+    Args:
+        z (array_like): Redshifts of the supernovae.
+        omega_m (float): Matter density of the fiducial cosmology.
+        omega_L (float): Dark energy density of the fiducial cosmology.
+
+    Returns:
+        ndarray: dmu/dz at every redshift (inf at z = 0).
+    """
+    z = np.asarray(z, dtype=float)
+    omega_k = 1 - omega_m - omega_L
+    D = get_engine(z, 'gauss', 1e-8).comoving_distance(omega_m, omega_L)
+    x = np.sqrt(abs(omega_k)) * D
+    cosn = np.cosh(x) if omega_k > 0 else np.cos(x) if omega_k < 0 else 1.
+    with np.errstate(divide='ignore'):
+        return 5 / np.log(10) * (1 / (1 + z) + cosn * inverse_E(z, omega_m, omega_L) / sinn(D, omega_k))
+
+
+def load_covariance(covariance):
+    """
+    Reads a covariance matrix given as an array or a file name (.npy, or whitespace-separated text).
+
+    Args:
+        covariance (array_like or str): The matrix or the file holding it.
+
+    Returns:
+        ndarray: The (n, n) matrix.
+    """
+    if isinstance(covariance, str):
+        covariance = np.load(covariance) if covariance.endswith('.npy') else np.loadtxt(covariance)
+    return np.asarray(covariance, dtype=float)
+
+
+class ErrorModel(object):
+    """
+    Covariance of the distance moduli, stored as its Cholesky factor.
+    """
+    def __init__(self, sigma, covariance=None):
+        """
+        Factorises the covariance.
+
+        Args:
+            sigma (float or array_like): Scalar error shared by all supernovae, or one error per supernova.
+            covariance (array_like or str): Optional (n, n) covariance matrix, or a file holding it,
+                added to the diagonal sigma^2.
+        """
+        sigma = np.asarray(sigma, dtype=float)
+        if covariance is None:
+            self.kind = 'scalar' if sigma.ndim == 0 else 'diagonal'
+            self._factor = float(sigma) if sigma.ndim == 0 else sigma  # Cholesky factor of a diagonal matrix.
+            self.ndata = None if sigma.ndim == 0 else len(sigma)
+        else:
+            covariance = load_covariance(covariance)
+            self.kind = 'full'
+            self.ndata = len(covariance)
+            total = covariance + np.diag(np.broadcast_to(sigma ** 2, (self.ndata,)))
+            self._factor = cholesky(total, lower=True)      # Once, at model build: O(n^3).
+        self._diag = self._factor if self.kind != 'full' else np.diag(self._factor)
+
+
+    @classmethod
+    def from_catalog(cls, catalog, mode='scalar', covariance=None, fiducial=FIDUCIAL):
+        """
+        Error model of a supernova catalog.
+
+        Args:
+            catalog (ObsCosCatalog.Catalog): Catalog with sigmam and, for mode 'diagonal', z and sigmaz.
+            mode (str): 'scalar' (mean sigmam, as in the original scripts) or 'diagonal' (per-supernova
+                sigmam with sigmaz propagated through dmu/dz).
+            covariance (array_like or str): Optional covariance matrix added to the diagonal errors.
+            fiducial (tuple): (omega_m, omega_L) at which dmu/dz is evaluated.
+
+        Returns:
+            ErrorModel: The error model.
+        """
+        if mode == 'scalar':
+            sigma = catalog.sigma
+        elif mode == 'diagonal':
+            sigma = np.hypot(catalog.sigmam, dmu_dz(catalog.z, *fiducial) * catalog.sigmaz)
+        else:
+            raise ValueError("Unknown error model '{0}' (expected one of {1})".format(mode, MODES))
+        return cls(sigma, covariance)
+
+
+    def logdet(self, ndata):
+        """
+        Log-determinant of the covariance.
+
+        Args:
+            ndata (int): Number of supernovae (needed for the scalar model).
+
+        Returns:
+            float: log det C.
+        """
+        return 2 * float(np.sum(np.log(np.broadcast_to(self._diag, (ndata,)))))
+
+
+    def std(self, ndata):
+        """
+        Marginal standard deviation of each distance modulus, sqrt(C_ii).
+
+        Args:
+            ndata (int): Number of supernovae (needed for the scalar model).
+
+        Returns:
+            ndarray: Shape (ndata,).
+        """
+        if self.kind != 'full':
+            return np.broadcast_to(self._factor, (ndata,)).copy()
+        return np.sqrt(np.sum(self._factor ** 2, axis=1))     # C = L L^T, so C_ii is the squared row norm.
+
+
+    def whiten(self, residual):
+        """
+        Whitened residuals L^-1 r, whose squares sum to the chi-square r^T C^-1 r.
+
+        Args:
+            residual (ndarray): Residuals of shape (..., n_supernovae).
+
+        Returns:
+            ndarray: Array of the same shape.
+        """
+        if self.kind != 'full':
+            return residual / self._factor
+        flat = residual.reshape(-1, residual.shape[-1])
+        return solve_triangular(self._factor, flat.T, lower=True, check_finite=False).T.reshape(residual.shape)
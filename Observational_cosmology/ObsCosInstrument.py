@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Observational cosmology - likelihood instrumentation
+
+{Call counts and latency histograms for the likelihood hot path}
+Opt-in timing of ParamEstim: once ParamEstim.instrument(folder) has been called, every call of
+log_likelihood, log_likelihood_batch, of the model function (CosmologyModel) and of the chi-square
+step is counted and timed into log-spaced latency histograms.
+
+CPNest evaluates the likelihood in its sampler processes, each holding its own copy of the model.
+Each process therefore keeps its own counters (behind a lock, for CPNest's threads) and writes them to
+likelihood_stats/likelihood_stats_<run>_<pid>.json in the output folder: every DUMP_INTERVAL seconds and
+when the process exits. merge() adds up the files of the current run (files left in the folder by earlier
+runs carry another run id) into likelihood_stats.json next to cpnest.log.
+"""
+from __future__ import print_function, division
+
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from multiprocessing import util
+
+import numpy as np # Import numpy for numerical computations and array handling.
+
+
+STATS_FOLDER = 'likelihood_stats'       # Per-process files, inside the CPNest output folder.
+STATS_FILE = 'likelihood_stats.json'    # Merged summary, next to cpnest.log.
+DUMP_INTERVAL = 30.                     # Seconds between periodic per-process dumps.
+# Latency histogram bin edges in seconds: 10 bins per decade from 100 ns to 100 s.
+EDGES = 10 ** np.arange(-7, 2.001, 0.1)
+
+
+class LikelihoodStats(object):
+    """
+    Thread-safe call counters and latency histograms for one process.
+    """
+    def __init__(self, folder, dump_interval=DUMP_INTERVAL, run=None):
+        """
+        Initializes the counters.
+
+        Args:
+            folder (str): CPNest output folder the statistics are written to.
+            dump_interval (float): Seconds between periodic dumps of this process' counters.
+            run (str): Id of the run, shared by the sampler processes (default: start time and pid).
+        """
+        self.folder = folder
+        self.run = run or '{0}-{1}'.format(time.strftime('%Y%m%dT%H%M%S'), os.getpid())
+        self.dump_interval = dump_interval
+        self._lock = threading.Lock()
+        self._start()
+
+
+    def _start(self):
+        """Starts counting from zero in the current process, and dumps the counters when it exits."""
+        self._pid = os.getpid()
+        self._created = time.time()
+        self._last_dump = self._created
+        self._stages = {}
+        # multiprocessing runs Finalize callbacks when a child process exits (where atexit does not).
+        util.Finalize(self, LikelihoodStats.dump, args=(self,), exitpriority=10)
+
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']                  # Locks cannot be pickled (CPNest resume files).
+        return state
+
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+
+    def record(self, stage, seconds, npoints=1):
+        """
+        Adds one timed call to the counters of a stage.
+
+        Args:
+            stage (str): Name of the timed step (e.g. 'model').
+            seconds (float): Duration of the call.
+            npoints (int): Number of parameter points evaluated in the call.
+        """
+        dump = False
+        with self._lock:
+            if os.getpid() != self._pid:    # First call in a forked CPNest process: drop the parent's counts.
+                self._start()
+            stage = self._stages.setdefault(stage, {'calls': 0, 'points': 0, 'total': 0., 'min': np.inf,
+                                                    'max': 0., 'counts': np.zeros(len(EDGES) + 1, dtype=int),
+                                                    'times': np.zeros(len(EDGES) + 1)})
+            i = np.searchsorted(EDGES, seconds)
+            stage['calls'] += 1
+            stage['points'] += npoints
+            stage['total'] += seconds
+            stage['min'] = min(stage['min'], seconds)
+            stage['max'] = max(stage['max'], seconds)
+            stage['counts'][i] += 1
+            stage['times'][i] += seconds
+            now = time.time()
+            if now - self._last_dump > self.dump_interval:
+                self._last_dump = now
+                dump = True
+        if dump:
+            self.dump()
+
+
+    @contextmanager
+    def timer(self, stage, npoints=1):
+        """
+        Context manager timing the enclosed block as one call of a stage.
+
+        Args:
+            stage (str): Name of the timed step.
+            npoints (int): Number of parameter points evaluated in the block.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start, npoints)
+
+
+    def to_dict(self):
+        """
+        Counters of this process as plain JSON-serialisable values.
+
+        Returns:
+            dict: pid, wall time since counting started, and per-stage calls, points, total seconds,
+                min/max seconds, histogram counts and the time spent in each histogram bin.
+        """
+        with self._lock:
+            stages = {name: {'calls': s['calls'], 'points': s['points'], 'total': s['total'],
+                             'min': s['min'], 'max': s['max'], 'counts': s['counts'].tolist(),
+                             'times': s['times'].tolist()}
+                      for name, s in self._stages.items()}
+        return {'run': self.run, 'pid': self._pid, 'wall_time': time.time() - self._created, 'stages': stages}
+
+
+    def dump(self):
+        """Writes this process' counters to likelihood_stats/likelihood_stats_<run>_<pid>.json (atomically)."""
+        if os.getpid() != self._pid or not self._stages:
+            return
+        folder = os.path.join(self.folder, STATS_FOLDER)
+        if not os.path.exists(folder):
+            os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, 'likelihood_stats_{0}_{1}.json'.format(self.run, self._pid))
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.to_dict(), f)
+        os.replace(path + '.tmp', path)
+
+
+def summarise(stage):
+    """
+    Summary statistics of one stage from its counters.
+
+    Args:
+        stage (dict): Counters as in LikelihoodStats.to_dict()['stages'][name].
+
+    Returns:
+        dict: The counters plus mean per call and per point, and p50/p90/p99 latencies (upper bin edges).
+    """
+    counts = np.asarray(stage['counts'])
+    cumulative = np.cumsum(counts) / max(counts.sum(), 1)
+    upper = np.append(EDGES, np.inf)
+    summary = dict(stage)
+    summary['mean'] = stage['total'] / max(stage['calls'], 1)
+    summary['mean_per_point'] = stage['total'] / max(stage['points'], 1)
+    for q in (50, 90, 99):
+        summary['p{0}'.format(q)] = float(upper[min(np.searchsorted(cumulative, q / 100.), len(upper) - 1)])
+    return summary
+
+
+def merge(folder, run):
+    """
+    Adds up the per-process files of a run and writes likelihood_stats.json in the output folder.
+
+    Args:
+        folder (str): CPNest output folder.
+        run (str): Id of the run (LikelihoodStats.run); files of other runs are ignored.
+
+    Returns:
+        dict: Merged per-stage summaries (see summarise), the process ids, and the time per likelihood
+            call split into model, chi-square and the remaining overhead.
+    """
+    stages, pids = {}, []
+    pattern = 'likelihood_stats_{0}_*.json'.format(glob.escape(run))
+    for path in sorted(glob.glob(os.path.join(folder, STATS_FOLDER, pattern))):
+        with open(path) as f:
+            part = json.load(f)
+        pids.append(part['pid'])
+        for name, s in part['stages'].items():
+            if name not in stages:
+                stages[name] = dict(s)
+                continue
+            merged = stages[name]
+            for key in ('calls', 'points', 'total'):
+                merged[key] += s[key]
+            merged['min'], merged['max'] = min(merged['min'], s['min']), max(merged['max'], s['max'])
+            merged['counts'] = (np.asarray(merged['counts']) + s['counts']).tolist()
+            merged['times'] = (np.asarray(merged['times']) + s['times']).tolist()
+
+    total = stages.get('log_likelihood_batch', {}).get('total', 0.)
+    model = stages.get('model', {}).get('total', 0.)
+    chisq = stages.get('chisq', {}).get('total', 0.)
+    result = {'run': run, 'pids': pids, 'edges': EDGES.tolist(),
+              'stages': {name: summarise(s) for name, s in stages.items()},
+              'split': {'model': model, 'chisq': chisq, 'overhead': total - model - chisq,
+                        'model_fraction': model / total if total else None}}
+    with open(os.path.join(folder, STATS_FILE), 'w') as f:
+        json.dump(result, f, indent=2)
+    return result
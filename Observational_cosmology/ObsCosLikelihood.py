@@ -0,0 +1,341 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Observational cosmology - shared likelihood
+
+{ParamEstim model used by the ObsCosNest_* scripts}
+The class used to be copied into each of the three scripts. It now lives here, and scores a whole
+(n_points x n_params) array of parameter values in one broadcasted model evaluation; the single-point
+log_likelihood that CPNest calls is a thin wrapper around that batch entry point.
+
+CurlyM only shifts every distance modulus by the same amount, so it can optionally be marginalised
+analytically over its uniform prior (marginalise_CurlyM=True). CPNest then samples only the density
+parameters, and restore_CurlyM() puts CurlyM samples back into the posterior file afterwards.
+
+from_catalog() builds the model from an ObsCosCatalog.Catalog, whose columns are only read (memory-mapped
+from the binary cache) when the likelihood is first evaluated, i.e. in the CPNest worker processes.
+
+The errors are described by an ObsCosErrors.ErrorModel: by default the scalar sigma of the original
+scripts, or per-supernova errors (including sigmaz propagated through dmu/dz) and an optional full
+covariance, factorised once so that each evaluation costs a single triangular solve.
+
+instrument() switches on call counting and timing of the likelihood (see ObsCosInstrument).
+"""
+from __future__ import print_function, division
+
+from contextlib import nullcontext
+
+import numpy as np # Import numpy for numerical computations and array handling.
+from scipy.special import log_ndtr, ndtri # Log of the normal CDF and its inverse, for the CurlyM marginal.
+
+# import CPNest
+from cpnest.model import Model # Import the Model class from cpnest.model.
+# User-defined models inherit from this.
+
+from ObsCosErrors import ErrorModel
+from ObsCosInstrument import LikelihoodStats, merge
+
+
+LN2PI = np.log(2. * np.pi) # Pre-calculate ln(2π) for the Gaussian likelihood.
+
+
+# set the model, & likelihood function in order to estimate parameters
+class ParamEstim(Model):
+    """
+    Defines the likelihood function and prior distribution for the parameters.
+    """
+    def __init__(self, names, bounds, data, modelfunc, sigma, z, marginalise_CurlyM=False, CurlyM_scale=None,
+                 catalog=None, errors=None, error_model='scalar', covariance=None):
+        """
+        Initializes the ParamEstim model.
+
+        Args:
+            names (list): List of parameter names.
+            bounds (list): List of parameter bounds [(lower, upper), ...].
+            data (array_like): Observed distance modulus data (meff).
+            modelfunc (callable): Function to calculate the theoretical distance modulus (CosmologyModel).
+                It must broadcast over array-valued parameters (see ObsCosEngine.as_column).
+            sigma (float or array_like): Standard deviation of the distance modulus, shared by all
+                supernovae or one per supernova.
+            z (array_like): Redshifts of the supernovae.
+            marginalise_CurlyM (bool): If True, CurlyM is removed from the sampled parameters and the
+                likelihood is integrated over its uniform prior analytically.
+            CurlyM_scale (callable): Optional function of the parameter dict returning dmu/dCurlyM
+                (the model is affine in CurlyM). If None it is found from a second model evaluation.
+            catalog (ObsCosCatalog.Catalog): Catalog to read meff, sigma and z from on first use, in place
+                of data, sigma and z (see from_catalog).
+            errors (ObsCosErrors.ErrorModel): Error model to use instead of sigma.
+            error_model (str): With a catalog: 'scalar' (mean sigmam) or 'diagonal' (per-supernova sigmam
+                and sigmaz); see ObsCosErrors.ErrorModel.from_catalog.
+            covariance (array_like or str): With a catalog: optional covariance matrix (or its file) added
+                to the errors of error_model.
+        """
+        self.bounds = bounds        # Store the bounds on the parameters being estimated.
+        self.names = names          # Store the names of the parameters.
+        self._model = modelfunc         # Store the model function (CosmologyModel).
+        self._catalog = catalog
+        self._error_model = error_model
+        self._covariance = covariance
+        self._loaded = False
+        if catalog is None:
+            self._set_data(data, sigma, z, errors)
+        self._marginalise = marginalise_CurlyM
+        self._CurlyM_scale = CurlyM_scale
+        self.full_names = list(names)   # Parameter names including CurlyM, as written to the posterior file.
+        if marginalise_CurlyM:
+            i = self.full_names.index('CurlyM')
+            self._CurlyM_bounds = bounds[i]
+            self.names = names[:i] + names[i + 1:]      # CPNest only samples the remaining parameters.
+            self.bounds = bounds[:i] + bounds[i + 1:]
+        self.stats = None               # LikelihoodStats once instrument() has been called.
+
+
+    @classmethod
+    def from_catalog(cls, names, bounds, catalog, modelfunc, **kwargs):
+        """
+        Builds the model on a lazily loaded catalog (meff as data, mean sigmam as sigma).
+
+        Args:
+            names (list): List of parameter names.
+            bounds (list): List of parameter bounds [(lower, upper), ...].
+            catalog (ObsCosCatalog.Catalog): Supernova catalog; not read until the first evaluation.
+            modelfunc (callable): Function to calculate the theoretical distance modulus (CosmologyModel).
+            **kwargs: Other ParamEstim options (marginalise_CurlyM, CurlyM_scale, error_model, covariance).
+
+        Returns:
+            ParamEstim: The model.
+        """
+        return cls(names, bounds, None, modelfunc, None, None, catalog=catalog, **kwargs)
+
+
+    def _set_data(self, data, sigma, z, errors=None):
+        """Stores the data and the constants of the Gaussian likelihood."""
+        self._data = np.asarray(data)   # Store the observed effective distance modulus data.
+        self._ndata = len(self._data)       # Store the number of data points.
+        self._z = z                     # Store the redshifts at which the model is evaluated.
+        self._errors = ErrorModel(sigma) if errors is None else errors  # Cholesky factor of the covariance.
+        self._unit = self._errors.whiten(np.ones(self._ndata))  # Whitened dmu/dCurlyM direction (for A = 1).
+        self._norm = -0.5 * self._ndata * LN2PI - 0.5 * self._errors.logdet(self._ndata)
+        # Pre-calculate the normalization constant for the Gaussian likelihood.
+        self._loaded = True
+
+
+    def _load(self):
+        """Reads the catalog (and builds its error model) the first time the data is needed."""
+        if not self._loaded:
+            errors = ErrorModel.from_catalog(self._catalog, self._error_model, self._covariance)
+            self._set_data(self._catalog.meff, None, self._catalog.z, errors)
+
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if state.get('_catalog') is not None:   # Pickle without the data; it is re-mapped on first use.
+            for key in ('_data', '_ndata', '_z', '_errors', '_unit', '_norm'):
+                state.pop(key, None)
+            state['_loaded'] = False
+        return state
+
+
+    def instrument(self, folder):
+        """
+        Switches on call counting and timing of the likelihood, written to the CPNest output folder.
+
+        Args:
+            folder (str): CPNest output folder (per-process files go to folder/likelihood_stats/).
+        """
+        self.stats = LikelihoodStats(folder)
+
+
+    def write_stats(self):
+        """
+        Merges the timing files of all processes into likelihood_stats.json (call after cpn.run()).
+
+        Returns:
+            dict: The merged statistics, or None if the model is not instrumented.
+        """
+        if self.stats is None:
+            return None
+        self.stats.dump()               # This process' counters; the samplers wrote theirs on exit.
+        return merge(self.stats.folder, self.stats.run)
+
+
+    def _timed(self, stage, npoints=1):
+        """Times the enclosed block as one call of stage when instrumented, otherwise does nothing."""
+        return nullcontext() if self.stats is None else self.stats.timer(stage, npoints)
+
+
+    def _evaluate(self, params, npoints):
+        """Evaluates the model function for a dict of parameter arrays."""
+        with self._timed('model', npoints):
+            return self._model(self._z, params=params)
+
+
+    def log_likelihood_batch(self, points):
+        """
+        Calculates the log-likelihood for many parameter vectors at once.
+
+        The model is evaluated for every point in a single (n_points x n_supernovae) computation.
+
+        Args:
+            points (array_like): Array of shape (n_points, len(names)); column i holds the values of
+                names[i], e.g. CurlyM, omega_L, omega_m for the open and closed models.
+
+        Returns:
+            ndarray: The log-likelihood of each point, shape (n_points,). Points where the model is
+                undefined (e.g. no big bang, or beyond the antipode of a closed universe) get -inf.
+        """
+        self._load()
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+        npoints = len(points)
+        with self._timed('log_likelihood_batch', npoints), np.errstate(divide='ignore', invalid='ignore'):
+            if self._marginalise:
+                logL = self._log_likelihood_marginal(points)
+            else:
+                params = {name: points[:, i] for i, name in enumerate(self.names)}
+                model = self._evaluate(params, npoints)     # (n_points, n_supernovae) distance moduli.
+                with self._timed('chisq', npoints):
+                    chisq = np.sum(self._errors.whiten(self._data - model) ** 2, axis=-1)  # Chi-squared per point.
+                    logL = self._norm - 0.5 * chisq
+        return np.where(np.isnan(logL), -np.inf, logL)
+
+
+    def _CurlyM_moments(self, points):
+        """
+        Conditional Gaussian of CurlyM given the other parameters.
+
+        With mu = A * CurlyM + g(z), the chi-squared is chisq_min + (CurlyM - M_hat)^2 / s^2 for every point.
+        In whitened form (v = L^-1 (data - g), u = L^-1 1) this is a least-squares projection of v on u.
+
+        Args:
+            points (ndarray): Array of shape (n_points, len(names)), without CurlyM.
+
+        Returns:
+            tuple: (chisq_min, M_hat, s), each of shape (n_points,).
+        """
+        self._load()
+        params = {name: points[:, i] for i, name in enumerate(self.names)}
+        params['CurlyM'] = np.zeros(len(points))
+        offset = self._evaluate(params, len(points))   # g(z): the model with CurlyM = 0.
+        if self._CurlyM_scale is not None:
+            scale = self._CurlyM_scale(params)
+        else:
+            params['CurlyM'] = np.ones(len(points))
+            scale = (self._evaluate(params, len(points)) - offset)[..., :1]
+        scale = np.abs(np.asarray(scale, dtype=float) * np.ones((len(points), 1)))[:, 0]   # |A| per point.
+
+        with self._timed('chisq', len(points)):
+            v = self._errors.whiten(self._data - offset)
+            uu = np.dot(self._unit, self._unit)
+            shift = np.dot(v, self._unit) / uu          # A * M_hat: the best-fitting offset.
+            chisq_min = np.sum((v - shift[:, np.newaxis] * self._unit) ** 2, axis=-1)
+        return chisq_min, shift / scale, 1 / (scale * np.sqrt(uu))
+
+
+    def _log_likelihood_marginal(self, points):
+        """
+        Log-likelihood integrated over the uniform prior on CurlyM.
+
+        Args:
+            points (ndarray): Array of shape (n_points, len(names)), without CurlyM.
+
+        Returns:
+            ndarray: The marginal log-likelihood of each point, shape (n_points,).
+        """
+        lower, upper = self._CurlyM_bounds
+        chisq_min, M_hat, s = self._CurlyM_moments(points)
+        a, b = (lower - M_hat) / s, (upper - M_hat) / s
+        # log(Phi(b) - Phi(a)), evaluated in the lower tail to avoid cancellation.
+        flip = a > 0
+        lo, hi = np.where(flip, -b, a), np.where(flip, -a, b)
+        log_mass = log_ndtr(hi) + np.log1p(-np.exp(log_ndtr(lo) - log_ndtr(hi)))
+        return self._norm - 0.5 * chisq_min + 0.5 * LN2PI + np.log(s) + log_mass - np.log(upper - lower)
+
+
+    def sample_CurlyM(self, points, seed=None):
+        """
+        Draws CurlyM from its conditional posterior (a Gaussian truncated to the prior bounds).
+
+        Args:
+            points (array_like): Array of shape (n_points, len(names)), without CurlyM.
+            seed (int): Seed of the random number generator.
+
+        Returns:
+            ndarray: One CurlyM sample per point.
+        """
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+        lower, upper = self._CurlyM_bounds
+        _, M_hat, s = self._CurlyM_moments(points)
+        a, b = (lower - M_hat) / s, (upper - M_hat) / s
+        flip = a > 0                                    # Sample in the lower tail, as above.
+        lo, hi = np.where(flip, -b, a), np.where(flip, -a, b)
+        u = np.random.RandomState(seed).uniform(size=len(points))
+        log_lo, log_hi = log_ndtr(lo), log_ndtr(hi)
+        log_p = log_hi + np.log(u + (1 - u) * np.exp(log_lo - log_hi))    # log(Phi(x)) of the draw.
+        x = ndtri(np.exp(log_p))
+        # Far in the tail Phi(x) underflows: solve log_ndtr(x) = log_p by Newton's method instead.
+        tail = ~np.isfinite(x)
+        if tail.any():
+            xt, target = -np.sqrt(-2 * log_p[tail]), log_p[tail]
+            for _ in range(20):
+                log_cdf = log_ndtr(xt)
+                xt -= (log_cdf - target) / np.exp(-0.5 * xt ** 2 - 0.5 * LN2PI - log_cdf)
+            x[tail] = xt
+        return M_hat + s * np.where(flip, -x, x)
+
+
+    def restore_CurlyM(self, path, seed=None):
+        """
+        Adds CurlyM samples back into a posterior file written by CPNest for a marginalised run.
+
+        The file is rewritten in place, with CurlyM in its original column, so the Cornerplot_*
+        scripts read it exactly as they read a run that sampled CurlyM directly.
+
+        Args:
+            path (str): Posterior file (e.g. Run_files_open/posterior_open.dat).
+            seed (int): Seed of the random number generator.
+
+        Returns:
+            ndarray: Structured array of the restored samples, with the columns of the rewritten file.
+        """
+        with open(path) as f:
+            columns = f.readline().lstrip('#').split()
+        samples = np.atleast_2d(np.loadtxt(path))
+        points = samples[:, [columns.index(name) for name in self.names]]
+        i = self.full_names.index('CurlyM')
+        samples = np.insert(samples, i, self.sample_CurlyM(points, seed), axis=1)
+        columns.insert(i, 'CurlyM')
+        np.savetxt(path, samples, header=' '.join(columns), newline='\n', delimiter=' ')
+        return np.rec.fromarrays(samples.T, names=columns)
+
+
+    def log_likelihood(self, livepoint):
+        """
+        Calculates the log-likelihood function.
+
+        Args:
+            livepoint (dict): Dictionary of parameter values.
+
+        Returns:
+            float: The log-likelihood value.
+        """
+        with self._timed('log_likelihood'):
+            return float(self.log_likelihood_batch([[livepoint[name] for name in self.names]])[0])
+
+
+    def prior(self, x):
+        """
+        Defines the prior distribution for the parameters (uniform prior).
+
+        Args:
+            x (array_like): Vector of values in the range [0, 1].
+
+        Returns:
+            dict: Dictionary of parameter values transformed from the
+                unit hypercube to the parameter space.
+        """
+        params = {}
+        for i, name in enumerate(self.names):
+            lower, upper = self.bounds[i]
+            params[name] = lower + (upper - lower) * x[i]
+        return params
+    # Defines a uniform prior distribution within the parameter bounds.
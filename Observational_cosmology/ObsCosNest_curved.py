@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Observational cosmology - single curvature-aware model
+
+{This code fits low and high redshifts simultaneously, and treats CurlyM as a free parameter alongside Omega_M, and Omega_L}
+Instead of one script per curvature case, this model covers the whole (omega_m, omega_L) plane in a single
+CPNest run. The curvature branch (sinh / identity / sin) is chosen element by element from the sign of
+omega_k = 1 - omega_m - omega_L by ObsCosEngine.sinn, which switches to a Taylor series close to omega_k = 0
+so that the model is smooth across the flat boundary. The open, flat and closed cases are then recovered
+from the posterior by masking on the sign of omega_k.
+"""
+#------------------------------------------------
+#           any omega_m, omega_L (Open, Flat and Closed)
+#------------------------------------------------
+from __future__ import print_function, division # Import print_function and division from __future__.
+# Ensures print behaves as a function and division results in float division.
+
+import os # Import the os module for OS-related functionality (for creating directories).
+import numpy as np # Import numpy for numerical computations and array handling.
+
+
+# import CPNest
+import cpnest # Import the cpnest module for the CPNest sampler.
+
+from ObsCosEngine import get_engine, as_column, register_engine, sinn, curvature_class # Shared distance engine and curvature kernel.
+from ObsCosEmulator import DistanceEmulator # Optional precomputed distance table.
+from ObsCosCatalog import Catalog # Lazily loaded, memory-mapped supernova catalog.
+from ObsCosLikelihood import ParamEstim # Shared likelihood model with a batched log-likelihood entry point.
+from ObsCosStream import PosteriorStream # Appends nested samples to a binary store during the run.
+from ObsCosSampler import BatchNestedSampler # Alternative backend scoring batches of points per call.
+
+
+# import data
+catalog = Catalog('supernovae_data.dat') # Supernova catalog: columns z, sigmaz, meff and sigmam of 'supernovae_data.dat'.
+# Parsed once into a binary cache (Catalog_cache/) and memory-mapped when the likelihood is first
+# evaluated, so importing this script (e.g. in a CPNest worker process) does not read the file.
+
+c = 299792.458 # Define the speed of light in km/s.
+
+
+# --- Integration backend for the luminosity distance integral ---
+# 'gauss' (composite Gauss-Legendre) or 'trapezoid' (cumulative trapezoidal rule), refined until the
+# dimensionless distance is accurate to INTEGRATION_TOL. See ObsCosQuadBench.py for error vs. cost.
+INTEGRATION_METHOD = 'gauss'
+INTEGRATION_TOL = 1e-8
+
+
+# Define the theoretical cosmology
+def CosmologyModel(z, params):
+    """
+    Calculates the theoretical distance modulus for any curvature.
+
+    Args:
+        z (array_like): Array of redshifts.
+        params (dict): Dictionary of cosmological parameters
+            {'CurlyM': ..., 'omega_m': ..., 'omega_L': ...}.
+
+    Returns:
+        ndarray: Array of theoretical distance moduli.
+    """
+    CurlyM = as_column(params['CurlyM'])       # Extract the absolute magnitude parameter.
+    omega_m = as_column(params['omega_m'])     # Extract the matter density parameter.
+    omega_L = as_column(params['omega_L'])     # Extract the dark energy density parameter.
+    omega_k = 1 - omega_m - omega_L            # Curvature density: > 0 open, 0 flat, < 0 closed.
+    integral = get_engine(z, INTEGRATION_METHOD, INTEGRATION_TOL).comoving_distance(omega_m, omega_L)
+    # Integrate 1/E(z) once up to max(z) with the backend chosen above and read off the value
+    # at every supernova redshift, then apply the curvature kernel (sinh, identity or sin).
+    return CurlyM + 5 * np.log10(c * (1 + z) * sinn(integral, omega_k))
+# Defines the theoretical cosmology model for all three curvature cases at once. Points beyond the
+# antipode of a closed universe (negative sin) or without a big bang give NaN, which ParamEstim
+# turns into a zero likelihood.
+
+
+def CurlyMScale(params):
+    """
+    Derivative of the distance modulus with respect to CurlyM: a plain additive offset here.
+    Used by ParamEstim to marginalise CurlyM analytically.
+
+    Args:
+        params (dict): Dictionary of cosmological parameters.
+
+    Returns:
+        float: dmu/dCurlyM (the same for every supernova).
+    """
+    return 1.
+
+
+def curvature_summary(posterior):
+    """
+    Splits posterior samples into open and closed universes by the sign of omega_k.
+
+    The posterior odds are divided by the prior odds (the fraction of the uniform prior box on each
+    side of omega_m + omega_L = 1) to give the Bayes factor between the two curvature classes.
+
+    Args:
+        posterior (ndarray): Structured array of posterior samples with omega_m and omega_L fields.
+
+    Returns:
+        dict: Sample masks, posterior probabilities, prior probabilities and the open/closed Bayes factor.
+    """
+    label = curvature_class(posterior['omega_m'], posterior['omega_L'])
+    prior = np.random.RandomState(0).uniform(size=(200000, 2))     # Prior odds by Monte Carlo over the box.
+    limits = dict(zip(names, bounds))
+    prior_m = limits['omega_m'][0] + (limits['omega_m'][1] - limits['omega_m'][0]) * prior[:, 0]
+    prior_L = limits['omega_L'][0] + (limits['omega_L'][1] - limits['omega_L'][0]) * prior[:, 1]
+    prior_label = curvature_class(prior_m, prior_L)
+    summary = {'open': label == 1, 'closed': label == -1}
+    for key, value in (('open', 1), ('closed', -1)):
+        summary['P_' + key] = float(np.mean(label == value))
+        summary['prior_' + key] = float(np.mean(prior_label == value))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        summary['bayes_factor_open_closed'] = float((summary['P_open'] / summary['P_closed'])
+                                                    / (summary['prior_open'] / summary['prior_closed']))
+    return summary
+
+
+# Define the names of the parameters to be estimated: CurlyM (absolute magnitude),
+# omega_L (dark energy density), and omega_m (matter density).
+names = ['CurlyM', 'omega_L', 'omega_m']
+
+# Define the bounds for each parameter: the union of the open and closed prior ranges for the densities.
+bounds = [
+    [-3.5, -2],
+    [-1, 1.5],
+    [0, 1.5]
+]
+
+
+# --- Optional distance emulator ---
+# When True, CosmologyModel reads the luminosity distance integral off a precomputed (omega_m, omega_L)
+# table covering the bounds above (cached in Emulator_cache/ and memory-mapped on later runs),
+# instead of integrating on every likelihood call. The accuracy check is printed before sampling.
+USE_EMULATOR = False
+if USE_EMULATOR:
+    emulator = DistanceEmulator.from_bounds(catalog.z, names, bounds)
+    print(f"Distance emulator {emulator.path}: {emulator.check_accuracy()}")
+    register_engine(catalog.z, emulator)
+
+
+# --- Optional analytic marginalisation of CurlyM ---
+# CurlyM is a constant offset in the distance modulus, so it can be integrated out of the likelihood
+# over its uniform prior. CPNest then samples only the density parameters, and CurlyM samples are
+# drawn back into posterior_curved.dat after the run for the corner plot.
+MARGINALISE_CURLYM = False
+
+
+# --- Error model ---
+# 'scalar': one sigma = mean(sigmam) for every supernova, as originally. 'diagonal': each supernova's own
+# sigmam, with its redshift error sigmaz propagated through dmu/dz. A covariance matrix in COVARIANCE_FILE
+# (.npy or text, e.g. systematics) is added on top when set. It is factorised once, when the model is built.
+ERROR_MODEL = 'scalar'
+COVARIANCE_FILE = None
+
+
+# Create an instance of the ParamEstim class, defining the model for CPNest.
+mod = ParamEstim.from_catalog(names, bounds, catalog, CosmologyModel,
+                              marginalise_CurlyM=MARGINALISE_CURLYM, CurlyM_scale=CurlyMScale,
+                              error_model=ERROR_MODEL, covariance=COVARIANCE_FILE)
+
+
+# --- Define the output folder for CPNest results ---
+OUTPUT_FOLDER = "Run_files_curved" # Dedicated folder for the curvature-aware model outputs
+# Create the directory if it doesn't exist
+if not os.path.exists(OUTPUT_FOLDER):
+    os.makedirs(OUTPUT_FOLDER)
+    print(f"Created output directory: {OUTPUT_FOLDER}")
+
+
+# --- Streaming posterior export ---
+# When True, the nested samples and their posterior weights are appended to nested_stream.bin in OUTPUT_FOLDER
+# every STREAM_INTERVAL seconds during the run, with a running summary in stream_summary.json, so the fit
+# can be monitored (python ObsCosStream.py Run_files_curved) before it finishes.
+STREAM_POSTERIOR = True
+STREAM_INTERVAL = 30.
+
+
+# --- Optional likelihood instrumentation ---
+# When True, every likelihood and CosmologyModel call is counted and timed in each CPNest process,
+# and the merged call counts and latency histograms are written to likelihood_stats.json in OUTPUT_FOLDER.
+INSTRUMENT_LIKELIHOOD = False
+if INSTRUMENT_LIKELIHOOD:
+    mod.instrument(OUTPUT_FOLDER)
+
+
+# --- Sampler backend ---
+# 'cpnest': CPNest, one likelihood call per point from its sampler threads. 'batch': BatchNestedSampler
+# (ObsCosSampler.py), which replaces many live points per iteration and scores every MCMC step of all of them
+# in one log_likelihood_batch call; it writes the same chain, evidence and posterior files to OUTPUT_FOLDER,
+# but does not checkpoint or stream the posterior.
+SAMPLER = 'cpnest'
+
+
+# Settings for the sampler
+cpnest_dict = {
+    'nlive': 1024,       # Number of live points for the nested sampling algorithm.
+    'nthreads': 2,       # Number of threads to use for parallel computation.
+    'verbose': 3,        # Level of verbosity of the output (0=silent, 1=progress, 2=diagnostic, 3=detailed).
+    'output': OUTPUT_FOLDER, # Directory where CPNest saves its output files.
+    'resume': "resume",  # "resume" to continue from a previous run.
+    'maxmcmc': 1024      # Maximum length of the MCMC chain used within each nested sampling iteration.
+}
+
+
+if __name__ == '__main__':
+    # Main execution block
+    if SAMPLER == 'batch':
+        cpn = BatchNestedSampler(usermodel=mod, **cpnest_dict)
+    else:
+        cpn = cpnest.CPNest(usermodel=mod, **cpnest_dict)
+    # Create an instance of the CPNest class with the model and settings.
+
+    if STREAM_POSTERIOR and SAMPLER == 'cpnest':
+        with PosteriorStream(cpn, interval=STREAM_INTERVAL):
+            cpn.run()
+    else:
+        cpn.run()
+    # Run the CPNest sampler over the full (omega_m, omega_L) plane.
+
+    posterior = cpn.get_posterior_samples(filename='posterior_curved.dat')
+    if MARGINALISE_CURLYM:
+        # Put CurlyM back into the posterior file, and use the restored samples for the subsets below.
+        posterior = mod.restore_CurlyM(os.path.join(OUTPUT_FOLDER, 'posterior_curved.dat'))
+    if INSTRUMENT_LIKELIHOOD:
+        mod.write_stats() # Merge the per-process timings into likelihood_stats.json.
+
+    # Recover the curvature classes by masking the posterior on the sign of omega_k, and save each subset
+    # next to the full posterior in the same format.
+    summary = curvature_summary(posterior)
+    header = ' '.join(posterior.dtype.names)
+    for key in ('open', 'closed'):
+        np.savetxt(os.path.join(OUTPUT_FOLDER, 'posterior_curved_{0}.dat'.format(key)),
+                   posterior[summary[key]].ravel(), header=header, newline='\n', delimiter=' ')
+        print(f"P({key} | data) = {summary['P_' + key]:.4f} (prior {summary['prior_' + key]:.4f})")
+    print(f"Bayes factor open/closed = {summary['bayes_factor_open_closed']:.4f}")
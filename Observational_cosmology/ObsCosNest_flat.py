@@ -18,39 +18,37 @@ from __future__ import print_function, division
 # Import print_function and division from the __future__ module.
 # This ensures that print behaves as a function in Python 2 and 3,
 # and that division always results in a float.
-from astropy.cosmology import WMAP9 as cosmo
-# Import the WMAP9 cosmology model from astropy.cosmology.
-# This provides cosmological parameters (like the Hubble constant)
-# from the Wilkinson Microwave Anisotropy Probe (WMAP) 9-year data.
 import numpy as np
 # Import numpy for numerical computations and array handling.
 import os # Import the os module for path manipulation and directory creation
 
 # import CPNest
-from cpnest.model import Model
-# Import the Model class from cpnest.model.
-# User-defined models (like ParamEstim) inherits from this.
 import cpnest
 # Import the cpnest module for the CPNest sampler.
 
+from ObsCosEngine import get_engine, as_column, register_engine # Shared single-pass distance engine (sorted redshifts, one cumulative integral).
+from ObsCosEmulator import DistanceEmulator # Optional precomputed distance table.
+from ObsCosCatalog import Catalog # Lazily loaded, memory-mapped supernova catalog.
+from ObsCosLikelihood import ParamEstim # Shared likelihood model with a batched log-likelihood entry point.
+from ObsCosStream import PosteriorStream # Appends nested samples to a binary store during the run.
+from ObsCosSampler import BatchNestedSampler # Alternative backend scoring batches of points per call.
+
 # import data
-data = np.loadtxt('supernovae_data.dat') # Load data from 'supernovae_data.dat' using numpy.loadtxt().
-# Assumes whitespace-separated columns: redshift, distance modulus, errors.
-cosmo.H(0)      #using astropy to extract H(0)
-# Access the Hubble constant (H0) from the WMAP9 cosmology model.
-# cosmo.H(0) evaluates the Hubble parameter at z=0, effectively returning H0.
+catalog = Catalog('supernovae_data.dat') # Supernova catalog: columns z, sigmaz, meff and sigmam of 'supernovae_data.dat'.
+# Parsed once into a binary cache (Catalog_cache/) and memory-mapped when the likelihood is first
+# evaluated, so importing this script (e.g. in a CPNest worker process) does not read the file.
+
 c = 299792.458 # Define the speed of light in km/s.
 
-# Extract needed array from data file
-z = data[:, 0]          # Extract redshift values from the first column (index 0) of 'data'.
-sigmaz = data[:, 1]
-meff = data[:, 7]       # Extract effective distance modulus from the eighth column (index 7) of 'data'.
-sigmam = data[:, 8]     # Extract distance modulus errors from the ninth column (index 8) of 'data'.
-sigma = np.mean(sigmam)     # Calculate the mean of the distance modulus errors.
-LN2PI = np.log(2. * np.pi) # Pre-calculate ln(2π) for the Gaussian likelihood.
-LNSIGMA = np.log(sigma)     # Pre-calculate ln(σ) for the Gaussian likelihood.
 
 
+# --- Integration backend for the luminosity distance integral ---
+# 'flat' evaluates the integral in closed form (exact for omega_L = 1 - omega_m); 'gauss' (composite
+# Gauss-Legendre) and 'trapezoid' are refined until the dimensionless distance is accurate to INTEGRATION_TOL.
+# See ObsCosQuadBench.py for error vs. cost.
+INTEGRATION_METHOD = 'flat'
+INTEGRATION_TOL = 1e-8
+
 
 # Define the theoretical cosmologies
 def CosmologyModel(z, params):
@@ -63,83 +61,33 @@ def CosmologyModel(z, params):
             {'CurlyM': ..., 'omega_m': ..., 'omega_L': ...}.
 
     Returns:
-        array_like: Array of theoretical distance moduli.
+        ndarray: Array of theoretical distance moduli.
     """
-    CurlyM = params['CurlyM']       # Extract the absolute magnitude parameter.
-    omega_m = params['omega_m']    # Extract the matter density parameter.
+    CurlyM = as_column(params['CurlyM'])       # Extract the absolute magnitude parameter.
+    omega_m = as_column(params['omega_m'])    # Extract the matter density parameter.
     omega_L = 1 - omega_m   # Extract the dark energy density parameter.
-    dz = 0.01    # Define the redshift spacing for the numerical integration.
-    result = []  # Initialize an empty list to store the calculated distance moduli.
-    for zi in z: # Iterate over each redshift value in the input array z.
-        z_array = np.arange(0, zi, dz)
-        # omega_L + omega_m == 1  # Removed: This is handled by the parameter bounds and likelihood
-        integrand = ((1 + z_array) ** 2 * (1 + omega_m * z_array) - (z_array) * (2 + z_array) * omega_L) ** (-0.5)
-        result.append(CurlyM + 5 * np.log10(c * (1 + zi) * np.trapz(integrand, dx=dz)))
-    return result
+    integral = get_engine(z, INTEGRATION_METHOD, INTEGRATION_TOL).comoving_distance(omega_m, omega_L)
+    # Integrate 1/E(z) once up to max(z) with the backend chosen above and read off the value
+    # at every supernova redshift; returns a NumPy array in the same order as z.
+    return CurlyM + 5 * np.log10(c * (1 + z) * integral)
 # Defines the theoretical cosmology model, calculating the distance modulus as a function of redshift
 # and cosmological parameters.  It assumes a flat cosmology (omega_m + omega_L = 1) and uses numerical
-# integration (trapezoidal rule) to compute the luminosity distance.
+# integration (see INTEGRATION_METHOD) to compute the luminosity distance.
 
 
-# Set the likelihood function
-class ParamEstim(Model):
+def CurlyMScale(params):
     """
-    Defines the likelihood function and prior distribution for the parameters.
+    Derivative of the distance modulus with respect to CurlyM, for the flat universe,
+    where CurlyM is a plain additive offset. Used by ParamEstim to marginalise CurlyM analytically.
+
+    Args:
+        params (dict): Dictionary of cosmological parameters.
+
+    Returns:
+        float or ndarray: dmu/dCurlyM (the same for every supernova).
     """
-    def __init__(self, names, bounds, data, modelfunc, sigma):
-        """
-        Initializes the ParamEstim model.
-
-        Args:
-            names (list): List of parameter names.
-            bounds (list): List of parameter bounds [(lower, upper), ...].
-            data (array_like): Observed distance modulus data (meff).
-            modelfunc (callable): Function to calculate the theoretical distance modulus (CosmologyModel).
-            sigma (float): Standard deviation of the distance modulus.
-        """
-        self._data = data           # Store the observed effective distance modulus data.
-        self.bounds = bounds        # Store the bounds on the parameters being estimated.
-        self.names = names          # Store the names of the parameters.
-        self._sigma = sigma         # Store the standard deviation of the effective distance modulus.
-        self._logsigma = np.log(sigma)  # Pre-calculate the log of sigma for use in the likelihood calculation.
-        self._ndata = len(self._data)       # Store the number of data points.
-        self._model = modelfunc         # Store the model function (CosmologyModel).
-
-
-    def log_likelihood(self, livepoint):
-        """
-        Calculates the log-likelihood function.
-
-        Args:
-            livepoint (dict): Dictionary of parameter values at a given point
-                in the parameter space.
-
-        Returns:
-            float: The log-likelihood value.
-        """
-        model = self._model(z, params=livepoint) # Calculate the theoretical distance modulus using CosmologyModel.
-        norm = -0.5 * self._ndata * LN2PI - self._ndata * np.log(sigma)  # Calculate the normalization constant for the Gaussian likelihood.
-        chisq = np.sum(((self._data - model) / (self._sigma)) ** 2)      # Calculate the chi-squared statistic.
-        return norm - 0.5 * chisq
-
-
-    def prior(self, x):
-        """
-        Defines the prior distribution for the parameters (uniform prior).
-
-        Args:
-            x (array_like): Vector of values in the range [0, 1] representing
-                the position in the unit hypercube.
-
-        Returns:
-            dict: Dictionary of parameter values transformed from the unit
-                hypercube to the parameter space.
-        """
-        params = {}
-        for i, name in enumerate(self.names):
-            lower, upper = self.bounds[i]
-            params[name] = lower + (upper - lower) * x[i]
-        return params
+    return 1.
+
 
 # Define the names of the parameters to be estimated: CurlyM (absolute magnitude),
 # omega_L (dark energy density), and omega_m (matter density).
@@ -153,8 +101,36 @@ bounds = [
 ]
 
 
+# --- Optional distance emulator ---
+# When True, CosmologyModel reads the luminosity distance integral off a precomputed (omega_m, omega_L)
+# table covering the bounds above (cached in Emulator_cache/ and memory-mapped on later runs),
+# instead of integrating on every likelihood call. The accuracy check is printed before sampling.
+USE_EMULATOR = False
+if USE_EMULATOR:
+    emulator = DistanceEmulator.from_bounds(catalog.z, names, bounds)
+    print(f"Distance emulator {emulator.path}: {emulator.check_accuracy()}")
+    register_engine(catalog.z, emulator)
+
+
+# --- Optional analytic marginalisation of CurlyM ---
+# CurlyM is a constant offset in the distance modulus, so it can be integrated out of the likelihood
+# over its uniform prior. CPNest then samples only the density parameters, and CurlyM samples are
+# drawn back into posterior_flat.dat after the run for the corner plot.
+MARGINALISE_CURLYM = False
+
+
+# --- Error model ---
+# 'scalar': one sigma = mean(sigmam) for every supernova, as originally. 'diagonal': each supernova's own
+# sigmam, with its redshift error sigmaz propagated through dmu/dz. A covariance matrix in COVARIANCE_FILE
+# (.npy or text, e.g. systematics) is added on top when set. It is factorised once, when the model is built.
+ERROR_MODEL = 'scalar'
+COVARIANCE_FILE = None
+
+
 # Create an instance of the ParamEstim class, defining the model for CPNest.
-mod = ParamEstim(names, bounds, meff, CosmologyModel, sigma)
+mod = ParamEstim.from_catalog(names, bounds, catalog, CosmologyModel,
+                              marginalise_CurlyM=MARGINALISE_CURLYM, CurlyM_scale=CurlyMScale,
+                              error_model=ERROR_MODEL, covariance=COVARIANCE_FILE)
 
 # --- Define the output folder for CPNest results ---
 OUTPUT_FOLDER = "Run_files_flat"
@@ -164,6 +140,30 @@ if not os.path.exists(OUTPUT_FOLDER):
     print(f"Created output directory: {OUTPUT_FOLDER}")
 
 
+# --- Streaming posterior export ---
+# When True, the nested samples and their posterior weights are appended to nested_stream.bin in OUTPUT_FOLDER
+# every STREAM_INTERVAL seconds during the run, with a running summary in stream_summary.json, so the fit
+# can be monitored (python ObsCosStream.py Run_files_flat) before it finishes.
+STREAM_POSTERIOR = True
+STREAM_INTERVAL = 30.
+
+
+# --- Optional likelihood instrumentation ---
+# When True, every likelihood and CosmologyModel call is counted and timed in each CPNest process,
+# and the merged call counts and latency histograms are written to likelihood_stats.json in OUTPUT_FOLDER.
+INSTRUMENT_LIKELIHOOD = False
+if INSTRUMENT_LIKELIHOOD:
+    mod.instrument(OUTPUT_FOLDER)
+
+
+# --- Sampler backend ---
+# 'cpnest': CPNest, one likelihood call per point from its sampler threads. 'batch': BatchNestedSampler
+# (ObsCosSampler.py), which replaces many live points per iteration and scores every MCMC step of all of them
+# in one log_likelihood_batch call; it writes the same chain, evidence and posterior files to OUTPUT_FOLDER,
+# but does not checkpoint or stream the posterior.
+SAMPLER = 'cpnest'
+
+
 # Settings for the sampler
 cpnest_dict = {
     'nlive': 1024,       # 'nlive': Number of live points for the nested sampling.
@@ -177,14 +177,25 @@ cpnest_dict = {
 
 if __name__ == '__main__':
     # Main execution block
-    cpn = cpnest.CPNest(usermodel=mod, **cpnest_dict)
+    if SAMPLER == 'batch':
+        cpn = BatchNestedSampler(usermodel=mod, **cpnest_dict)
+    else:
+        cpn = cpnest.CPNest(usermodel=mod, **cpnest_dict)
     # Create an instance of the CPNest class with the model and settings.
 
-    cpn.run()
+    if STREAM_POSTERIOR and SAMPLER == 'cpnest':
+        with PosteriorStream(cpn, interval=STREAM_INTERVAL):
+            cpn.run()
+    else:
+        cpn.run()
     # Run the CPNest sampler.
 
     # Save the posterior samples to 'posterior.dat' inside the specified output folder.
     # Note: cpnest.get_posterior_samples() saves to the 'output' directory specified in cpnest_dict.
     # So, just providing the filename is enough.
     cpn.get_posterior_samples(filename='posterior_flat.dat')
+    if MARGINALISE_CURLYM:
+        mod.restore_CurlyM(os.path.join(OUTPUT_FOLDER, 'posterior_flat.dat')) # Put CurlyM back into the posterior file.
+    if INSTRUMENT_LIKELIHOOD:
+        mod.write_stats() # Merge the per-process timings into likelihood_stats.json.
     # cpn.plot()  # Removed: Use external script for plotting.
\ No newline at end of file
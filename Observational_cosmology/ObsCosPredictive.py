@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Observational cosmology - posterior-predictive Hubble diagram
+
+{Distance-modulus bands and supernova residuals from every posterior sample}
+Pushes the samples of posterior_<model>.dat back through the model's CosmologyModel, evaluated for
+all samples at once (CosmologyModel broadcasts over parameter arrays, see ObsCosEngine.as_column):
+
+* on a dense redshift grid, for the median and the 68% / 95% credible bands of the distance modulus;
+* at the supernova redshifts, for each supernova's posterior mean residual (meff - mu), its spread
+  and its pull (mean residual / sigma), and for the chi-square of every sample, from which the
+  posterior-predictive p-value of the fit follows.
+
+The redshift grid is processed in blocks, and the supernovae in chunks of samples, so that no more than
+MAX_BATCH_ELEMENTS model values are held at once whatever the size of the posterior. Results go to the
+model's Run_files_<model> folder: hubble_<model>.dat (the bands), residuals_<model>.dat (one row per
+supernova) and predictive_<model>.json (chi-square and pull statistics).
+
+Usage:
+    python ObsCosPredictive.py [--models open closed flat] [--ngrid 200] [--stream] [--plot]
+"""
+from __future__ import print_function, division
+
+import argparse
+import importlib
+import json
+import os
+import time
+
+import numpy as np # Import numpy for numerical computations and array handling.
+from scipy.stats import chi2
+
+from ObsCosCorner import MODELS, load_posterior
+from ObsCosErrors import ErrorModel
+
+
+NGRID = 200                                 # Redshifts in the Hubble diagram grid.
+BANDS = [0.68, 0.95]                        # Credible bands of the distance modulus.
+MAX_BATCH_ELEMENTS = 2 * 10 ** 6            # Cap on n_samples x n_redshifts model values held at once.
+PULL_OUTLIER = 3.                           # |pull| above which a supernova is counted as an outlier.
+
+
+def load_model(model):
+    """
+    Imports a model script (without running CPNest) for its CosmologyModel, catalog and error settings.
+
+    Args:
+        model (str): Curvature model, e.g. 'open'.
+
+    Returns:
+        module: The imported ObsCosNest_<model> script.
+    """
+    return importlib.import_module('ObsCosNest_' + model)
+
+
+def column_quantiles(values, weights, q):
+    """
+    Weighted quantiles of every column of a sample array, in one sort.
+
+    Non-finite values (samples where the model is undefined) are given zero weight.
+
+    Args:
+        values (ndarray): Samples, shape (n, m).
+        weights (ndarray): Weights of the rows, shape (n,).
+        q (array_like): Quantiles in [0, 1].
+
+    Returns:
+        ndarray: Shape (len(q), m).
+    """
+    order = np.argsort(values, axis=0)                              # NaNs sort last.
+    ordered = np.take_along_axis(values, order, axis=0)
+    w = np.where(np.isfinite(ordered), weights[order], 0.)
+    cdf = np.cumsum(w, axis=0)
+    target = np.asarray(q)[:, np.newaxis] * cdf[-1]
+    # First row whose cumulative weight reaches each target, for every column at once.
+    index = np.minimum((cdf[np.newaxis] < target[:, np.newaxis]).sum(axis=1), len(values) - 1)
+    return np.take_along_axis(ordered, index, axis=0)
+
+
+def evaluate(modelfunc, z, samples, names):
+    """
+    Distance moduli of many samples at once.
+
+    Args:
+        modelfunc (callable): The model's CosmologyModel.
+        z (ndarray): Redshifts; pass the same array object on every call so its distance engine is reused.
+        samples (ndarray): Samples of shape (n, len(names)).
+        names (list): Parameter names of the columns of samples.
+
+    Returns:
+        ndarray: Shape (n, len(z)).
+    """
+    params = {name: samples[:, i] for i, name in enumerate(names)}
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.broadcast_to(modelfunc(z, params), (len(samples), len(z)))
+
+
+def hubble_bands(modelfunc, names, samples, weights, z_grid, bands=BANDS, max_elements=MAX_BATCH_ELEMENTS):
+    """
+    Posterior median and credible bands of the distance modulus on a redshift grid.
+
+    Args:
+        modelfunc (callable): The model's CosmologyModel.
+        names (list): Parameter names of the columns of samples.
+        samples (ndarray): Posterior samples, shape (n, len(names)).
+        weights (ndarray): Sample weights, shape (n,).
+        z_grid (ndarray): Redshifts of the diagram.
+        bands (list): Credible levels.
+        max_elements (int): Maximum number of model values evaluated at once.
+
+    Returns:
+        ndarray: Shape (1 + 2 * len(bands), len(z_grid)): the median, then the lower and upper edge of each band.
+    """
+    q = [0.5] + [p for level in bands for p in ((1 - level) / 2, (1 + level) / 2)]
+    width = int(np.clip(max_elements // len(samples), 1, len(z_grid)))
+    # Fixed blocks of the grid (each keeps its own distance engine for the whole run).
+    blocks = [np.ascontiguousarray(block) for block in np.array_split(z_grid, -(-len(z_grid) // width))]
+    return np.hstack([column_quantiles(evaluate(modelfunc, block, samples, names), weights, q) for block in blocks])
+
+
+def residuals(modelfunc, names, samples, weights, z, data, errors, max_elements=MAX_BATCH_ELEMENTS):
+    """
+    Posterior residuals of every supernova and the chi-square of every sample.
+
+    Args:
+        modelfunc (callable): The model's CosmologyModel.
+        names (list): Parameter names of the columns of samples.
+        samples (ndarray): Posterior samples, shape (n, len(names)).
+        weights (ndarray): Sample weights, shape (n,).
+        z (ndarray): Supernova redshifts (the catalog's own array, whose distance engine the likelihood built).
+        data (ndarray): Observed distance moduli (meff).
+        errors (ObsCosErrors.ErrorModel): Error model of the fit.
+        max_elements (int): Maximum number of model values evaluated at once.
+
+    Returns:
+        tuple: (weighted mean residual, weighted standard deviation of the residual), each of shape
+            (n_supernovae,), and the chi-square of each sample, shape (n,).
+    """
+    data = np.asarray(data)
+    chunk = max(1, max_elements // len(data))
+    total = weights.sum()
+    s1, s2 = np.zeros(len(data)), np.zeros(len(data))
+    chisq = np.empty(len(samples))
+    for start in range(0, len(samples), chunk):
+        stop = start + chunk
+        r = data - evaluate(modelfunc, z, samples[start:stop], names)
+        w = weights[start:stop] / total
+        s1 += w @ r
+        s2 += w @ r ** 2
+        chisq[start:stop] = np.sum(errors.whiten(r) ** 2, axis=-1)
+    return s1, np.sqrt(np.clip(s2 - s1 ** 2, 0, None)), chisq
+
+
+def predict(model, ngrid=NGRID, stream=False, bands=BANDS, max_elements=MAX_BATCH_ELEMENTS):
+    """
+    Posterior-predictive Hubble diagram and residuals of one model, written to its output folder.
+
+    Args:
+        model (str): Curvature model, e.g. 'open'.
+        ngrid (int): Redshifts in the diagram grid (log-spaced over the catalog's range).
+        stream (bool): Use the weighted samples of nested_stream.bin instead of the posterior file.
+        bands (list): Credible levels.
+        max_elements (int): Maximum number of model values evaluated at once.
+
+    Returns:
+        dict: 'z_grid', 'bands' (see hubble_bands), 'residual', 'residual_std', 'sigma', 'pull', 'chisq'
+            (one per sample) and 'summary' (as written to predictive_<model>.json).
+    """
+    script = load_model(model)
+    catalog = script.catalog
+    names = sorted(MODELS[model]['columns'], key=MODELS[model]['columns'].get)
+    samples, weights = load_posterior(model, stream)
+    errors = ErrorModel.from_catalog(catalog, script.ERROR_MODEL, script.COVARIANCE_FILE)
+    sigma = errors.std(len(catalog))
+
+    start = time.perf_counter()
+    z_grid = np.geomspace(catalog.z.min(), catalog.z.max(), ngrid)
+    band = hubble_bands(script.CosmologyModel, names, samples, weights, z_grid, bands, max_elements)
+    mean, spread, chisq = residuals(script.CosmologyModel, names, samples, weights, catalog.z, catalog.meff,
+                                    errors, max_elements)
+    elapsed = time.perf_counter() - start
+
+    pull = mean / sigma
+    w = weights / weights.sum()
+    finite = np.isfinite(chisq)
+    summary = {'model': model, 'samples': len(samples), 'supernovae': len(catalog), 'ngrid': ngrid,
+               'error_model': errors.kind, 'seconds': elapsed,
+               'chisq_mean': float(np.sum(w[finite] * chisq[finite]) / np.sum(w[finite])),
+               'chisq_min': float(chisq[finite].min()),
+               # Replicated data scatter as the error model, so their chi-square follows chi2(n_supernovae).
+               'p_value': float(np.sum(w[finite] * chi2.sf(chisq[finite], len(catalog))) / np.sum(w[finite])),
+               'rms_pull': float(np.sqrt(np.mean(pull ** 2))),
+               'outliers': np.flatnonzero(np.abs(pull) > PULL_OUTLIER).tolist()}
+
+    folder = os.path.dirname(MODELS[model]['path'])
+    columns = ['z', 'median'] + ['{0}_{1:g}'.format(side, 100 * level) for level in bands for side in ('lo', 'hi')]
+    np.savetxt(os.path.join(folder, 'hubble_{0}.dat'.format(model)), np.column_stack([z_grid, band.T]),
+               header=' '.join(columns))
+    np.savetxt(os.path.join(folder, 'residuals_{0}.dat'.format(model)),
+               np.column_stack([catalog.z, catalog.meff, sigma, mean, spread, pull]),
+               header='z meff sigma residual residual_std pull')
+    with open(os.path.join(folder, 'predictive_{0}.json'.format(model)), 'w') as f:
+        json.dump(summary, f, indent=2)
+    return {'z_grid': z_grid, 'bands': band, 'residual': mean, 'residual_std': spread, 'sigma': sigma,
+            'pull': pull, 'chisq': chisq, 'summary': summary}
+
+
+def plot(model, result, catalog):
+    """
+    Hubble diagram with the credible bands, above the residuals; saved as hubble_<model>.png.
+
+    Args:
+        model (str): Curvature model.
+        result (dict): Output of predict().
+        catalog (ObsCosCatalog.Catalog): The model's catalog.
+
+    Returns:
+        str: Path of the figure.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    z, band = result['z_grid'], result['bands']
+    fig, (top, bottom) = plt.subplots(2, 1, sharex=True, figsize=(6, 6), gridspec_kw={'height_ratios': [3, 1]})
+    for k in range(len(band) // 2, 0, -1):          # Widest band first.
+        top.fill_between(z, band[2 * k - 1], band[2 * k], color='C0', alpha=0.25, lw=0)
+    top.plot(z, band[0], color='C0', label='posterior median')
+    top.errorbar(catalog.z, catalog.meff, yerr=result['sigma'], fmt='.k', ms=4, elinewidth=0.8, label='supernovae')
+    top.set_ylabel(r'$m_{\rm eff}$')
+    top.legend(loc='lower right')
+    bottom.axhline(0, color='C0')
+    bottom.errorbar(catalog.z, result['residual'], yerr=result['sigma'], fmt='.k', ms=4, elinewidth=0.8)
+    bottom.set_xscale('log')
+    bottom.set_xlabel(r'$z$')
+    bottom.set_ylabel('residual')
+    path = os.path.join(os.path.dirname(MODELS[model]['path']), 'hubble_{0}.png'.format(model))
+    fig.savefig(path, bbox_inches='tight')
+    plt.close(fig)
+    return path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--models', nargs='+', default=['open', 'closed', 'flat'], choices=sorted(MODELS))
+    parser.add_argument('--ngrid', type=int, default=NGRID, help='Redshifts in the Hubble diagram grid.')
+    parser.add_argument('--stream', action='store_true', help='Use the weighted samples of nested_stream.bin.')
+    parser.add_argument('--plot', action='store_true', help='Also save hubble_<model>.png in the output folder.')
+    args = parser.parse_args()
+
+    for model in args.models:
+        if not os.path.exists(MODELS[model]['path']):
+            print(f"Skipping {model}: no {MODELS[model]['path']}")
+            continue
+        result = predict(model, args.ngrid, args.stream)
+        s = result['summary']
+        print(f"{model:<7} {s['samples']} samples in {s['seconds']:.2f} s: mean chi2 {s['chisq_mean']:.2f} "
+              f"(min {s['chisq_min']:.2f}, {s['supernovae']} supernovae), p-value {s['p_value']:.3f}, "
+              f"rms pull {s['rms_pull']:.2f}, outliers {s['outliers']}")
+        if args.plot:
+            print(f"  Hubble diagram saved to: {plot(model, result, load_model(model).catalog)}")
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Observational cosmology - quadrature benchmark
+
+{Error against integrand evaluations for the distance integration backends}
+Compares the original per-supernova np.arange/trapezoid loop, the cumulative trapezoidal rule, the
+composite Gauss-Legendre rule and (for flat cosmologies) the closed form, on the redshifts of
+supernovae_data.dat. Each row reports the number of integrand evaluations per model call, the largest
+error in the dimensionless comoving distance and in distance modulus, and the time per call.
+
+Usage:
+    python ObsCosQuadBench.py [--data supernovae_data.dat] [--repeat 200]
+"""
+from __future__ import print_function, division
+
+import argparse
+import timeit
+
+import numpy as np # Import numpy for numerical computations and array handling.
+
+from ObsCosEngine import DistanceEngine, GaussLegendreEngine, FlatClosedFormEngine, inverse_E, make_engine
+
+
+# Cosmologies (omega_m, omega_L) the errors are measured over; the flat ones also exercise the closed form.
+CURVED = [(0.3, 0.7), (0.3, 0.2), (1.0, 0.0), (0.8, 1.1), (0.05, 0.4), (1.4, 0.9)]
+FLAT = [(0.0, 1.0), (0.3, 0.7), (0.7, 0.3), (1.5, -0.5)]
+
+
+class LegacyLoop(object):
+    """The original per-supernova loop: a fresh np.arange(0, zi, dz) grid and a trapezoid per supernova."""
+    def __init__(self, z, dz=0.01):
+        self.z = np.asarray(z, dtype=float)
+        self.dz = dz
+        self.nevals = sum(np.arange(0, zi, dz).size for zi in self.z)
+
+    def comoving_distance(self, omega_m, omega_L):
+        result = []
+        for zi in self.z:
+            f = inverse_E(np.arange(0, zi, self.dz), omega_m, omega_L)
+            result.append(self.dz * (np.sum(f) - 0.5 * (f[0] + f[-1])))   # np.trapz(f, dx=dz)
+        return np.array(result)
+
+
+def candidates(z):
+    """
+    The backends and settings to benchmark.
+
+    Args:
+        z (ndarray): Redshifts of the supernovae.
+
+    Returns:
+        list: (label, engine, flat_only) tuples.
+    """
+    rows = [('legacy loop dz=0.01', LegacyLoop(z), False)]
+    rows += [('trapezoid dz={0}'.format(dz), DistanceEngine(z, dz), False) for dz in (0.05, 0.01, 0.002)]
+    rows += [('trapezoid tol={0:g}'.format(tol), make_engine(z, 'trapezoid', tol), False) for tol in (1e-6,)]
+    rows += [('gauss order={0}'.format(n), GaussLegendreEngine(z, order=n), False) for n in (2, 4, 6, 8)]
+    rows += [('gauss tol={0:g}'.format(tol), make_engine(z, 'gauss', tol), False) for tol in (1e-6, 1e-10)]
+    rows += [('flat closed form', FlatClosedFormEngine(z), True)]
+    return rows
+
+
+def benchmark(z, repeat=200):
+    """
+    Measures every candidate backend against a high-order Gauss-Legendre reference.
+
+    Args:
+        z (ndarray): Redshifts of the supernovae.
+        repeat (int): Number of timed calls per backend.
+
+    Returns:
+        list: One dict per backend with label, nevals, max_abs_error, max_mag_error and us_per_call.
+    """
+    reference = GaussLegendreEngine(z, order=48, panel=0.05)
+    results = []
+    for label, engine, flat_only in candidates(z):
+        cosmologies = FLAT if flat_only else CURVED + FLAT
+        abs_error = mag_error = 0.
+        for omega_m, omega_L in cosmologies:
+            exact = reference.comoving_distance(omega_m, omega_L)
+            approx = engine.comoving_distance(omega_m, omega_L)
+            good = exact > 0                    # A supernova at z = 0 has no distance modulus.
+            abs_error = max(abs_error, np.max(np.abs(approx - exact)))
+            mag_error = max(mag_error, np.max(np.abs(5 * np.log10(approx[good] / exact[good]))))
+        omega_m, omega_L = cosmologies[0]
+        seconds = timeit.timeit(lambda: engine.comoving_distance(omega_m, omega_L), number=repeat) / repeat
+        results.append({'label': label, 'nevals': int(engine.nevals), 'max_abs_error': float(abs_error),
+                        'max_mag_error': float(mag_error), 'us_per_call': 1e6 * seconds})
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--data', default='supernovae_data.dat', help='Supernova catalog (redshift in column 0).')
+    parser.add_argument('--repeat', type=int, default=200, help='Timed calls per backend.')
+    args = parser.parse_args()
+
+    z = np.loadtxt(args.data)[:, 0]
+    print('{0:<22} {1:>8} {2:>12} {3:>12} {4:>10}'.format('backend', 'nevals', 'max |dD|', 'max |dmu|', 'us/call'))
+    for row in benchmark(z, args.repeat):
+        print('{label:<22} {nevals:>8d} {max_abs_error:>12.3e} {max_mag_error:>12.3e} {us_per_call:>10.1f}'.format(**row))
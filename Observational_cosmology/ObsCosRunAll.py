@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Observational cosmology - multi-run driver
+
+{Runs every curvature model over several seeds and nlive settings, then compares their evidences}
+Each (model, seed, nlive) combination is one CPNest run, launched as its own Python process so that
+CPNest can start its sampler processes freely. As many runs are kept going at once as fit on the
+machine's cores (cores // nthreads per run). Every run writes into a sub-folder of its model's usual
+Run_files_* folder, e.g. Run_files_open/nlive1024_seed1234/. Runs whose evidence file already exists
+are skipped, and interrupted runs pick up from their CPNest resume files. With --sampler batch the runs
+use ObsCosSampler.BatchNestedSampler instead, which writes the same files.
+
+When all runs are done, every chain_*_evidence.txt under the Run_files_* folders (including the ones
+written by the ObsCosNest_* scripts themselves) is collected into one table of log-evidences, Bayes
+factors against a reference model and wall times, printed and saved to evidence_table.txt.
+
+Usage:
+    python ObsCosRunAll.py [--models open closed flat] [--seeds 1234 1235] [--nlive 512 1024]
+                           [--nthreads 2] [--jobs N] [--reference flat] [--force] [--sampler batch]
+"""
+from __future__ import print_function, division
+
+import argparse
+import glob
+import importlib
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np # Import numpy for numerical computations and array handling.
+
+from ObsCosStream import PosteriorStream
+
+
+HERE = os.path.dirname(os.path.abspath(__file__)) # The model scripts load supernovae_data.dat from here.
+MODELS = ['open', 'closed', 'flat', 'curved']     # ObsCosNest_<model>.py scripts the driver knows about.
+RUN_INFO = 'run_info.json'                        # Written by each run: settings and wall time.
+TABLE_FILE = 'evidence_table.txt'
+EVIDENCE_PATTERN = re.compile(r'chain_(\d+)_(\d+)\.txt_evidence\.txt$') # CPNest's chain_<nlive>_<seed> naming.
+
+
+def run_folder(model, seed, nlive):
+    """
+    Output folder of one run, inside the model's own Run_files_* folder.
+
+    Args:
+        model (str): Curvature model ('open', 'closed', 'flat' or 'curved').
+        seed (int): CPNest random seed.
+        nlive (int): Number of live points.
+
+    Returns:
+        str: Path relative to the Observational_cosmology folder.
+    """
+    return os.path.join('Run_files_' + model, 'nlive{0}_seed{1}'.format(nlive, seed))
+
+
+def evidence_file(model, seed, nlive):
+    """Evidence file CPNest writes at the end of the run (its presence marks the run as complete)."""
+    return os.path.join(run_folder(model, seed, nlive), 'chain_{0}_{1}.txt_evidence.txt'.format(nlive, seed))
+
+
+def run_model(model, seed, nlive, nthreads, maxmcmc=None, verbose=1, sampler=None):
+    """
+    Runs CPNest for one model in the current process (the body of each worker process).
+
+    The model script is imported as a module, so the likelihood, bounds and sampler settings are exactly
+    the ones the script itself would use; only the output folder, seed, nlive and nthreads are replaced.
+
+    Args:
+        model (str): Curvature model.
+        seed (int): CPNest random seed.
+        nlive (int): Number of live points.
+        nthreads (int): CPNest sampler threads for this run.
+        maxmcmc (int): Maximum MCMC chain length; the script's own value if None.
+        verbose (int): CPNest verbosity.
+        sampler (str): 'cpnest' or 'batch' (ObsCosSampler.BatchNestedSampler); the script's SAMPLER if None.
+    """
+    import cpnest # Import the cpnest module for the CPNest sampler.
+    from ObsCosSampler import BatchNestedSampler
+
+    script = importlib.import_module('ObsCosNest_' + model)
+    output = run_folder(model, seed, nlive)
+    if not os.path.exists(output):
+        os.makedirs(output)
+
+    settings = dict(script.cpnest_dict)
+    settings.update(output=output, seed=seed, nlive=nlive, nthreads=nthreads, verbose=verbose)
+    if maxmcmc is not None:
+        settings['maxmcmc'] = maxmcmc
+
+    start = time.time()
+    info_path = os.path.join(output, RUN_INFO)
+    if os.path.exists(info_path):               # Resumed run: keep the time already spent.
+        with open(info_path) as f:
+            start -= json.load(f).get('wall_time', 0.)
+
+    if script.INSTRUMENT_LIKELIHOOD:
+        script.mod.instrument(output)   # Timings go to this run's folder.
+
+    sampler = sampler or script.SAMPLER
+    if sampler == 'batch':
+        cpn = BatchNestedSampler(usermodel=script.mod, **settings)
+    else:
+        cpn = cpnest.CPNest(usermodel=script.mod, **settings)
+    if script.STREAM_POSTERIOR and sampler == 'cpnest':
+        with PosteriorStream(cpn, interval=script.STREAM_INTERVAL):
+            cpn.run()
+    else:
+        cpn.run()
+    posterior_file = 'posterior_{0}.dat'.format(model)
+    cpn.get_posterior_samples(filename=posterior_file)
+    if script.MARGINALISE_CURLYM:
+        script.mod.restore_CurlyM(os.path.join(output, posterior_file))
+    if script.INSTRUMENT_LIKELIHOOD:
+        script.mod.write_stats()
+
+    with open(info_path, 'w') as f:
+        json.dump({'model': model, 'seed': seed, 'nlive': nlive, 'nthreads': nthreads, 'sampler': sampler,
+                   'maxmcmc': settings['maxmcmc'], 'wall_time': time.time() - start}, f, indent=2)
+
+
+def launch(model, seed, nlive, nthreads, maxmcmc=None, force=False, sampler=None):
+    """
+    Starts one run as a child process and waits for it (called from the driver's thread pool).
+
+    Args:
+        model (str): Curvature model.
+        seed (int): CPNest random seed.
+        nlive (int): Number of live points.
+        nthreads (int): CPNest sampler threads for this run.
+        maxmcmc (int): Maximum MCMC chain length; the script's own value if None.
+        force (bool): Re-run even if the evidence file already exists.
+        sampler (str): Sampler backend, 'cpnest' or 'batch'; the script's SAMPLER if None.
+
+    Returns:
+        tuple: (model, seed, nlive, status) with status 'done', 'skipped' or 'failed (<code>)'.
+    """
+    if not force and os.path.exists(os.path.join(HERE, evidence_file(model, seed, nlive))):
+        return model, seed, nlive, 'skipped'
+    output = os.path.join(HERE, run_folder(model, seed, nlive))
+    if not os.path.exists(output):
+        os.makedirs(output)
+    command = [sys.executable, os.path.abspath(__file__), '--worker', model, str(seed), str(nlive),
+               '--nthreads', str(nthreads)]
+    if maxmcmc is not None:
+        command += ['--maxmcmc', str(maxmcmc)]
+    if sampler is not None:
+        command += ['--sampler', sampler]
+    with open(os.path.join(output, 'driver.log'), 'a') as log:
+        code = subprocess.call(command, cwd=HERE, stdout=log, stderr=subprocess.STDOUT)
+    return model, seed, nlive, 'done' if code == 0 else 'failed ({0})'.format(code)
+
+
+def read_evidence(path):
+    """
+    Reads a CPNest evidence file.
+
+    Args:
+        path (str): Path of a chain_<nlive>_<seed>.txt_evidence.txt file.
+
+    Returns:
+        dict: logZ, logLmax and information H.
+    """
+    logZ, logLmax, H = np.loadtxt(path, ndmin=1)[:3]
+    return {'logZ': float(logZ), 'logLmax': float(logLmax), 'H': float(H)}
+
+
+def collect(models=MODELS, root=HERE):
+    """
+    Gathers every evidence file under the models' Run_files_* folders.
+
+    Args:
+        models (list): Models to collect.
+        root (str): Folder holding the Run_files_* folders.
+
+    Returns:
+        list: One dict per run with model, nlive, seed, folder, logZ, logZ_err, logLmax, H and wall_time
+            (None when the run was not launched by this driver).
+    """
+    rows = []
+    for model in models:
+        top = os.path.join(root, 'Run_files_' + model)
+        paths = glob.glob(os.path.join(top, 'chain_*_evidence.txt'))
+        paths += glob.glob(os.path.join(top, '*', 'chain_*_evidence.txt'))
+        for path in sorted(paths):
+            match = EVIDENCE_PATTERN.search(os.path.basename(path))
+            if match is None:
+                continue
+            row = {'model': model, 'nlive': int(match.group(1)), 'seed': int(match.group(2)),
+                   'folder': os.path.relpath(os.path.dirname(path), root), 'wall_time': None}
+            row.update(read_evidence(path))
+            row['logZ_err'] = float(np.sqrt(max(row['H'], 0.) / row['nlive']))   # Nested sampling error estimate.
+            info = os.path.join(os.path.dirname(path), RUN_INFO)
+            if os.path.exists(info):
+                with open(info) as f:
+                    row['wall_time'] = json.load(f).get('wall_time')
+            rows.append(row)
+    return rows
+
+
+def compare(rows, reference='flat'):
+    """
+    Adds ln(Bayes factor) against the reference model run with the same nlive and seed.
+
+    Args:
+        rows (list): Output of collect().
+        reference (str): Model the Bayes factors are taken against.
+
+    Returns:
+        list: The rows, each with lnB and lnB_err (None when no matching reference run exists).
+    """
+    base = {(row['nlive'], row['seed'], row['folder'] == 'Run_files_' + reference): row
+            for row in rows if row['model'] == reference}
+    for row in rows:
+        # Runs of the ObsCosNest_* scripts themselves sit at the top of their folder; pair them together.
+        top = row['folder'] == 'Run_files_' + row['model']
+        ref = base.get((row['nlive'], row['seed'], top))
+        if ref is None:
+            row['lnB'] = row['lnB_err'] = None
+        else:
+            row['lnB'] = row['logZ'] - ref['logZ']
+            row['lnB_err'] = float(np.hypot(row['logZ_err'], ref['logZ_err']))
+    return rows
+
+
+def format_table(rows, reference='flat'):
+    """
+    Formats the evidence comparison as a text table, followed by per-model means over seeds.
+
+    Args:
+        rows (list): Output of compare().
+        reference (str): Model the Bayes factors are taken against.
+
+    Returns:
+        str: The table.
+    """
+    def fmt(value, spec):
+        return '-' if value is None else format(value, spec)
+
+    lines = ['{0:<8} {1:>6} {2:>6} {3:>12} {4:>9} {5:>10} {6:>8} {7:>14} {8:>10}  {9}'.format(
+        'model', 'nlive', 'seed', 'logZ', 'err', 'logLmax', 'H', 'lnB vs ' + reference, 'wall [s]', 'folder')]
+    for row in sorted(rows, key=lambda r: (r['nlive'], r['seed'], r['model'])):
+        lnB = '-' if row['lnB'] is None else '{0:.3f}+-{1:.3f}'.format(row['lnB'], row['lnB_err'])
+        lines.append('{0:<8} {1:>6d} {2:>6d} {3:>12.4f} {4:>9.4f} {5:>10.4f} {6:>8.3f} {7:>14} {8:>10}  {9}'.format(
+            row['model'], row['nlive'], row['seed'], row['logZ'], row['logZ_err'], row['logLmax'], row['H'],
+            lnB, fmt(row['wall_time'], '.1f'), row['folder']))
+
+    lines += ['', '{0:<8} {1:>6} {2:>5} {3:>12} {4:>9} {5:>14}'.format(
+        'model', 'nlive', 'runs', 'mean logZ', 'scatter', 'mean lnB')]
+    groups = sorted(set((row['model'], row['nlive']) for row in rows))
+    for model, nlive in groups:
+        group = [row for row in rows if row['model'] == model and row['nlive'] == nlive]
+        logZ = np.array([row['logZ'] for row in group])
+        lnB = [row['lnB'] for row in group if row['lnB'] is not None]
+        lines.append('{0:<8} {1:>6d} {2:>5d} {3:>12.4f} {4:>9.4f} {5:>14}'.format(
+            model, nlive, len(group), logZ.mean(), logZ.std(ddof=1) if len(group) > 1 else 0.,
+            fmt(np.mean(lnB) if lnB else None, '.3f')))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--models', nargs='+', default=['open', 'closed', 'flat'], choices=MODELS)
+    parser.add_argument('--seeds', nargs='+', type=int, default=[1234])
+    parser.add_argument('--nlive', nargs='+', type=int, default=[1024])
+    parser.add_argument('--nthreads', type=int, default=2, help='CPNest sampler threads per run.')
+    parser.add_argument('--maxmcmc', type=int, default=None, help="Override the scripts' maxmcmc.")
+    parser.add_argument('--sampler', choices=['cpnest', 'batch'], default=None,
+                        help="Sampler backend (default: each script's SAMPLER).")
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='Runs in parallel (default: cores // nthreads).')
+    parser.add_argument('--reference', default='flat', choices=MODELS, help='Model the Bayes factors are against.')
+    parser.add_argument('--force', action='store_true', help='Re-run runs that already have an evidence file.')
+    parser.add_argument('--collect-only', action='store_true', help='Only rebuild the evidence table.')
+    parser.add_argument('--worker', nargs=3, metavar=('MODEL', 'SEED', 'NLIVE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        # Child process: run a single fit and exit.
+        model, seed, nlive = args.worker
+        run_model(model, int(seed), int(nlive), args.nthreads, args.maxmcmc, sampler=args.sampler)
+        sys.exit(0)
+
+    if not args.collect_only:
+        jobs = args.jobs or max(1, (os.cpu_count() or 1) // args.nthreads)
+        runs = [(model, seed, nlive) for nlive in args.nlive for seed in args.seeds for model in args.models]
+        print(f"{len(runs)} runs, {jobs} at a time with {args.nthreads} sampler threads each")
+        start = time.time()
+        # Each run is its own Python process; the threads only wait on them.
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            futures = [pool.submit(launch, model, seed, nlive, args.nthreads, args.maxmcmc, args.force, args.sampler)
+                       for model, seed, nlive in runs]
+            for future in as_completed(futures):
+                model, seed, nlive, status = future.result()
+                print(f"[{time.time() - start:8.1f} s] {model:<7} seed={seed} nlive={nlive}: {status}")
+
+    rows = compare(collect(), args.reference)
+    table = format_table(rows, args.reference)
+    print(table)
+    with open(os.path.join(HERE, TABLE_FILE), 'w') as f:
+        f.write(table + '\n')
@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Observational cosmology - batched nested sampler
+
+{A nested sampling backend that scores whole batches of points per likelihood call}
+CPNest evaluates ParamEstim.log_likelihood one point at a time, from sampler threads that share the GIL,
+so most of each call is Python overhead around a model evaluation that would take the same time for a
+hundred points. BatchNestedSampler runs nested sampling in a single process on the same ParamEstim
+model (names, bounds, uniform prior) and calls log_likelihood_batch on arrays of points instead:
+
+* the NBATCH worst live points are replaced together each iteration; the prior volume still shrinks
+  by one live point at a time (log t = -1 / (nlive - j) for the j-th point removed), as in CPNest's
+  handling of the final live points;
+* the replacements are drawn by NBATCH constrained MCMC chains, started from random surviving live
+  points and advanced in lockstep with differential-evolution proposals (differences of two live
+  points, rescaled to keep the acceptance near TARGET_ACCEPTANCE), so each MCMC step is one batched
+  likelihood call.
+
+The run stops on CPNest's criterion (the live points can add less than exp(tolerance) to the evidence)
+and writes the same files into the output folder: chain_<nlive>_<seed>.txt, its _evidence.txt file,
+nested_samples.dat and, from get_posterior_samples(), the posterior file. ObsCosRunAll.py and the plotting
+scripts therefore read its runs as they read CPNest's. The constructor accepts the keys of the scripts'
+cpnest_dict; there is no checkpointing or posterior streaming, since a run takes seconds.
+"""
+from __future__ import print_function, division
+
+import os
+import time
+
+import numpy as np # Import numpy for numerical computations and array handling.
+from scipy.special import logsumexp
+
+from ObsCosStream import log_weights
+
+
+NBATCH = 64                 # Live points replaced per iteration (= MCMC chains advanced together).
+TARGET_ACCEPTANCE = 0.3     # Acceptance rate the differential-evolution step size is tuned to.
+MIN_ACCEPTED = 8            # Accepted moves per chain aimed for before a replacement is used.
+TOLERANCE = 0.1             # Stop when the live points can add less than this to logZ (CPNest's default).
+
+
+def log_integrate_log_trap(logL, log_vols):
+    """
+    Trapezoidal rule for the evidence integral Z = int L dX, in logs (as CPNest's final estimate).
+
+    Args:
+        logL (ndarray): Log-likelihoods, starting with -inf for the whole prior.
+        log_vols (ndarray): Log prior volumes enclosed by each contour, starting with 0.
+
+    Returns:
+        float: log Z.
+    """
+    log_mean = np.logaddexp(logL[:-1], logL[1:]) - np.log(2)
+    with np.errstate(divide='ignore'):
+        log_dx = log_vols[:-1] + np.log(-np.expm1(log_vols[1:] - log_vols[:-1]))
+    return float(logsumexp(log_mean + log_dx))
+
+
+class BatchNestedSampler(object):
+    """
+    Nested sampler for a ParamEstim model with a uniform prior, evaluating the likelihood in batches.
+    """
+    def __init__(self, usermodel, nlive=1024, output='.', seed=1234, maxmcmc=1024, nbatch=NBATCH,
+                 tolerance=TOLERANCE, verbose=1, nthreads=None, resume=None):
+        """
+        Initializes the sampler.
+
+        Args:
+            usermodel (ParamEstim): Model with names, bounds and log_likelihood_batch.
+            nlive (int): Number of live points.
+            output (str): Output folder.
+            seed (int): Seed of the random number generator (and of the output file names).
+            maxmcmc (int): Maximum number of MCMC steps per iteration.
+            nbatch (int): Live points replaced per iteration.
+            tolerance (float): Stopping threshold on the evidence still held by the live points.
+            verbose (int): 0 for silent, 1 or more for a progress line per nlive removed points.
+            nthreads (int): Ignored; accepted so that a script's cpnest_dict can be passed as is.
+            resume (str): Ignored, as nthreads.
+        """
+        self.user = usermodel
+        self.names = list(usermodel.names)
+        self.bounds = np.asarray(usermodel.bounds, dtype=float)
+        self.nlive = nlive
+        self.output = output
+        self.seed = seed
+        self.maxmcmc = maxmcmc
+        self.nbatch = int(np.clip(nbatch, 1, nlive // 2))
+        self.tolerance = tolerance
+        self.verbose = verbose
+        self.rng = np.random.RandomState(seed)
+        self.output_file = os.path.join(output, 'chain_{0}_{1}.txt'.format(nlive, seed))
+        self.evidence_file = self.output_file + '_evidence.txt'
+        self.logZ = self.info = None
+        self.likelihood_calls = 0
+        self._scale = 1.
+
+
+    def _to_physical(self, u):
+        """Maps points of the unit cube to parameter values (the uniform prior of ParamEstim.prior)."""
+        return self.bounds[:, 0] + (self.bounds[:, 1] - self.bounds[:, 0]) * u
+
+
+    def _log_likelihood(self, u):
+        """Log-likelihoods of unit-cube points, in one batched call."""
+        self.likelihood_calls += len(u)
+        return self.user.log_likelihood_batch(self._to_physical(u))
+
+
+    def _draw_prior(self, n):
+        """n prior draws with a finite likelihood, as CPNest requires of its initial live points."""
+        u, logL = np.empty((0, len(self.names))), np.empty(0)
+        while len(u) < n:
+            new = self.rng.uniform(size=(n - len(u), len(self.names)))
+            new_logL = self._log_likelihood(new)
+            keep = np.isfinite(new_logL)
+            u, logL = np.vstack([u, new[keep]]), np.concatenate([logL, new_logL[keep]])
+        return u, logL
+
+
+    def _evolve(self, start, start_logL, logLmin, live):
+        """
+        Moves a batch of points within the likelihood contour logL > logLmin by lockstep MCMC chains.
+
+        Args:
+            start (ndarray): Starting points in the unit cube, shape (n, ndim), all inside the contour.
+            start_logL (ndarray): Their log-likelihoods.
+            logLmin (float): Likelihood constraint.
+            live (ndarray): Live points inside the contour, the source of the proposal differences.
+
+        Returns:
+            tuple: (points, log-likelihoods, acceptance rate).
+        """
+        u, logL = start.copy(), start_logL.copy()
+        n, ndim = u.shape
+        accepted = np.zeros(n, dtype=int)
+        gamma = 2.38 / np.sqrt(2 * ndim)        # Optimal differential-evolution step for a Gaussian target.
+        steps = 0
+        while steps < self.maxmcmc and accepted.min() < MIN_ACCEPTED:
+            steps += 1
+            a, b = self.rng.randint(len(live), size=(2, n))
+            # Every tenth move jumps a full difference, so chains can cross between separated modes.
+            step = np.where(self.rng.uniform(size=(n, 1)) < 0.1, 1., gamma * self._scale)
+            proposal = u + step * (live[a] - live[b]) + 1e-10 * self.rng.normal(size=(n, ndim))
+            inside = np.all((proposal > 0) & (proposal < 1), axis=1)
+            new_logL = np.full(n, -np.inf)
+            if inside.any():
+                new_logL[inside] = self._log_likelihood(proposal[inside])
+            accept = new_logL > logLmin     # Uniform prior: accept any move that stays inside the contour.
+            u[accept], logL[accept] = proposal[accept], new_logL[accept]
+            accepted += accept
+        acceptance = accepted.sum() / float(n * max(steps, 1))
+        # Tune the step size towards the target acceptance for the next iteration.
+        self._scale = float(np.clip(self._scale * np.exp(acceptance - TARGET_ACCEPTANCE), 1e-3, 1.))
+        return u, logL, acceptance
+
+
+    def run(self):
+        """
+        Runs nested sampling to convergence and writes the chain and evidence files.
+
+        Returns:
+            float: log Z.
+        """
+        if not os.path.exists(self.output):
+            os.makedirs(self.output, exist_ok=True)
+        start_time = time.time()
+        u, logL = self._draw_prior(self.nlive)
+        dead_u, dead_logL = [], []
+        log_vols = [0.]                             # Prior volume enclosed by each dead point's contour.
+        condition, iteration, logZ = np.inf, 0, -np.inf
+        while condition > self.tolerance:
+            order = np.argsort(logL)
+            worst, rest = order[:self.nbatch], order[self.nbatch:]
+            # The k worst points leave one at a time, the live set shrinking from nlive to nlive - k + 1.
+            for j in range(self.nbatch):
+                log_vols.append(log_vols[-1] - 1. / (self.nlive - j))
+            dead_u.append(u[worst])
+            logL_dead = logL[worst]
+            dead_logL.append(logL_dead)
+            logLmin = logL_dead[-1]
+
+            seeds = rest[self.rng.randint(len(rest), size=self.nbatch)]
+            u[worst], logL[worst], acceptance = self._evolve(u[seeds], logL[seeds], logLmin, u[rest])
+            iteration += self.nbatch
+
+            # Running evidence (rectangle rule), updated with this batch only.
+            logZ = np.logaddexp(logZ, logsumexp(log_weights(log_vols, iteration - self.nbatch, iteration, logL_dead)))
+            condition = np.logaddexp(logZ, logL.max() + log_vols[-1]) - logZ
+            if self.verbose and iteration % self.nlive < self.nbatch:
+                print(f"{iteration:d}: logL {logLmin:.5f} logZ {logZ:.3f} dZ {condition:.3f} "
+                      f"acceptance {acceptance:.3f} logLmax {logL.max():.2f}")
+
+        # The remaining live points, in order, with the live set shrinking to one.
+        order = np.argsort(logL)
+        for j in range(self.nlive):
+            log_vols.append(log_vols[-1] - 1. / (self.nlive - j))
+        self.samples = np.vstack(dead_u + [u[order]])
+        self.logL = np.concatenate(dead_logL + [logL[order]])
+        self.log_vols = np.array(log_vols)
+
+        self.logZ = log_integrate_log_trap(np.concatenate([[-np.inf], self.logL]), self.log_vols)
+        logw = log_weights(self.log_vols, 0, len(self.logL), self.logL)
+        p = np.exp(logw - logsumexp(logw))
+        self.info = float(np.sum(p * self.logL) - self.logZ)    # Information H = int P log(L / Z).
+        self.wall_time = time.time() - start_time
+        self._write()
+        if self.verbose:
+            print(f"Final evidence: {self.logZ:.2f}, information {self.info:.2f}, {len(self.logL)} nested samples, "
+                  f"{self.likelihood_calls} likelihood evaluations in {self.wall_time:.1f} s")
+        return self.logZ
+
+
+    def _write(self):
+        """Writes the chain, evidence and nested sample files in CPNest's formats."""
+        physical = self._to_physical(self.samples)
+        np.savetxt(self.output_file, np.column_stack([physical, self.logL]), fmt='%.20e',
+                   delimiter='\t', header='\t'.join(self.names + ['logL']), comments='')
+        with open(self.evidence_file, 'w') as f:
+            f.write('#logZ\tlogLmax\tH\n')
+            f.write('{0:.5f} {1:.5f} {2:.2f}\n'.format(self.logZ, self.logL.max(), self.info))
+        np.savetxt(os.path.join(self.output, 'nested_samples.dat'),
+                   np.column_stack([physical, self.logL, np.zeros(len(self.logL))]),
+                   header=' '.join(self.names + ['logL', 'logPrior']), newline='\n', delimiter=' ')
+
+
+    def get_nested_samples(self):
+        """
+        Nested samples with their log-likelihoods and log prior volumes.
+
+        Returns:
+            ndarray: Structured array with one field per parameter plus logL, logPrior and logX.
+        """
+        dtype = [(name, float) for name in self.names + ['logL', 'logPrior', 'logX']]
+        samples = np.empty(len(self.logL), dtype=dtype)
+        for name, column in zip(self.names, self._to_physical(self.samples).T):
+            samples[name] = column
+        samples['logL'], samples['logPrior'], samples['logX'] = self.logL, 0., self.log_vols[1:]
+        return samples
+
+
+    def get_posterior_samples(self, filename='posterior.dat'):
+        """
+        Draws equally weighted posterior samples from the nested samples and writes them to the output folder.
+
+        Each nested sample is kept with probability w / max(w), as CPNest's nest2pos.draw_posterior does.
+
+        Args:
+            filename (str): File in the output folder, or None to only return the samples.
+
+        Returns:
+            ndarray: Structured array with one field per parameter plus logL and logPrior.
+        """
+        logw = log_weights(self.log_vols, 0, len(self.logL), self.logL)
+        keep = logw - logw.max() > np.log(self.rng.uniform(size=len(logw)))
+        posterior = self.get_nested_samples()[keep][self.names + ['logL', 'logPrior']]
+        posterior = np.array(posterior.tolist(), dtype=[(name, float) for name in posterior.dtype.names])
+        if filename:
+            np.savetxt(os.path.join(self.output, filename), posterior.ravel(),
+                       header=' '.join(posterior.dtype.names), newline='\n', delimiter=' ')
+        return posterior
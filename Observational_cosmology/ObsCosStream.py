@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Observational cosmology - streaming posterior export
+
+{Nested samples and weights written while CPNest is still running}
+CPNest only writes its samples when the run ends. PosteriorStream watches the nested sampler from a
+background thread of the main process and, every STREAM_INTERVAL seconds, appends the samples discarded
+since the last write to nested_stream.bin in the output folder: a flat little-endian float64 file with
+one row per sample (the parameters, logL, logPrior and the log posterior weight), described by
+nested_stream.json. Appending never rewrites earlier rows, and readers memory-map the file, so it can
+be read at any time during the run.
+
+Weighted posterior moments (mean, covariance, effective sample size) and the running evidence are
+updated incrementally from the new rows only, and written to stream_summary.json after every append.
+A resumed run continues the stream where the checkpoint left off.
+
+Usage (during or after a run):
+    python ObsCosStream.py Run_files_open [--plot provisional_open.png]
+"""
+from __future__ import print_function, division
+
+import argparse
+import json
+import os
+import threading
+
+import numpy as np # Import numpy for numerical computations and array handling.
+from scipy.special import logsumexp
+
+
+STREAM_FILE = 'nested_stream.bin'       # Appendable binary sample store, in the CPNest output folder.
+HEADER_FILE = 'nested_stream.json'      # Column names and layout of STREAM_FILE.
+SUMMARY_FILE = 'stream_summary.json'    # Incrementally updated posterior summary.
+STREAM_INTERVAL = 30.                   # Seconds between appends.
+DTYPE = np.dtype('<f8')
+
+
+def log_weights(log_vols, start, stop, logL):
+    """
+    Log posterior weights (unnormalised) of nested samples start..stop-1: logL + log(X_i - X_i+1).
+
+    Args:
+        log_vols (list): The sampler's log prior volumes; entry i + 1 is the volume after sample i.
+        start (int): Index of the first sample.
+        stop (int): One past the index of the last sample.
+        logL (ndarray): Log-likelihoods of the samples.
+
+    Returns:
+        ndarray: Log weights, shape (stop - start,).
+    """
+    outer = np.asarray(log_vols[start:stop])
+    inner = np.asarray(log_vols[start + 1:stop + 1])
+    with np.errstate(divide='ignore'):
+        return logL + outer + np.log(-np.expm1(inner - outer))
+
+
+class RunningMoments(object):
+    """
+    Weighted mean and covariance accumulated from batches of log-weighted samples.
+    """
+    def __init__(self, ndim):
+        self.ndim = ndim
+        self.count = 0
+        self.ref = -np.inf                  # All sums are stored relative to exp(ref) for stability.
+        self.s0 = self.s0sq = 0.
+        self.s1 = np.zeros(ndim)
+        self.s2 = np.zeros((ndim, ndim))
+
+
+    def update(self, x, logw):
+        """
+        Adds a batch of samples.
+
+        Args:
+            x (ndarray): Samples, shape (n, ndim).
+            logw (ndarray): Log weights, shape (n,).
+        """
+        finite = np.isfinite(logw)
+        x, logw = x[finite], logw[finite]
+        self.count += len(finite)
+        if not len(x):
+            return
+        ref = max(self.ref, logw.max())
+        if ref > self.ref and np.isfinite(self.ref):    # Rescale the old sums to the new reference.
+            shrink = np.exp(self.ref - ref)
+            self.s0, self.s0sq = self.s0 * shrink, self.s0sq * shrink ** 2
+            self.s1, self.s2 = self.s1 * shrink, self.s2 * shrink
+        self.ref = ref
+        w = np.exp(logw - ref)
+        self.s0 += w.sum()
+        self.s0sq += np.sum(w ** 2)
+        self.s1 += w @ x
+        self.s2 += (x * w[:, np.newaxis]).T @ x
+
+
+    def summary(self, names):
+        """
+        Current weighted moments.
+
+        Args:
+            names (list): Parameter names, in column order.
+
+        Returns:
+            dict: logZ (sum of the weights so far), effective sample size, and per-parameter mean and
+                standard deviation, plus the covariance matrix.
+        """
+        if not self.s0:
+            return {'samples': self.count, 'logZ': None, 'ess': 0.}
+        mean = self.s1 / self.s0
+        cov = self.s2 / self.s0 - np.outer(mean, mean)
+        std = np.sqrt(np.clip(np.diag(cov), 0, None))
+        return {'samples': self.count, 'logZ': float(self.ref + np.log(self.s0)),
+                'ess': float(self.s0 ** 2 / self.s0sq),
+                'mean': dict(zip(names, mean.tolist())), 'std': dict(zip(names, std.tolist())),
+                'covariance': cov.tolist()}
+
+
+class PosteriorStream(object):
+    """
+    Appends a running CPNest sampler's nested samples to nested_stream.bin at a fixed interval.
+
+    Used as a context manager around cpn.run(); the last samples (including the final live points)
+    are written when the block exits, also when CPNest stops at a checkpoint.
+    """
+    def __init__(self, cpn, folder=None, interval=STREAM_INTERVAL):
+        """
+        Prepares the stream, continuing an existing one if the sampler was resumed from it.
+
+        Args:
+            cpn (cpnest.CPNest): The sampler, created but not yet run.
+            folder (str): Output folder; the sampler's own by default.
+            interval (float): Seconds between appends.
+        """
+        self.cpn = cpn
+        self.folder = folder or cpn.NS.output_folder
+        self.interval = interval
+        self.names = list(cpn.user.names)
+        self.columns = self.names + ['logL', 'logPrior', 'logw']
+        self.moments = RunningMoments(len(self.names))
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        path = os.path.join(self.folder, STREAM_FILE)
+        rows = 0
+        if os.path.exists(path) and read_header(self.folder).get('columns') == self.columns:
+            rows = os.path.getsize(path) // (DTYPE.itemsize * len(self.columns))
+        # Keep only what the (possibly resumed) sampler has already produced; a fresh run starts over.
+        self.written = min(rows, len(cpn.NS.nested_samples))
+        with open(path, 'ab') as f:
+            f.truncate(self.written * DTYPE.itemsize * len(self.columns))
+        with open(os.path.join(self.folder, HEADER_FILE), 'w') as f:
+            json.dump({'columns': self.columns, 'dtype': DTYPE.str, 'nlive': cpn.NS.Nlive}, f, indent=2)
+        if self.written:
+            existing = read_stream(self.folder)
+            self.moments.update(existing[:, :len(self.names)], existing[:, -1])
+
+
+    def flush(self):
+        """
+        Appends the samples produced since the last call, and rewrites the summary.
+
+        Returns:
+            int: Number of rows appended.
+        """
+        with self._lock:
+            ns = self.cpn.NS
+            samples = ns.nested_samples[self.written:]  # Taken before log_vols: the sampler updates
+            log_vols = list(ns.state.log_vols)          # the volumes first, then appends the sample.
+            if not samples:
+                return 0
+            stop = self.written + len(samples)
+            block = np.empty((len(samples), len(self.columns)), dtype=DTYPE)
+            block[:, :len(self.names)] = [list(p.values) for p in samples]
+            block[:, -3] = [p.logL for p in samples]
+            block[:, -2] = [p.logP for p in samples]
+            block[:, -1] = log_weights(log_vols, self.written, stop, block[:, -3])
+            with open(os.path.join(self.folder, STREAM_FILE), 'ab') as f:
+                f.write(block.tobytes())
+            self.moments.update(block[:, :len(self.names)], block[:, -1])
+            self.written = stop
+            summary = self.moments.summary(self.names)
+            summary.update(iteration=int(ns.iteration), logLmax=float(ns.logLmax.value),
+                           # Evidence still in the live points, at most logLmax + log X (CPNest's stopping rule).
+                           remaining_logZ=float(ns.logLmax.value + log_vols[-1]))
+            tmp = os.path.join(self.folder, SUMMARY_FILE + '.tmp')
+            with open(tmp, 'w') as f:
+                json.dump(summary, f, indent=2)
+            os.replace(tmp, os.path.join(self.folder, SUMMARY_FILE))
+            return len(samples)
+
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._run, name='PosteriorStream', daemon=True)
+        self._thread.start()
+        return self
+
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.flush()
+        return False
+
+
+def read_header(folder):
+    """Column layout of a stream, or an empty dict if there is none."""
+    try:
+        with open(os.path.join(folder, HEADER_FILE)) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def read_stream(folder):
+    """
+    Memory-maps the rows of a stream written so far (a partly written last row is ignored).
+
+    Args:
+        folder (str): CPNest output folder.
+
+    Returns:
+        ndarray: Array of shape (n_samples, n_columns), columns as in nested_stream.json.
+    """
+    columns = read_header(folder)['columns']
+    path = os.path.join(folder, STREAM_FILE)
+    rows = os.path.getsize(path) // (DTYPE.itemsize * len(columns))
+    if not rows:
+        return np.empty((0, len(columns)), dtype=DTYPE)
+    return np.memmap(path, dtype=DTYPE, mode='r', shape=(rows, len(columns)))
+
+
+def provisional_posterior(folder):
+    """
+    Parameter samples and normalised posterior weights from a stream.
+
+    Args:
+        folder (str): CPNest output folder.
+
+    Returns:
+        tuple: (names, samples of shape (n, n_params), weights summing to 1).
+    """
+    columns = read_header(folder)['columns']
+    data = read_stream(folder)
+    logw = np.asarray(data[:, -1])
+    weights = np.exp(logw - logsumexp(logw))
+    return columns[:-3], np.asarray(data[:, :-3]), weights
+
+
+def weighted_quantiles(x, weights, q):
+    """
+    Quantiles of weighted samples.
+
+    Args:
+        x (ndarray): Samples, shape (n,).
+        weights (ndarray): Weights, shape (n,).
+        q (array_like): Quantiles in [0, 1].
+
+    Returns:
+        ndarray: The quantiles.
+    """
+    order = np.argsort(x)
+    cdf = np.cumsum(weights[order])
+    return np.interp(np.asarray(q) * cdf[-1], cdf, x[order])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('folder', help='CPNest output folder, e.g. Run_files_open.')
+    parser.add_argument('--plot', help='Save a provisional corner plot (weighted samples) to this file.')
+    args = parser.parse_args()
+
+    with open(os.path.join(args.folder, SUMMARY_FILE)) as f:
+        summary = json.load(f)
+    names, samples, weights = provisional_posterior(args.folder)
+    print(f"{len(samples)} nested samples, iteration {summary['iteration']}, ESS {summary['ess']:.1f}, "
+          f"logZ so far {summary['logZ']:.3f} (remaining <= {summary['remaining_logZ']:.3f})")
+    for i, name in enumerate(names):
+        lo, mid, hi = weighted_quantiles(samples[:, i], weights, [0.16, 0.5, 0.84])
+        print(f"  {name:<8} {mid:.4f} +{hi - mid:.4f} -{mid - lo:.4f}")
+    if args.plot:
+        import matplotlib
+        matplotlib.use('Agg')
+        import corner
+        corner.corner(samples, weights=weights, labels=names, show_titles=True).savefig(args.plot)